@@ -87,6 +87,22 @@ type isoScene = {
 
 type isoScenes = Array<isoScene | null>;
 
+type progressChange = {
+    id: number;
+    progress: string;
+};
+
+type progressChanges = {
+    scene?: progressChange;
+    encounters?: Array<progressChange>;
+    encounter?: progressChange;
+    adventure?: {
+        id: number;
+        progress: number;
+        climax_progress: number;
+    };
+};
+
 export default function AdventureDetails({ handlePageChange, deleteConfirm, setDeleteConfirm }: AdventureDetailsProps) {
     const { theme } = useTheme();
     const navigate = useNavigate();
@@ -102,7 +118,7 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
     const [notification, setNotification] = useState("");
     const { title, created_at, last_modified, game, campaign_setting, scene_set, status } = location.state || {};
     let { id } = location.state || {};
-    let { progress, climax_progress } = location.state || {};
+    const { progress, climax_progress } = location.state || {};
 
     const [exposition, setExposition] = useState(location.state.exposition);
     const [incitement, setIncitement] = useState(location.state.incitement);
@@ -391,68 +407,36 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
         }
     }
 
-    const updateAdventureProgress = async () => {
-        let adventureProgress = 0;
-        let progressDivisor = 0;
-
-        try {
-            const response = await axios.get(`/api/adventures/${id}/`);
-            if (response.status === 401) {
-                navigate('/login');
-            } else if (response.data) {
-                for (let i = 0; i < response.data.scene_set.length; i++) {
-                    const scene: isoScene = response.data.scene_set[i];
-                    progressDivisor += 100;
-                    switch (scene.progress) {
-                        case "In Progress":
-                            adventureProgress += 50;
-                            break;
-                        case "Complete":
-                            adventureProgress += 100;
-                            break;
-                        default:
-                            break;
-                    }
-                    for (let j = 0; j < scene.encounter_set.length; j++) {
-                        const encounter = scene.encounter_set[j];
-                        progressDivisor += 100;
-                        switch (encounter?.progress) {
-                            case "In Progress":
-                                adventureProgress += 50;
-                                break;
-                            case "Complete":
-                                adventureProgress += 100;
-                                break;
-                            default:
-                                break;
-                        }
-                    }
+    // Transitions return only what changed, so the changes are merged into the adventure and its scenes instead of reloading them
+    const applyProgressChanges = (changes: progressChanges) => {
+        const sceneChange = changes.scene;
+        const encounterChanges = [...(changes.encounters || []), ...(changes.encounter ? [changes.encounter] : [])];
+        if (scenes && (sceneChange || encounterChanges.length)) {
+            const updatedScenes = scenes.map(scene => {
+                if (!scene) {
+                    return scene;
                 }
-                if (response.data.climax && response.data.climax !== "") {
-                    progressDivisor += 100;
-                    adventureProgress += response.data.climax_progress;
-                }
-                const progressPercent = adventureProgress / progressDivisor * 100;
-                const updateResponse = await axios.patch(`/api/adventures/${id}/`, { progress: progressPercent }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
-                progress = updateResponse.data.progress;
-                setRerenderRequired(true);
-            }
-            else {
-                setNotification("Oops! Something went wrong. Please try again.");
-            }
-        } catch (err) {
-            console.error(err);
-            setNotification("Unable to update progress. Please try again.");
+                const encounter_set = scene.encounter_set.map(encounter => {
+                    const encounterChange = encounterChanges.find(change => change.id === encounter?.id);
+                    return encounter && encounterChange ? { ...encounter, progress: encounterChange.progress } : encounter;
+                }) as isoScene["encounter_set"];
+                return sceneChange && scene.id === sceneChange.id ? { ...scene, progress: sceneChange.progress, encounter_set } : { ...scene, encounter_set };
+            });
+            setScenes(updatedScenes);
+            setScenesComplete(updatedScenes.every(scene => scene?.progress === "Complete"));
+        }
+        if (changes.adventure && adventure) {
+            setAdventure({ ...adventure, progress: changes.adventure.progress, climax_progress: changes.adventure.climax_progress });
         }
     }
 
     const startScene = async (sceneId: number) => {
         try {
-            const response = await axios.patch(`/api/scenes/${sceneId}/`, { progress: "In Progress" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post(`/api/scenes/${sceneId}/transition/`, { progress: "In Progress" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
             if (response.status === 401) {
                 navigate('login');
             } else if (response.data) {
-                updateAdventureProgress();
+                applyProgressChanges(response.data);
             } else {
                 setNotification("Oops! Something went wrong. Please try again.");
             }
@@ -464,11 +448,11 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
 
     const completeScene = async (sceneId: number) => {
         try {
-            const response = await axios.patch(`/api/scenes/${sceneId}/`, { progress: "Complete" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post(`/api/scenes/${sceneId}/transition/`, { progress: "Complete" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
             if (response.status === 401) {
                 navigate('login');
             } else if (response.data) {
-                updateAdventureProgress();
+                applyProgressChanges(response.data);
             } else {
                 setNotification("Oops! Something went wrong. Please try again.");
             }
@@ -480,11 +464,11 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
 
     const startEncounter = async (encounterId: number) => {
         try {
-            const response = await axios.patch(`/api/encounters/${encounterId}/`, { progress: "In Progress" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post(`/api/encounters/${encounterId}/transition/`, { progress: "In Progress" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
             if (response.status === 401) {
                 navigate('login');
             } else if (response.data) {
-                updateAdventureProgress();
+                applyProgressChanges(response.data);
             } else {
                 setNotification("Oops! Something went wrong. Please try again.");
             }
@@ -496,11 +480,11 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
 
     const completeEncounter = async (encounterId: number) => {
         try {
-            const response = await axios.patch(`/api/encounters/${encounterId}/`, { progress: "Complete" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post(`/api/encounters/${encounterId}/transition/`, { progress: "Complete" }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
             if (response.status === 401) {
                 navigate('login');
             } else if (response.data) {
-                updateAdventureProgress();
+                applyProgressChanges(response.data);
             } else {
                 setNotification("Oops! Something went wrong. Please try again.");
             }
@@ -512,12 +496,11 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
 
     const startClimax = async () => {
         try {
-            const response = await axios.patch(`/api/adventures/${id}/`, { climax_progress: 50 }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post(`/api/adventures/${id}/transition/`, { climax_progress: 50 }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
             if (response.status === 401) {
                 navigate('login');
             } else if (response.data) {
-                climax_progress = response.data.climax_progress;
-                updateAdventureProgress();
+                applyProgressChanges(response.data);
             } else {
                 setNotification("Oops! Something went wrong. Please try again.");
             }
@@ -529,12 +512,11 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
 
     const completeClimax = async () => {
         try {
-            const response = await axios.patch(`/api/adventures/${id}/`, { climax_progress: 100 }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post(`/api/adventures/${id}/transition/`, { climax_progress: 100 }, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
             if (response.status === 401) {
                 navigate('login');
             } else if (response.data) {
-                climax_progress = response.data.climax_progress;
-                updateAdventureProgress();
+                applyProgressChanges(response.data);
             } else {
                 setNotification("Oops! Something went wrong. Please try again.");
             }
@@ -631,7 +613,7 @@ export default function AdventureDetails({ handlePageChange, deleteConfirm, setD
                         ))}
                     </Carousel>
                 </div>
-                <Stage key="climax" title="Climax" content={climax} edit={edit} setRef={setClimaxRef} inputText={climaxText} loading={loading} climax_progress={climax_progress} scenes_complete={scenes_complete} startClimax={startClimax} completeClimax={completeClimax} handleInputChange={handleInputChange} />
+                <Stage key="climax" title="Climax" content={climax} edit={edit} setRef={setClimaxRef} inputText={climaxText} loading={loading} climax_progress={adventure?.climax_progress ?? climax_progress} scenes_complete={scenes_complete} startClimax={startClimax} completeClimax={completeClimax} handleInputChange={handleInputChange} />
                 <Stage key="denoument" title="Epilogue" content={denoument} edit={edit} setRef={setDenoumentRef} inputText={denoumentText} loading={loading} handleInputChange={handleInputChange} />
             </section>
 
@@ -1,10 +1,11 @@
-import { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useTheme } from '../utils/ThemeContext';
 import { useNavigate } from 'react-router-dom';
 import Auth from '../utils/auth';
 import Adventure from '../components/Adventure';
 import DeleteConfirm from '../components/DeleteConfirm';
 import axios, { AxiosError } from 'axios';
+import Cookies from 'js-cookie';
 
 interface AdventureDetailsProps {
     handlePageChange: (page: string) => void;
@@ -50,37 +51,43 @@ export default function MyAdventures({ handlePageChange, deleteConfirm, setDelet
     const [adventures, setAdventures] = useState<adventure[]>([]);
     const [deleteTarget, setDeleteTarget] = useState(0);
     const [reloadRequired, setReloadRequired] = useState(false);
+    const [nextPage, setNextPage] = useState<string | null>(null);
+    const [searchText, setSearchText] = useState('');
+    const [searching, setSearching] = useState(false);
+    const [importMessage, setImportMessage] = useState('');
+    const importInput = useRef<HTMLInputElement | null>(null);
 
     handlePageChange('My Adventures');
 
-    useEffect(() => {
-        const getAdventures = async () => {
-            try {
-                if (!Auth.loggedIn()) {
-                    navigate('/login');
-                    return;
-                }
-                const token = Auth.getToken();
-                const userId = token.fields.user;
-                const response = await axios.get(`/api/adventures/?user_id=${userId}`)
-                if (response.status === 401) {
+    // Adventures are returned a page at a time, newest first, or best match first when searching
+    const getAdventures = async (pageUrl = '/api/adventures/', more = false) => {
+        try {
+            if (!Auth.loggedIn()) {
+                navigate('/login');
+                return;
+            }
+            const response = await axios.get(pageUrl)
+            if (response.status === 401) {
+                navigate('/login');
+            } else if (response.data) {
+                const adventuresData: adventure[] = response.data.results;
+                setAdventures(current => more ? [...current, ...adventuresData] : adventuresData);
+                setNextPage(response.data.next);
+            } else {
+                setAdventures([]);
+                setNextPage(null);
+            }
+        } catch (err) {
+            console.error("MyAdventures 72: ", err);
+            if (err instanceof Error) {
+                if ( err instanceof AxiosError && err.response?.status === 401) {
                     navigate('/login');
-                } else if (response.data) {
-                    const adventuresData: adventure[] = response.data;
-                    setAdventures(adventuresData);
-                } else {
-                    setAdventures([]);
-                }
-            } catch (err) {
-                console.error("MyAdventures 72: ", err);
-                if (err instanceof Error) {
-                    if ( err instanceof AxiosError && err.response?.status === 401) {
-                        navigate('/login');
-                    }
                 }
             }
         }
+    }
 
+    useEffect(() => {
         getAdventures();
         // eslint-disable-next-line react-hooks/exhaustive-deps
     }, []);
@@ -102,6 +109,34 @@ export default function MyAdventures({ handlePageChange, deleteConfirm, setDelet
 
     const newAdventureHandler = () => navigate('/adventures/new');
 
+    // The file is sent as it is, and the server reads it a line at a time
+    const handleImportChange = async (event: React.ChangeEvent<HTMLInputElement>) => {
+        const file = event.target.files?.[0];
+        event.target.value = '';
+        if (!file) {
+            return;
+        }
+        try {
+            setImportMessage('Importing...');
+            const response = await axios.post('/api/adventures/import/', file, { headers: { 'Content-Type': 'application/x-ndjson', 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const { imported, failed } = response.data;
+            setImportMessage(failed ? `Imported ${imported} adventures. ${failed} could not be imported.` : `Imported ${imported} adventures.`);
+            setSearchText('');
+            setSearching(false);
+            getAdventures();
+        } catch (err) {
+            console.error("MyAdventures import: ", err);
+            setImportMessage('Something went wrong when importing adventures.');
+        }
+    }
+
+    const handleSearchSubmit = (event: React.FormEvent<HTMLFormElement>) => {
+        event.preventDefault();
+        const query = searchText.trim();
+        setSearching(query !== '');
+        getAdventures(query ? `/api/adventures/search/?q=${encodeURIComponent(query)}` : undefined);
+    }
+
     const handleDeleteClick = (id = 0) => {
         setDeleteTarget(id);
         setDeleteConfirm(true);
@@ -121,8 +156,29 @@ export default function MyAdventures({ handlePageChange, deleteConfirm, setDelet
                 <button onClick={newAdventureHandler} className={`border-${theme}-accent border-[3px] rounded-xl text-xl bg-${theme}-primary text-${theme}-accent font-${theme}-text py-1.5 px-6`}>New Adventure</button>
             </section>
 
+            <form onSubmit={handleSearchSubmit} className="flex justify-center w-full my-3 lg:justify-start lg:w-3/5">
+                <input
+                    type="search"
+                    value={searchText}
+                    onChange={(e) => setSearchText(e.target.value)}
+                    placeholder="Search adventures"
+                    className={`bg-${theme}-field border-${theme}-primary border-[3px] rounded-xl text-${theme}-text text-lg w-full px-1 py-1`}
+                />
+                <button type="submit" className={`border-${theme}-accent border-[3px] rounded-xl text-lg bg-${theme}-primary text-${theme}-accent font-${theme}-text py-1 px-6 ml-2`}>Search</button>
+            </form>
+
+            <section className="flex justify-center w-full my-3 lg:justify-start lg:w-3/5">
+                <a href="/api/adventures/export/" download className={`border-${theme}-accent border-[3px] rounded-xl text-lg bg-${theme}-primary text-${theme}-accent font-${theme}-text py-1 px-6`}>Export</a>
+                <button onClick={() => importInput.current?.click()} className={`border-${theme}-accent border-[3px] rounded-xl text-lg bg-${theme}-primary text-${theme}-accent font-${theme}-text py-1 px-6 ml-2`}>Import</button>
+                <input type="file" accept=".ndjson,application/x-ndjson" ref={importInput} onChange={handleImportChange} className="hidden" />
+            </section>
+
+            {importMessage &&
+                <p className={`${theme}-text my-2 text-center lg:text-left`}>{importMessage}</p>
+            }
+
             {adventures.length === 0 &&
-                <p className={`${theme}-text my-24 text-center mx-auto`}>No adventures to display. Try creating a new adventure.</p>
+                <p className={`${theme}-text my-24 text-center mx-auto`}>{searching ? 'No adventures match your search.' : 'No adventures to display. Try creating a new adventure.'}</p>
             }
 
             <section className="mt-4 flex flex-wrap justify-around content-around">
@@ -131,6 +187,12 @@ export default function MyAdventures({ handlePageChange, deleteConfirm, setDelet
                 ))}
             </section>
 
+            {nextPage &&
+                <div className="flex justify-center w-full my-3">
+                    <button onClick={() => getAdventures(nextPage, true)} className={`border-${theme}-accent border-[3px] rounded-xl text-lg bg-${theme}-primary text-${theme}-accent font-${theme}-text py-1 px-6`}>Load More</button>
+                </div>
+            }
+
             {deleteConfirm &&
                 <DeleteConfirm deleteType="adventures" deleteId={deleteTarget} setDeleteConfirm={setDeleteConfirm} setReloadRequired={setReloadRequired}/>
             }
@@ -647,80 +647,54 @@ export default function NewAdventure({ handlePageChange, deleteConfirm, setDelet
             return;
         }
 
-        // assemble Adventure
+        // assemble Adventure with its scenes and encounters, which are saved in one request
         setNotification("Saving adventure");
+        type Scene = {
+            sequence: number,
+            challenge: string,
+            setting: string,
+            encounters: {
+                id?: number,
+                type: string,
+                description: string,
+                stats?: string
+            }[],
+            plot_twist: string | null,
+            clue: string | null
+        }
+        const scenesArr = Array.isArray(risingActionChapter.chapterContent) ? risingActionChapter.chapterContent : [];
         const adventurePayload = {
             title: adventureTitle,
-            user_id: Auth.getToken().fields.user,
             game: finalGameTitle,
             campaign_setting: finalCampaignSetting,
             exposition: expositionChapter.chapterContent,
             incitement: incitementChapter.chapterContent,
             climax: climaxChapter.chapterContent,
-            denoument: denoumentChapter.chapterContent
+            denoument: denoumentChapter.chapterContent,
+            scene_set: scenesArr.map(scene => {
+                const { sequence, challenge, setting, plot_twist, clue, encounters } = scene as Scene;
+                return {
+                    sequence,
+                    challenge,
+                    setting,
+                    plot_twist,
+                    clue,
+                    encounter_set: (encounters || []).map(({ type, description }) => ({
+                        // Generated types can be longer than the 31 characters an encounter type holds
+                        encounter_type: type?.slice(0, 31),
+                        description
+                    }))
+                }
+            })
         }
 
         try {
-            const response = await axios.post('/api/adventures/', adventurePayload, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
+            const response = await axios.post('/api/adventures/tree/', adventurePayload, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
 
             if (response.status === 401) {
                 navigate('/login');
             } else if (response.data) {
                 setAdventureId(response.data.id);
-                type Scene = {
-                    sequence: number,
-                    challenge: string,
-                    setting: string,
-                    encounters: {
-                        id?: number,
-                        type: string,
-                        description: string,
-                        stats?: string
-                    }[],
-                    plot_twist: string | null,
-                    clue: string | null
-                }
-                const scenesArr = Array.isArray(risingActionChapter.chapterContent) ? risingActionChapter.chapterContent : [];
-
-                scenesArr?.forEach(async (scene, idx) => {
-                    setNotification(`Saving Scene ${idx + 1}`);
-                    const { sequence, challenge, setting, plot_twist, clue } = scene as Scene;
-                    const scenePayload = {
-                        adventure_id: response.data.id,
-                        sequence,
-                        challenge,
-                        setting,
-                        plot_twist,
-                        clue
-                    }
-
-                    const sceneResponse = await axios.post('/api/scenes/', scenePayload, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
-
-                    if (sceneResponse.status === 401) {
-                        navigate('/login');
-                    } else if (sceneResponse.data) {
-                        const sceneId = sceneResponse.data.id;
-                        const { encounters } = scene as Scene;
-
-                        encounters?.forEach(async encounter => {
-                            setNotification('Saving encounters');
-                            const { type, description } = encounter;
-                            const encounterPayload = {
-                                scene_id: sceneId,
-                                encounter_type: type,
-                                description
-                            }
-
-                            const encounterResponse = await axios.post('/api/encounters/', encounterPayload, { headers: { 'X-CSRFToken': Cookies.get('csrftoken') } });
-
-                            if (encounterResponse.status !== 201) {
-                                setNotification('Oops! Something went wrong. Please try again.');
-                            }
-                        });
-                    } else {
-                        setNotification('Oops! Something went wrong. Please try again.');
-                    }
-                })
             } else {
                 setNotification('Oops! Something went wrong. Please try again.');
             }
@@ -202,4 +202,70 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
     ]
-}
\ No newline at end of file
+}
+
+# Adventure generation jobs
+
+GENERATION_WORKERS = int(os.environ.get('GENERATION_WORKERS', 2))
+GENERATION_JOB_LEASE = 600
+GENERATION_JOB_MAX_ATTEMPTS = 2
+GENERATION_JOB_POLL_INTERVAL = 1
+
+# Generated adventures are cached by their normalized parameters
+GENERATION_CACHE_TTL = 60 * 60 * 24 * 7
+GENERATION_CACHE_MAX_ENTRIES = 1000
+
+# A database cache is shared by every gunicorn worker and generation worker process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 5000)),
+        },
+    }
+}
+
+# Serialized adventures are cached until they change, or for at most a day
+ADVENTURE_CACHE_TTL = 60 * 60 * 24
+
+# Counters such as cache hits are written to the database at most this often by each process
+COUNTER_FLUSH_INTERVAL = int(os.environ.get('COUNTER_FLUSH_INTERVAL', 10))
+
+# Adventures are exported and imported as NDJSON this many at a time
+ADVENTURE_EXPORT_CHUNK = 100
+ADVENTURE_IMPORT_BATCH = 100
+
+# Ready-made adventures are kept for the most requested parameters seen within the window
+ADVENTURE_POOL_COMBINATIONS = int(os.environ.get('ADVENTURE_POOL_COMBINATIONS', 10))
+ADVENTURE_POOL_SIZE = int(os.environ.get('ADVENTURE_POOL_SIZE', 2))
+ADVENTURE_POOL_WINDOW = 60 * 60 * 24 * 7
+ADVENTURE_POOL_INTERVAL = 60
+
+# Admission control for generation requests, shared across processes through the database
+GENERATION_CONCURRENCY = int(os.environ.get('GENERATION_CONCURRENCY', 8))
+GENERATION_USER_CONCURRENCY = 1
+GENERATION_QUEUE_SIZE = 8
+GENERATION_QUEUE_TIMEOUT = 10
+GENERATION_QUEUE_POLL_INTERVAL = 0.5
+GENERATION_SLOT_LEASE = 180
+GENERATION_RATE = 5 / 60
+GENERATION_BURST = 3
+GENERATION_RETRY_AFTER = 5
+
+# Identical generation requests share one call to Gemini while it runs, and its result for a short window after
+GENERATION_COALESCE_WINDOW = int(os.environ.get('GENERATION_COALESCE_WINDOW', 30))
+GENERATION_FLIGHT_LEASE = 120
+GENERATION_FLIGHT_POLL_INTERVAL = 0.5
+
+# Upper limit on alternative adventures generated from one request
+GENERATION_MAX_VARIANTS = 4
+
+# Calls to Gemini fail fast once too many calls within the window fail or are slow, until a probe call succeeds
+GENERATION_BREAKER_WINDOW = 60
+GENERATION_BREAKER_MIN_CALLS = 5
+GENERATION_BREAKER_ERROR_RATE = 0.5
+GENERATION_BREAKER_SLOW_CALL = 30
+GENERATION_BREAKER_SLOW_RATE = 0.5
+GENERATION_BREAKER_COOLDOWN = 30
+GENERATION_BREAKER_PROBE_LEASE = 90
@@ -1,8 +1,16 @@
 from django.contrib import admin
-from .models import Adventure, Scene, Encounter, Custom_Field
+from .models import Adventure, Scene, Encounter, Custom_Field, Generation_Job, Cached_Adventure, Pooled_Adventure, Generation_Request_Stat, Generation_Metric, Generation_Slot, Rate_Bucket, Generation_Flight
 
 # Register your models here.
 admin.site.register(Adventure)
 admin.site.register(Scene)
 admin.site.register(Encounter)
-admin.site.register(Custom_Field)
\ No newline at end of file
+admin.site.register(Custom_Field)
+admin.site.register(Generation_Job)
+admin.site.register(Cached_Adventure)
+admin.site.register(Pooled_Adventure)
+admin.site.register(Generation_Request_Stat)
+admin.site.register(Generation_Metric)
+admin.site.register(Generation_Slot)
+admin.site.register(Rate_Bucket)
+admin.site.register(Generation_Flight)
\ No newline at end of file
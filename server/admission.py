@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Least
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from rest_framework.exceptions import Throttled
+from .models import Generation_Slot, Rate_Bucket
+import math
+import time
+
+created_slots = set()
+
+def ensure_slots(kind, count):
+    if (kind, count) not in created_slots:
+        Generation_Slot.objects.bulk_create([Generation_Slot(kind=kind, number=number) for number in range(count)], ignore_conflicts=True)
+        created_slots.add((kind, count))
+
+def claim_slot(kind, count, user):
+    """ Claims one of count shared slots of the given kind, returning None if they are all held. Slots held past their lease are reclaimed """
+    ensure_slots(kind, count)
+    now = timezone.now()
+    claimable = Q(token__isnull=True) | Q(expires_at__lt=now)
+
+    for number in Generation_Slot.objects.filter(claimable, kind=kind, number__lt=count).values_list('number', flat=True):
+        token = get_random_string(32)
+        claimed = Generation_Slot.objects.filter(claimable, kind=kind, number=number).update(
+            user_id=user, token=token, expires_at=now + timedelta(seconds=settings.GENERATION_SLOT_LEASE))
+        if claimed:
+            return Generation_Slot(kind=kind, number=number, user_id=user, token=token)
+    return None
+
+def release_slot(slot):
+    Generation_Slot.objects.filter(kind=slot.kind, number=slot.number, token=slot.token).update(user_id=None, token=None, expires_at=None)
+
+def running_for(user):
+    return Generation_Slot.objects.filter(kind='run', user_id=user, expires_at__gt=timezone.now()).count()
+
+@transaction.atomic
+def take_token(key, rate, burst):
+    """ Takes a token from a shared token bucket, returning 0 on success or the seconds until a token is available """
+    now = timezone.now()
+    bucket, created = Rate_Bucket.objects.select_for_update().get_or_create(key=key, defaults={'tokens': burst, 'updated_at': now})
+    tokens = min(burst, bucket.tokens + (now - bucket.updated_at).total_seconds() * rate)
+    if tokens < 1:
+        return (1 - tokens) / rate
+
+    bucket.tokens = tokens - 1
+    bucket.updated_at = now
+    bucket.save(update_fields=['tokens', 'updated_at'])
+    return 0
+
+def refund_token(key, burst):
+    Rate_Bucket.objects.filter(key=key).update(tokens=Least(F('tokens') + 1, burst))
+
+def rate_key(user):
+    return 'generation:user:%s' % user.pk
+
+def check_rate(user):
+    wait = take_token(rate_key(user), settings.GENERATION_RATE, settings.GENERATION_BURST)
+    if wait:
+        raise Throttled(wait=math.ceil(wait))
+
+def admit(user):
+    """ Admits a generation request for the user, returning the slot it holds, or raises Throttled so the client gets a 429 with Retry-After.
+    A request that is turned away spends none of the user's rate tokens """
+    if running_for(user) >= settings.GENERATION_USER_CONCURRENCY:
+        raise Throttled(wait=settings.GENERATION_RETRY_AFTER)
+
+    check_rate(user)
+    try:
+        return claim_run_slot(user)
+    except Throttled:
+        refund_token(rate_key(user), settings.GENERATION_BURST)
+        raise
+
+def claim_run_slot(user):
+    slot = claim_slot('run', settings.GENERATION_CONCURRENCY, user)
+    if slot is None:
+        # Wait for a free slot only if there is room in the queue
+        ticket = claim_slot('wait', settings.GENERATION_QUEUE_SIZE, user)
+        if ticket is None:
+            raise Throttled(wait=settings.GENERATION_RETRY_AFTER)
+        try:
+            deadline = time.monotonic() + settings.GENERATION_QUEUE_TIMEOUT
+            while slot is None and time.monotonic() < deadline:
+                time.sleep(settings.GENERATION_QUEUE_POLL_INTERVAL)
+                slot = claim_slot('run', settings.GENERATION_CONCURRENCY, user)
+        finally:
+            release_slot(ticket)
+        if slot is None:
+            raise Throttled(wait=settings.GENERATION_RETRY_AFTER)
+
+    # Another request from the same user may have claimed a slot at the same time
+    if running_for(user) > settings.GENERATION_USER_CONCURRENCY:
+        release_slot(slot)
+        raise Throttled(wait=settings.GENERATION_RETRY_AFTER)
+
+    return slot
+
+@contextmanager
+def admitted(user):
+    slot = admit(user)
+    try:
+        yield slot
+    finally:
+        release_slot(slot)
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from .models import Adventure, Scene, Encounter, Custom_Field
+from .utils import increment_counter, get_counter
+from .versions import adventure_id_of
+
+def document_key(adventure_id):
+    return 'adventure:%s' % adventure_id
+
+def get_document(adventure_id, version):
+    """ Returns an adventure's serialized JSON, or None if it is not cached at the given version """
+    cached = cache.get(document_key(adventure_id))
+    # A document cached by a read that raced a write is left behind by the version, even if it was stored after the write removed it
+    if cached is None or cached[0] != version:
+        increment_counter('adventure_cache_misses')
+        return None
+
+    increment_counter('adventure_cache_hits')
+    return cached[1]
+
+def cache_document(adventure_id, version, content):
+    cache.set(document_key(adventure_id), (version, content), settings.ADVENTURE_CACHE_TTL)
+
+def forget_document(adventure_id):
+    cache.delete(document_key(adventure_id))
+
+def adventure_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        forget_document(instance.pk)
+
+def part_saved(sender, instance, **kwargs):
+    forget_document(adventure_id_of(instance))
+
+def part_deleted(sender, instance, origin=None, **kwargs):
+    # Parts deleted along with an adventure or a scene are covered by the deletion they cascade from
+    if origin is instance:
+        forget_document(adventure_id_of(instance))
+
+def connect_signals():
+    """ Removes an adventure's cached document whenever it, or any of its scenes, encounters or custom fields, is saved or deleted """
+    post_save.connect(adventure_changed, sender=Adventure)
+    post_delete.connect(adventure_changed, sender=Adventure)
+    for model in [Scene, Encounter, Custom_Field]:
+        post_save.connect(part_saved, sender=model)
+        post_delete.connect(part_deleted, sender=model)
+
+def document_stats():
+    hits = get_counter('adventure_cache_hits')
+    misses = get_counter('adventure_cache_misses')
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else None,
+    }
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from functools import lru_cache
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from .models import Adventure, Scene, Encounter, Custom_Field
+from .serializers import AdventureSerializer, SceneSerializer, EncounterSerializer, CustomFieldSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Serializer fields whose output is the value exactly as .values() returns it
+plain_fields = (serializers.CharField, serializers.IntegerField, serializers.FloatField, serializers.BooleanField, serializers.ChoiceField, serializers.PrimaryKeyRelatedField)
+
+@lru_cache(maxsize=None)
+def columns(serializer_class):
+    """ Returns the name of each field of a serializer in output order, with the to_representation of those that are not plain values.
+    Nested serializers have no to_representation, and are filled in from the rows of their own query """
+    columns = []
+    for name, field in serializer_class().fields.items():
+        if isinstance(field, serializers.ListSerializer):
+            columns.append((name, None, True))
+        else:
+            columns.append((name, None if isinstance(field, plain_fields) else field.to_representation, False))
+    return columns
+
+def value_names(serializer_class):
+    return [name for name, convert, is_nested in columns(serializer_class) if not is_nested]
+
+def represent(serializer_class, row, **nested):
+    """ Builds the output of serializer_class from a .values() row, as the serializer would """
+    document = {}
+    for name, convert, is_nested in columns(serializer_class):
+        if is_nested:
+            document[name] = nested[name]
+        elif convert is None or row[name] is None:
+            document[name] = row[name]
+        else:
+            document[name] = convert(row[name])
+    return document
+
+def adventure_documents(adventure_ids):
+    """ Returns the adventures with the given ids as AdventureSerializer would, in primary key order.
+    Four queries are made however many adventures there are, and no model instances are created """
+    rows = Adventure.objects.filter(pk__in=adventure_ids).order_by('pk').values(*value_names(AdventureSerializer))
+    # Rows are ordered as the serializer's prefetches return them: scenes by sequence, and everything else by primary key within its parent
+    scene_rows = Scene.objects.filter(adventure_id__in=adventure_ids).order_by('sequence', 'pk').values(*value_names(SceneSerializer))
+    encounter_rows = Encounter.objects.filter(scene_id__adventure_id__in=adventure_ids).order_by('pk').values(*value_names(EncounterSerializer))
+    in_trees = Q(adventure_id__in=adventure_ids) | Q(scene_id__adventure_id__in=adventure_ids) | Q(encounter_id__scene_id__adventure_id__in=adventure_ids)
+    custom_field_rows = Custom_Field.objects.filter(in_trees).order_by('pk').values(*value_names(CustomFieldSerializer))
+
+    custom_fields = {'adventure_id': defaultdict(list), 'scene_id': defaultdict(list), 'encounter_id': defaultdict(list)}
+    for custom_field in custom_field_rows:
+        document = represent(CustomFieldSerializer, custom_field)
+        for owner, owned in custom_fields.items():
+            if custom_field[owner] is not None:
+                owned[custom_field[owner]].append(document)
+
+    encounters = defaultdict(list)
+    for encounter in encounter_rows:
+        encounters[encounter['scene_id']].append(represent(EncounterSerializer, encounter, custom_field_set=custom_fields['encounter_id'][encounter['id']]))
+
+    scenes = defaultdict(list)
+    for scene in scene_rows:
+        scenes[scene['adventure_id']].append(represent(SceneSerializer, scene, custom_field_set=custom_fields['scene_id'][scene['id']], encounter_set=encounters[scene['id']]))
+
+    return [represent(AdventureSerializer, row, custom_field_set=custom_fields['adventure_id'][row['id']], scene_set=scenes[row['id']]) for row in rows]
+
+def adventure_document(adventure_id):
+    """ Returns an adventure as AdventureSerializer would, or None if it does not exist """
+    documents = adventure_documents([adventure_id])
+    return documents[0] if documents else None
+
+def orjson_float(value):
+    # orjson writes very small and very large floats without the exponent form json.dumps uses
+    return value == 0 or 1e-4 <= abs(value) < 1e16
+
+def render_json(document):
+    """ Renders an adventure document to the same bytes as JSONRenderer, with orjson when it is installed """
+    # Only adventures have float fields, so the nested documents need no checking
+    if orjson is None or not all(orjson_float(value) for value in document.values() if isinstance(value, float)):
+        return JSONRenderer().render(document)
+    # JSONRenderer escapes the line and paragraph separators, which are valid JSON but not valid JavaScript
+    return orjson.dumps(document).replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+def render_adventure(adventure_id):
+    """ Renders an adventure as the adventure detail endpoint does, or returns None if it does not exist """
+    document = adventure_document(adventure_id)
+    return None if document is None else render_json(document)
@@ -0,0 +1,71 @@
+from itertools import islice
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from .adventure_json import adventure_documents, render_json
+from .adventure_tree import build_adventure_tree, save_adventure_trees
+from .serializers import AdventureTreeSerializer
+import json
+
+# Only the first errors of an import are reported, so a file of bad lines cannot fill memory
+max_import_errors = 100
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+def export_ndjson(adventures):
+    """ Yields each adventure in the adventures queryset as a line of NDJSON, in the form the adventure detail endpoint returns it.
+    Adventures are read a chunk at a time, so memory stays flat however many there are """
+    ids = adventures.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=settings.ADVENTURE_EXPORT_CHUNK)
+    for chunk in chunks(ids, settings.ADVENTURE_EXPORT_CHUNK):
+        for document in adventure_documents(chunk):
+            yield render_json(document) + b'\n'
+
+def import_ndjson(user, lines):
+    """ Saves the adventures in lines of NDJSON, in the form export_ndjson writes them, as the user's.
+    Lines are validated one at a time and saved in batches, each in its own transaction, so memory stays flat however many there are.
+    Returns the number of adventures imported and failed, with the errors of the first lines that failed """
+    result = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(number, error):
+        result['failed'] += 1
+        if len(result['errors']) < max_import_errors:
+            result['errors'].append({'line': number, 'error': error})
+
+    def save(batch):
+        try:
+            save_adventure_trees([build_adventure_tree(user, data)[:3] for number, data in batch])
+            result['imported'] += len(batch)
+        except ValidationError:
+            # The batch was rolled back, so its adventures are rebuilt and saved one at a time to find the ones that fail
+            for number, data in batch:
+                try:
+                    save_adventure_trees([build_adventure_tree(user, data)[:3]])
+                    result['imported'] += 1
+                except ValidationError as e:
+                    fail(number, e.message_dict)
+
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            fail(number, 'Invalid JSON: %s' % e)
+            continue
+        serializer = AdventureTreeSerializer(data=data)
+        if not serializer.is_valid():
+            fail(number, serializer.errors)
+            continue
+
+        batch.append((number, serializer.validated_data))
+        if len(batch) == settings.ADVENTURE_IMPORT_BATCH:
+            save(batch)
+            batch = []
+    if batch:
+        save(batch)
+    return result
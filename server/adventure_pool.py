@@ -0,0 +1,62 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Pooled_Adventure, Generation_Request_Stat, Generation_Request_Count
+from .palm import PROMPT_VERSION, create_adventure, dump_adventure
+
+def record_request(key, params):
+    now = timezone.now()
+    updated = Generation_Request_Stat.objects.filter(key=key).update(count=F('count') + 1, last_requested=now)
+    if not updated:
+        try:
+            # The savepoint keeps a duplicate key from breaking a transaction the caller is in
+            with transaction.atomic():
+                Generation_Request_Stat.objects.create(key=key, params=params, count=1, last_requested=now)
+        except IntegrityError:
+            Generation_Request_Stat.objects.filter(key=key).update(count=F('count') + 1, last_requested=now)
+
+    # Requests are also counted by day, so popularity can be measured over the pool window
+    today = now.date()
+    if not Generation_Request_Count.objects.filter(stat_id__key=key, day=today).update(count=F('count') + 1):
+        try:
+            with transaction.atomic():
+                Generation_Request_Count.objects.create(stat_id=Generation_Request_Stat.objects.get(key=key), day=today, count=1)
+        except IntegrityError:
+            Generation_Request_Count.objects.filter(stat_id__key=key, day=today).update(count=F('count') + 1)
+
+def claim_pooled_adventure(key):
+    """ Hands out a pooled adventure for the given key, making sure each one is handed out only once """
+    for entry in Pooled_Adventure.objects.filter(key=key, claimed_at__isnull=True, prompt_version=PROMPT_VERSION)[:5]:
+        claimed = Pooled_Adventure.objects.filter(pk=entry.pk, claimed_at__isnull=True).update(claimed_at=timezone.now())
+        if claimed:
+            return entry.adventure
+    return None
+
+def popular_requests():
+    """ Returns the combinations of generation parameters requested most often within the pool window """
+    since = timezone.now() - timedelta(seconds=settings.ADVENTURE_POOL_WINDOW)
+    recent = Coalesce(Sum('generation_request_count__count', filter=Q(generation_request_count__day__gte=since.date())), 0)
+    # The lifetime count only breaks ties, such as between combinations last requested before requests were counted by day
+    return Generation_Request_Stat.objects.filter(last_requested__gte=since).annotate(recent=recent).order_by('-recent', '-count')[:settings.ADVENTURE_POOL_COMBINATIONS]
+
+def fill_pool():
+    # Claimed adventures and adventures generated from an older prompt are never handed out again
+    Pooled_Adventure.objects.filter(Q(claimed_at__isnull=False) | ~Q(prompt_version=PROMPT_VERSION)).delete()
+    # Days before the pool window no longer count toward popularity
+    Generation_Request_Count.objects.filter(day__lt=(timezone.now() - timedelta(seconds=settings.ADVENTURE_POOL_WINDOW)).date()).delete()
+
+    popular = list(popular_requests())
+    Pooled_Adventure.objects.exclude(key__in=[stat.key for stat in popular]).delete()
+
+    available = dict(Pooled_Adventure.objects.order_by().values_list('key').annotate(available=Count('pk')))
+    for stat in popular:
+        for i in range(settings.ADVENTURE_POOL_SIZE - available.get(stat.key, 0)):
+            try:
+                adventure = dump_adventure(create_adventure(**stat.params))
+                Pooled_Adventure.objects.create(key=stat.key, params=stat.params, prompt_version=PROMPT_VERSION, adventure=adventure)
+            except Exception as e:
+                print("Unable to fill adventure pool because %s" % e)
+                break
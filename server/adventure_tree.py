@@ -0,0 +1,187 @@
+from django.db import transaction
+from django.db.models import Q
+from .models import Adventure, Scene, Encounter, Custom_Field
+from .progress import recalculate_progress, set_progress
+from .search import index_parts
+
+def bulk_create_with_ids(model, objs, queryset):
+    model.objects.bulk_create(objs)
+    if objs and objs[0].pk is None:
+        # MySQL does not return primary keys from bulk inserts, so they are read back in insertion order
+        for obj, pk in zip(objs, queryset.order_by('pk').values_list('pk', flat=True)):
+            obj.pk = pk
+    return objs
+
+@transaction.atomic
+def save_adventure_trees(trees):
+    """ Saves new adventures with their scenes, their encounters and any custom fields in one transaction, using one INSERT per table besides the adventures'.
+    trees is a list of (adventure, scenes, custom_fields), where scenes is a list of (scene, encounters) pairs and each custom field already refers to the adventure, scene or encounter it belongs to """
+    for adventure, scenes, custom_fields in trees:
+        adventure.clean_fields(exclude=['user_id'])
+        set_progress(adventure, scenes)
+        adventure.save()
+    adventures = [adventure for adventure, scenes, custom_fields in trees]
+
+    all_scenes = []
+    for adventure, scenes, custom_fields in trees:
+        for scene, encounters in scenes:
+            scene.adventure_id = adventure
+            scene.clean_fields(exclude=['adventure_id'])
+            all_scenes.append(scene)
+    bulk_create_with_ids(Scene, all_scenes, Scene.objects.filter(adventure_id__in=adventures))
+
+    all_encounters = []
+    for adventure, scenes, custom_fields in trees:
+        for scene, encounters in scenes:
+            for encounter in encounters:
+                encounter.scene_id = scene
+                encounter.clean_fields(exclude=['scene_id'])
+                all_encounters.append(encounter)
+    bulk_create_with_ids(Encounter, all_encounters, Encounter.objects.filter(scene_id__adventure_id__in=adventures))
+
+    all_custom_fields = [custom_field for adventure, scenes, custom_fields in trees for custom_field in custom_fields]
+    for custom_field in all_custom_fields:
+        custom_field.clean_fields(exclude=['adventure_id', 'scene_id', 'encounter_id'])
+    in_trees = Q(adventure_id__in=adventures) | Q(scene_id__adventure_id__in=adventures) | Q(encounter_id__scene_id__adventure_id__in=adventures)
+    bulk_create_with_ids(Custom_Field, all_custom_fields, Custom_Field.objects.filter(in_trees))
+
+    index_parts([
+        (adventure.pk, part)
+        for adventure, scenes, custom_fields in trees
+        for part in [scene for scene, encounters in scenes] + [encounter for scene, encounters in scenes for encounter in encounters] + list(custom_fields)
+    ])
+    return adventures
+
+def save_adventure_tree(adventure, scenes, custom_fields=()):
+    """ Saves a new adventure with its scenes, their encounters and any custom fields in one transaction, using one INSERT per table.
+    scenes is a list of (scene, encounters) pairs, and each custom field already refers to the adventure, scene or encounter it belongs to """
+    return save_adventure_trees([(adventure, scenes, custom_fields)])[0]
+
+def build_adventure_tree(user, data):
+    """ Builds an unsaved adventure from the validated data of an AdventureTreeSerializer, for save_adventure_trees.
+    Returns the adventure, its scenes, its custom fields, and a function returning the ids of everything once saved in the same shape as the data """
+    custom_fields = []
+
+    def owned_custom_fields(owner, field, items):
+        created = [Custom_Field(name=item['name'], value=item.get('value', ''), **{field: owner}) for item in items]
+        custom_fields.extend(created)
+        return created
+
+    data = dict(data)
+    scene_data = data.pop('scene_set', [])
+    adventure = Adventure(user_id=user, **{key: value for key, value in data.items() if key != 'custom_field_set'})
+    adventure_fields = owned_custom_fields(adventure, 'adventure_id', data.get('custom_field_set', []))
+
+    scenes = []
+    tree = []
+    for item in scene_data:
+        item = dict(item)
+        encounter_data = item.pop('encounter_set', [])
+        scene = Scene(**{key: value for key, value in item.items() if key != 'custom_field_set'})
+        scene_fields = owned_custom_fields(scene, 'scene_id', item.get('custom_field_set', []))
+
+        encounters = []
+        encounter_fields = []
+        for encounter_item in encounter_data:
+            encounter = Encounter(**{key: value for key, value in encounter_item.items() if key != 'custom_field_set'})
+            encounters.append(encounter)
+            encounter_fields.append(owned_custom_fields(encounter, 'encounter_id', encounter_item.get('custom_field_set', [])))
+
+        scenes.append((scene, encounters))
+        tree.append((scene, scene_fields, list(zip(encounters, encounter_fields))))
+
+    def ids(objs):
+        return [{'id': obj.pk} for obj in objs]
+
+    def tree_ids():
+        return {
+            'id': adventure.pk,
+            'scene_set': [
+                {
+                    'id': scene.pk,
+                    'encounter_set': [{'id': encounter.pk, 'custom_field_set': ids(fields)} for encounter, fields in encounters],
+                    'custom_field_set': ids(scene_fields),
+                }
+                for scene, scene_fields, encounters in tree
+            ],
+            'custom_field_set': ids(adventure_fields),
+        }
+
+    return adventure, scenes, custom_fields, tree_ids
+
+def create_adventure_tree(user, data):
+    """ Saves a new adventure from the validated data of an AdventureTreeSerializer, returning the ids of everything created in the same shape as the data """
+    adventure, scenes, custom_fields, tree_ids = build_adventure_tree(user, data)
+    save_adventure_tree(adventure, scenes, custom_fields)
+    return tree_ids()
+
+def save_generated_adventure(user, title, game, campaign_setting, generated):
+    """ Maps a generated palm.Adventure onto new Adventure, Scene and Encounter rows """
+    adventure = Adventure(
+        user_id=user,
+        title=title,
+        game=game,
+        campaign_setting=campaign_setting,
+        exposition=generated.Exposition,
+        incitement=generated.Incitement,
+        climax=generated.Climax,
+        denoument=generated.Denoument,
+    )
+    scenes = [
+        (
+            Scene(sequence=sequence, challenge=scene.challenge, setting=scene.setting, plot_twist=scene.plot_twist, clue=scene.clue),
+            [generated_encounter(encounter) for encounter in scene.encounters]
+        )
+        for sequence, scene in enumerate(generated.Rising_Action, start=1)
+    ]
+    return save_adventure_tree(adventure, scenes)
+
+def adventure_context(adventure, sequence=None):
+    """ Describes a saved adventure for a regeneration prompt. Only the scene with the given sequence includes its encounters """
+    scenes = []
+    for scene in adventure.scene_set.all():
+        described = {"sequence": scene.sequence, "challenge": scene.challenge, "setting": scene.setting, "plot_twist": scene.plot_twist, "clue": scene.clue}
+        if scene.sequence == sequence:
+            described["encounters"] = [{"type": encounter.encounter_type, "description": encounter.description} for encounter in sorted(scene.encounter_set.all(), key=lambda encounter: encounter.pk)]
+        scenes.append(described)
+
+    return {
+        "Exposition": adventure.exposition,
+        "Incitement": adventure.incitement,
+        "Rising_Action": scenes,
+        "Climax": adventure.climax,
+        "Denoument": adventure.denoument,
+    }
+
+def generated_encounter(generated):
+    # Generated encounter types can run longer than the column allows
+    return Encounter(encounter_type=generated.type[:Encounter._meta.get_field('encounter_type').max_length], description=generated.description, stats=generated.stats)
+
+@transaction.atomic
+def replace_scene(scene, generated):
+    """ Updates a scene with a regenerated palm.Scene, replacing its encounters """
+    scene.challenge = generated.challenge
+    scene.setting = generated.setting
+    scene.plot_twist = generated.plot_twist
+    scene.clue = generated.clue
+    scene.clean_fields(exclude=['adventure_id'])
+    scene.save(update_fields=['challenge', 'setting', 'plot_twist', 'clue'])
+
+    scene.encounter_set.all().delete()
+    encounters = [generated_encounter(encounter) for encounter in generated.encounters]
+    for encounter in encounters:
+        encounter.scene_id = scene
+        encounter.clean_fields(exclude=['scene_id'])
+    bulk_create_with_ids(Encounter, encounters, scene.encounter_set.all())
+    index_parts([(scene.adventure_id_id, encounter) for encounter in encounters])
+    recalculate_progress(scene.adventure_id_id)
+    return scene
+
+def replace_encounter(encounter, generated):
+    replacement = generated_encounter(generated)
+    encounter.encounter_type = replacement.encounter_type
+    encounter.description = replacement.description
+    encounter.stats = replacement.stats
+    encounter.clean_fields(exclude=['scene_id'])
+    encounter.save(update_fields=['encounter_type', 'description', 'stats'])
+    return encounter
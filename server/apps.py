@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class ServerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'server'
+
+    def ready(self):
+        from django.db import connections
+        from . import palm
+        from . import adventure_cache, search, versions
+        versions.connect_signals()
+        adventure_cache.connect_signals()
+        search.connect_signals()
+        from .circuit_breaker import allow_call, record_outcome
+        from .metrics import record_call
+        palm.call_guards.append(allow_call)
+        palm.call_observers.append(record_call)
+        palm.call_observers.append(record_outcome)
+        palm.worker_finalizers.append(connections.close_all)
@@ -0,0 +1,116 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from .models import Circuit_Breaker
+from .palm import ProviderUnavailable
+from .providers import get_provider
+import math
+
+# Errors in a response the provider did return, which say nothing about its health
+ignored_errors = {'JSONDecodeError'}
+
+class ServiceUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Adventure generation is temporarily unavailable. Please try again later.'
+    default_code = 'service_unavailable'
+
+    def __init__(self, wait=None, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+def get_breaker(name):
+    breaker, created = Circuit_Breaker.objects.get_or_create(name=name, defaults={'window_started_at': timezone.now()})
+    return breaker
+
+def unavailable_for(breaker, now):
+    """ Returns the seconds until a call may be made, or 0 if one may be made now """
+    if breaker.state == 'open':
+        reopens_at = breaker.opened_at + timedelta(seconds=settings.GENERATION_BREAKER_COOLDOWN)
+        return max(0, (reopens_at - now).total_seconds())
+    if breaker.state == 'half_open':
+        return max(0, (breaker.probe_expires_at - now).total_seconds())
+    return 0
+
+def allow_call(call):
+    """ Lets a call to the provider through while the breaker is closed, and one probe call at a time once it has cooled down """
+    breaker = get_breaker(call.model)
+    if breaker.state == 'closed':
+        return
+
+    now = timezone.now()
+    wait = unavailable_for(breaker, now)
+    if not wait:
+        # The conditional update only succeeds for one caller, which becomes the probe
+        claimable = Q(state='open', opened_at=breaker.opened_at) | Q(state='half_open', probe_expires_at=breaker.probe_expires_at)
+        claimed = Circuit_Breaker.objects.filter(claimable, pk=breaker.pk).update(
+            state='half_open', probe_expires_at=now + timedelta(seconds=settings.GENERATION_BREAKER_PROBE_LEASE))
+        if claimed:
+            call.probe = True
+            return
+        wait = settings.GENERATION_BREAKER_COOLDOWN
+
+    raise ProviderUnavailable("%s is unavailable" % call.model, math.ceil(wait))
+
+def open_breaker(name, now, *states):
+    return Circuit_Breaker.objects.filter(name=name, state__in=states).update(state='open', opened_at=now, probe_expires_at=None)
+
+def close_breaker(name, now):
+    Circuit_Breaker.objects.filter(name=name, state='half_open').update(
+        state='closed', window_started_at=now, calls=0, failures=0, slow_calls=0, opened_at=None, probe_expires_at=None)
+
+def record_outcome(call):
+    """ Counts a finished call against the breaker's window, opening the breaker when too many calls fail or are slow """
+    if call.error == 'ProviderUnavailable':
+        return
+
+    now = timezone.now()
+    failed = call.error is not None and call.error not in ignored_errors
+    slow = call.wall_time >= settings.GENERATION_BREAKER_SLOW_CALL
+
+    if call.probe:
+        if failed or slow:
+            open_breaker(call.model, now, 'half_open')
+        else:
+            close_breaker(call.model, now)
+        return
+
+    breaker = get_breaker(call.model)
+    if breaker.state != 'closed':
+        return
+
+    window_start = now - timedelta(seconds=settings.GENERATION_BREAKER_WINDOW)
+    Circuit_Breaker.objects.filter(pk=breaker.pk, window_started_at__lt=window_start).update(
+        window_started_at=now, calls=0, failures=0, slow_calls=0)
+    Circuit_Breaker.objects.filter(pk=breaker.pk).update(
+        calls=F('calls') + 1, failures=F('failures') + int(failed), slow_calls=F('slow_calls') + int(slow))
+
+    breaker.refresh_from_db()
+    if breaker.calls < settings.GENERATION_BREAKER_MIN_CALLS:
+        return
+    if breaker.failures / breaker.calls >= settings.GENERATION_BREAKER_ERROR_RATE or breaker.slow_calls / breaker.calls >= settings.GENERATION_BREAKER_SLOW_RATE:
+        if open_breaker(call.model, now, 'closed'):
+            print("Opened circuit breaker for %s after %s failed and %s slow of %s calls" % (call.model, breaker.failures, breaker.slow_calls, breaker.calls))
+
+def check_available():
+    """ Raises ServiceUnavailable, so the client gets a 503 with Retry-After, while calls to the current provider would fail fast """
+    breaker = get_breaker(get_provider().model_name)
+    wait = unavailable_for(breaker, timezone.now())
+    if wait:
+        raise ServiceUnavailable(wait=math.ceil(wait))
+
+def breaker_health():
+    now = timezone.now()
+    breakers = {}
+    for breaker in Circuit_Breaker.objects.all():
+        breakers[breaker.name] = {
+            'state': breaker.state,
+            'calls': breaker.calls,
+            'failures': breaker.failures,
+            'slow_calls': breaker.slow_calls,
+            'opened_at': breaker.opened_at,
+            'retry_after': math.ceil(unavailable_for(breaker, now)),
+        }
+    available = all(breaker['state'] == 'closed' for breaker in breakers.values())
+    return {'status': 'ok' if available else 'degraded', 'breakers': breakers}
@@ -0,0 +1,109 @@
+from contextlib import nullcontext
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .admission import admitted
+from .adventure_pool import claim_pooled_adventure, record_request
+from .models import Cached_Adventure
+from .single_flight import single_flight
+from .palm import PROMPT_VERSION, create_adventure, dump_adventure, load_adventure
+from .utils import increment_counter, get_counter
+import hashlib
+import json
+
+def normalize_params(params):
+    normalized = {}
+    for name, value in params.items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, str):
+            value = " ".join(value.split()).casefold()
+            # Numbers often arrive as strings from form fields
+            if value.isdigit():
+                value = int(value)
+        normalized[name] = value
+    return normalized
+
+def cache_key(params):
+    normalized = json.dumps(normalize_params(params), sort_keys=True)
+    return hashlib.sha256(("%s:%s" % (PROMPT_VERSION, normalized)).encode()).hexdigest()
+
+def get_cached_adventure(key):
+    now = timezone.now()
+    entry = Cached_Adventure.objects.filter(key=key, expires_at__gt=now).first()
+    if entry is None:
+        increment_counter('generation_cache_misses')
+        return None
+
+    Cached_Adventure.objects.filter(pk=entry.pk).update(last_accessed=now, hits=F('hits') + 1)
+    increment_counter('generation_cache_hits')
+    return entry.adventure
+
+def cache_adventure(key, params, adventure):
+    now = timezone.now()
+    Cached_Adventure.objects.update_or_create(key=key, defaults={
+        'params': params,
+        'prompt_version': PROMPT_VERSION,
+        'adventure': adventure,
+        'expires_at': now + timedelta(seconds=settings.GENERATION_CACHE_TTL),
+        'last_accessed': now,
+    })
+    evict_adventures()
+
+def evict_adventures():
+    Cached_Adventure.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    # Least recently used entries beyond the size limit are removed
+    stale = list(Cached_Adventure.objects.order_by('-last_accessed').values_list('pk', flat=True)[settings.GENERATION_CACHE_MAX_ENTRIES:])
+    if stale:
+        Cached_Adventure.objects.filter(pk__in=stale).delete()
+
+def find_adventure(params, fresh=False):
+    """ Looks for a ready adventure for the given generation parameters, first in the cache (unless a fresh one is requested) and then in the pool """
+    key = cache_key(params)
+    record_request(key, params)
+
+    adventure = None if fresh else get_cached_adventure(key)
+    if adventure is None:
+        adventure = claim_pooled_adventure(key)
+        if adventure is not None:
+            cache_adventure(key, params, adventure)
+    return key, adventure
+
+def generate_cached_adventure(params, fresh=False, user=None):
+    """ Returns the adventure for the given generation parameters, generating it only if none is ready.
+    When a user is given, the request is admitted for them only if it generates, so cache and pool hits and requests that share another's generation are never throttled """
+    key, adventure = find_adventure(params, fresh)
+    if adventure is not None:
+        return adventure
+
+    def generate():
+        with admitted(user) if user is not None else nullcontext():
+            return generate_and_cache(key, params)
+
+    if fresh:
+        # A fresh adventure is generated for this request alone, so it never gets the result of another request's flight
+        return generate()
+
+    # Identical requests that arrive while this one is generating share its result
+    return single_flight(key, generate)
+
+def generate_and_cache(key, params):
+    adventure = dump_adventure(create_adventure(**params))
+    cache_adventure(key, params, adventure)
+    return adventure
+
+def generate_cached_adventure_model(params, fresh=False, user=None):
+    """ Like generate_cached_adventure, but returns the validated Adventure model """
+    return load_adventure(generate_cached_adventure(params, fresh, user))
+
+def cache_stats():
+    hits = get_counter('generation_cache_hits')
+    misses = get_counter('generation_cache_misses')
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        'entries': Cached_Adventure.objects.filter(expires_at__gt=timezone.now()).count(),
+    }
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from .models import Generation_Job
+from .generation_cache import generate_cached_adventure
+from .circuit_breaker import ServiceUnavailable, check_available
+from .palm import ProviderUnavailable
+import time
+
+def submit_job(user, params, fresh=False):
+    return Generation_Job.objects.create(user_id=user, params=params, fresh=fresh)
+
+def claim_job(worker):
+    """ Claims the oldest queued job, or a running job whose worker stopped before finishing it """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.GENERATION_JOB_LEASE)
+    claimable = Q(status='queued') | Q(status='running', started_at__lt=stale, attempts__lt=settings.GENERATION_JOB_MAX_ATTEMPTS)
+
+    # A job whose worker stopped on its last attempt is not retried, so it fails rather than staying running forever
+    Generation_Job.objects.filter(status='running', started_at__lt=stale, attempts__gte=settings.GENERATION_JOB_MAX_ATTEMPTS).update(
+        status='failed', error='Generation did not finish after %s attempts' % settings.GENERATION_JOB_MAX_ATTEMPTS, finished_at=now)
+
+    for job in Generation_Job.objects.filter(claimable).order_by('created_at')[:10]:
+        # The conditional update only succeeds for one worker, so each job is claimed once
+        claimed = Generation_Job.objects.filter(claimable, pk=job.pk, attempts=job.attempts).update(
+            status='running', worker=worker, started_at=now, attempts=job.attempts + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+def requeue_job(job):
+    # The attempt is not counted, since the job never reached the provider
+    Generation_Job.objects.filter(pk=job.pk, status='running', worker=job.worker).update(
+        status='queued', worker=None, started_at=None, attempts=job.attempts - 1)
+
+def run_job(job):
+    try:
+        job.result = generate_cached_adventure(job.params, fresh=job.fresh)
+        job.status = 'complete'
+    except ProviderUnavailable:
+        requeue_job(job)
+        return
+    except Exception as e:
+        print("Unable to run generation job %s because %s" % (job.pk, e))
+        job.error = 'Something went wrong when generating adventure'
+        job.status = 'failed'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'error', 'status', 'finished_at'])
+
+def work(worker):
+    while True:
+        close_old_connections()
+        try:
+            # Jobs stay queued while calls to the provider would fail fast
+            check_available()
+        except ServiceUnavailable as e:
+            time.sleep(e.wait)
+            continue
+        job = claim_job(worker)
+        if job is None:
+            time.sleep(settings.GENERATION_JOB_POLL_INTERVAL)
+        else:
+            run_job(job)
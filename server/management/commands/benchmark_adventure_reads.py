@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from server.adventure_json import adventure_document, orjson, render_json
+from server.adventure_tree import create_adventure_tree
+from server.models import Adventure
+from server.serializers import AdventureSerializer, adventure_prefetch
+import time
+
+class Rollback(Exception):
+    pass
+
+def serializer_read(adventure_id):
+    adventure = Adventure.objects.prefetch_related(*adventure_prefetch).get(pk=adventure_id)
+    return JSONRenderer().render(AdventureSerializer(adventure).data)
+
+def values_read(adventure_id):
+    return render_json(adventure_document(adventure_id))
+
+def best_time(read, adventure_id, repeat):
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        read(adventure_id)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+class Command(BaseCommand):
+    help = 'Compares reading adventure trees through AdventureSerializer with the .values() read path in server.adventure_json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--encounters', type=int, default=3, help='Encounters in each scene')
+        parser.add_argument('--custom-fields', type=int, default=2, help='Custom fields on the adventure and on each scene and encounter')
+        parser.add_argument('--repeat', type=int, default=5, help='Reads of each adventure with each path, of which the fastest is reported')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Encoder: %s' % ('orjson' if orjson else 'JSONRenderer'))
+        self.stdout.write('%8s %12s %12s %12s %8s %8s' % ('scenes', 'bytes', 'serializer', 'values', 'speedup', 'match'))
+        # The adventures are created in a transaction that is rolled back, so nothing is left behind
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='benchmark_adventure_reads')
+                for scenes in options['scenes']:
+                    self.benchmark(user, scenes, options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def benchmark(self, user, scenes, options):
+        def custom_fields():
+            return [{'name': 'Field %s' % i, 'value': 'A custom value that is about as long as a real one'} for i in range(options['custom_fields'])]
+
+        ids = create_adventure_tree(user, {
+            'title': 'Benchmark',
+            'game': 'Dungeons & Dragons',
+            'exposition': 'Exposition ' * 20,
+            'climax': 'Climax ' * 20,
+            'custom_field_set': custom_fields(),
+            'scene_set': [
+                {
+                    'sequence': sequence,
+                    'challenge': 'Challenge ' * 20,
+                    'setting': 'Setting ' * 20,
+                    'custom_field_set': custom_fields(),
+                    'encounter_set': [{'encounter_type': 'combat', 'description': 'Description ' * 20, 'stats': 'Stats ' * 20, 'custom_field_set': custom_fields()} for i in range(options['encounters'])],
+                }
+                for sequence in range(1, scenes + 1)
+            ],
+        })
+
+        serialized = serializer_read(ids['id'])
+        serializer_time = best_time(serializer_read, ids['id'], options['repeat'])
+        values_time = best_time(values_read, ids['id'], options['repeat'])
+        match = serialized == values_read(ids['id'])
+        self.stdout.write('%8s %12s %11.1fms %11.1fms %7.1fx %8s' % (scenes, len(serialized), serializer_time * 1000, values_time * 1000, serializer_time / values_time, 'yes' if match else 'NO'))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from server.adventure_pool import fill_pool
+import time
+
+class Command(BaseCommand):
+    help = 'Keeps ready-made adventures on hand for the most requested generation parameters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Fill the pool once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            fill_pool()
+            if options['once']:
+                break
+            time.sleep(settings.ADVENTURE_POOL_INTERVAL)
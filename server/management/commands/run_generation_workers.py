@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from server.jobs import work
+import multiprocessing
+import socket
+
+class Command(BaseCommand):
+    help = 'Runs a pool of worker processes that generate adventures for queued generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.GENERATION_WORKERS)
+
+    def handle(self, *args, **options):
+        # Each process opens its own database connection
+        connections.close_all()
+
+        processes = []
+        for i in range(options['workers']):
+            worker = '%s-%s' % (socket.gethostname(), i)
+            process = multiprocessing.Process(target=work, args=(worker,), daemon=True)
+            process.start()
+            processes.append(process)
+
+        self.stdout.write('Started %s generation workers' % len(processes))
+        for process in processes:
+            process.join()
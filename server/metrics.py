@@ -0,0 +1,56 @@
+from collections import Counter
+from datetime import timedelta
+from django.utils import timezone
+from .models import Generation_Metric
+
+def record_call(call):
+    Generation_Metric.objects.create(
+        operation=call.operation,
+        model=call.model,
+        attempt=call.attempt,
+        wall_time=call.wall_time,
+        time_to_first_token=call.time_to_first_token,
+        prompt_tokens=call.prompt_tokens,
+        output_tokens=call.output_tokens,
+        finish_reason=call.finish_reason,
+        block_reason=call.block_reason,
+        validation_errors=call.validation_errors,
+        error=call.error,
+    )
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    # Nearest-rank percentiles
+    return {'p%s' % point: values[min(len(values) - 1, max(0, -(-point * len(values) // 100) - 1))] for point in points}
+
+def summarize_calls(hours=24):
+    """ Aggregates the provider calls of the last few hours by operation """
+    since = timezone.now() - timedelta(hours=hours)
+    calls = Generation_Metric.objects.filter(created_at__gte=since).values(
+        'operation', 'attempt', 'wall_time', 'time_to_first_token', 'prompt_tokens', 'output_tokens',
+        'finish_reason', 'block_reason', 'validation_errors', 'error')
+
+    by_operation = {}
+    for call in calls:
+        by_operation.setdefault(call['operation'], []).append(call)
+
+    summary = {}
+    for operation, operation_calls in by_operation.items():
+        failed = [call for call in operation_calls if call['error'] or call['validation_errors']]
+        summary[operation] = {
+            'calls': len(operation_calls),
+            'failures': len(failed),
+            'error_rate': len(failed) / len(operation_calls),
+            'retries': sum(1 for call in operation_calls if call['attempt'] > 1),
+            'wall_time': percentiles(call['wall_time'] for call in operation_calls),
+            'time_to_first_token': percentiles(call['time_to_first_token'] for call in operation_calls),
+            'prompt_tokens': percentiles(call['prompt_tokens'] for call in operation_calls),
+            'output_tokens': percentiles(call['output_tokens'] for call in operation_calls),
+            'finish_reasons': Counter(call['finish_reason'] for call in operation_calls if call['finish_reason']),
+            'block_reasons': Counter(call['block_reason'] for call in operation_calls if call['block_reason']),
+            'validation_errors': Counter(error for call in operation_calls for error in call['validation_errors']),
+            'errors': Counter(call['error'] for call in operation_calls if call['error']),
+        }
+    return summary
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0014_generation_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generation_job',
+            name='fresh',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='Cached_Adventure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('params', models.JSONField()),
+                ('prompt_version', models.IntegerField()),
+                ('adventure', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('last_accessed', models.DateTimeField()),
+                ('hits', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'cached_adventure',
+                'indexes': [models.Index(fields=['last_accessed'], name='cached_adve_last_ac_ffec03_idx'), models.Index(fields=['expires_at'], name='cached_adve_expires_9840e5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0015_cached_adventure_generation_job_fresh'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pooled_Adventure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('params', models.JSONField()),
+                ('prompt_version', models.IntegerField()),
+                ('adventure', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'pooled_adventure',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['key', 'claimed_at'], name='pooled_adve_key_1060d4_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Generation_Request_Stat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('params', models.JSONField()),
+                ('count', models.IntegerField(default=0)),
+                ('last_requested', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'generation_request_stat',
+                'indexes': [models.Index(fields=['last_requested', 'count'], name='generation__last_re_e6764d_idx')],
+            },
+        ),
+    ]
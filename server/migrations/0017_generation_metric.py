@@ -0,0 +1,35 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0016_pooled_adventure_generation_request_stat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generation_Metric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('operation', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=80)),
+                ('attempt', models.IntegerField()),
+                ('wall_time', models.FloatField()),
+                ('time_to_first_token', models.FloatField(blank=True, null=True)),
+                ('prompt_tokens', models.IntegerField(blank=True, null=True)),
+                ('output_tokens', models.IntegerField(blank=True, null=True)),
+                ('finish_reason', models.CharField(blank=True, max_length=40, null=True)),
+                ('block_reason', models.CharField(blank=True, max_length=40, null=True)),
+                ('validation_errors', models.JSONField(default=list)),
+                ('error', models.CharField(blank=True, max_length=80, null=True)),
+            ],
+            options={
+                'db_table': 'generation_metric',
+                'indexes': [models.Index(fields=['created_at', 'operation'], name='generation__created_454130_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('server', '0017_generation_metric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rate_Bucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=80, unique=True)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'rate_bucket',
+            },
+        ),
+        migrations.CreateModel(
+            name='Generation_Slot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('run', 'run'), ('wait', 'wait')], max_length=4)),
+                ('number', models.IntegerField()),
+                ('token', models.CharField(blank=True, max_length=32, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('user_id', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'generation_slot',
+                'unique_together': {('kind', 'number')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0018_generation_slot_rate_bucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generation_Flight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'generation_flight',
+            },
+        ),
+    ]
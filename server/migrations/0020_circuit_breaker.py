@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0019_generation_flight'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Circuit_Breaker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=80, unique=True)),
+                ('state', models.CharField(choices=[('closed', 'closed'), ('open', 'open'), ('half_open', 'half_open')], default='closed', max_length=9)),
+                ('window_started_at', models.DateTimeField()),
+                ('calls', models.IntegerField(default=0)),
+                ('failures', models.IntegerField(default=0)),
+                ('slow_calls', models.IntegerField(default=0)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('probe_expires_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'circuit_breaker',
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:50
+
+from django.db import migrations, models
+
+
+progress_points = {'Not Started': 0, 'In Progress': 50, 'Complete': 100}
+
+
+def count_progress(apps, schema_editor):
+    Adventure = apps.get_model('server', 'Adventure')
+    Scene = apps.get_model('server', 'Scene')
+    Encounter = apps.get_model('server', 'Encounter')
+
+    totals = {}
+    for adventure_id, progress in Scene.objects.order_by().values_list('adventure_id', 'progress'):
+        points, items = totals.get(adventure_id, (0, 0))
+        totals[adventure_id] = (points + progress_points.get(progress, 0), items + 1)
+    for adventure_id, progress in Encounter.objects.order_by().values_list('scene_id__adventure_id', 'progress'):
+        points, items = totals.get(adventure_id, (0, 0))
+        totals[adventure_id] = (points + progress_points.get(progress, 0), items + 1)
+
+    for adventure in Adventure.objects.only('pk', 'climax', 'climax_progress'):
+        points, items = totals.get(adventure.pk, (0, 0))
+        if adventure.climax:
+            points, items = points + adventure.climax_progress, items + 1
+        Adventure.objects.filter(pk=adventure.pk).update(progress_points=points, progress_items=items, progress=points / items if items else 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0020_circuit_breaker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adventure',
+            name='progress_items',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='adventure',
+            name='progress_points',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(count_progress, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0021_adventure_progress_points'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adventure',
+            index=models.Index(fields=['user_id', 'created_at'], name='adventure_user_id_84df9a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adventure',
+            index=models.Index(fields=['user_id', 'status', 'id'], name='adventure_user_id_6a0895_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adventure',
+            index=models.Index(fields=['user_id', 'game', 'id'], name='adventure_user_id_6708df_idx'),
+        ),
+    ]
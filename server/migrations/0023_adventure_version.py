@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0022_adventure_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adventure',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='adventure',
+            name='version',
+            field=models.IntegerField(default=1),
+        ),
+    ]
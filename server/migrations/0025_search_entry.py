@@ -0,0 +1,91 @@
+# Generated by Django 4.2.13 on 2026-10-18 17:06
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+indexed_fields = {
+    'Adventure': ['title', 'exposition', 'incitement', 'climax'],
+    'Scene': ['challenge', 'setting', 'plot_twist', 'clue'],
+    'Encounter': ['description', 'stats'],
+    'Custom_Field': ['value'],
+}
+
+sqlite_index = [
+    "CREATE VIRTUAL TABLE search_entry_fts USING fts5(text, content='search_entry', content_rowid='id')",
+    "CREATE TRIGGER search_entry_insert AFTER INSERT ON search_entry BEGIN "
+    "INSERT INTO search_entry_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER search_entry_delete AFTER DELETE ON search_entry BEGIN "
+    "INSERT INTO search_entry_fts(search_entry_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER search_entry_update AFTER UPDATE ON search_entry BEGIN "
+    "INSERT INTO search_entry_fts(search_entry_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO search_entry_fts(rowid, text) VALUES (new.id, new.text); END",
+]
+
+
+def create_index(apps, schema_editor):
+    # MySQL indexes the text in place. SQLite keeps an FTS5 table in step with search_entry through triggers
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE search_entry ADD FULLTEXT INDEX search_entry_text (text)')
+    elif schema_editor.connection.vendor == 'sqlite':
+        for statement in sqlite_index:
+            schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE search_entry DROP INDEX search_entry_text')
+    elif schema_editor.connection.vendor == 'sqlite':
+        for trigger in ['search_entry_insert', 'search_entry_delete', 'search_entry_update']:
+            schema_editor.execute('DROP TRIGGER %s' % trigger)
+        schema_editor.execute('DROP TABLE search_entry_fts')
+
+
+def index_adventures(apps, schema_editor):
+    Search_Entry = apps.get_model('server', 'Search_Entry')
+    # The adventure each row belongs to, and the search entry field that refers to the row
+    owners = [
+        ('Adventure', F('pk'), None),
+        ('Scene', F('adventure_id'), 'scene_id_id'),
+        ('Encounter', F('scene_id__adventure_id'), 'encounter_id_id'),
+        ('Custom_Field', Coalesce('adventure_id', 'scene_id__adventure_id', 'encounter_id__scene_id__adventure_id'), 'custom_field_id_id'),
+    ]
+
+    batch = []
+    for model_name, adventure, owner in owners:
+        fields = indexed_fields[model_name]
+        for row in apps.get_model('server', model_name).objects.order_by().values('pk', *fields, owning_adventure=adventure).iterator():
+            text = '\n'.join(row[field] for field in fields if row[field])
+            batch.append(Search_Entry(adventure_id_id=row['owning_adventure'], text=text, **({owner: row['pk']} if owner else {})))
+            if len(batch) == 1000:
+                Search_Entry.objects.bulk_create(batch)
+                batch = []
+    Search_Entry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0024_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Search_Entry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(blank=True)),
+                ('adventure_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server.adventure')),
+                ('custom_field_id', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='server.custom_field')),
+                ('encounter_id', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='server.encounter')),
+                ('scene_id', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='server.scene')),
+            ],
+            options={
+                'db_table': 'search_entry',
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_adventures, migrations.RunPython.noop),
+    ]
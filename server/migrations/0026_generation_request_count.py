@@ -0,0 +1,27 @@
+# Generated by Django 4.2.13 on 2026-10-18 17:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0025_search_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generation_Request_Count',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('stat_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server.generation_request_stat')),
+            ],
+            options={
+                'db_table': 'generation_request_count',
+                'unique_together': {('stat_id', 'day')},
+            },
+        ),
+    ]
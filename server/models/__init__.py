@@ -2,4 +2,16 @@ from .adventure import Adventure
 from .custom_field import Custom_Field
 from .encounter import Encounter
 from .scene import Scene
-from .odyssey_token import Odyssey_Token
\ No newline at end of file
+from .odyssey_token import Odyssey_Token
+from .generation_job import Generation_Job
+from .cached_adventure import Cached_Adventure
+from .pooled_adventure import Pooled_Adventure
+from .generation_request_stat import Generation_Request_Stat
+from .generation_metric import Generation_Metric
+from .generation_slot import Generation_Slot
+from .rate_bucket import Rate_Bucket
+from .generation_flight import Generation_Flight
+from .circuit_breaker import Circuit_Breaker
+from .counter import Counter
+from .search_entry import Search_Entry
+from .generation_request_count import Generation_Request_Count
\ No newline at end of file
@@ -19,8 +19,20 @@ class Adventure(models.Model):
     climax_progress = models.FloatField(default=0)
     denoument = models.TextField(blank=True, null=True, validators=[safe_text_validator])
     progress = models.FloatField(default=0)
+    # Maintained by server.progress, so progress can be adjusted without counting scenes and encounters
+    progress_points = models.FloatField(default=0)
+    progress_items = models.IntegerField(default=0)
+    # Bumped by server.versions whenever the adventure or anything in it changes
+    version = models.IntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length = 10, choices = statuses, default='active')
 
     class Meta:
         db_table = 'adventure'
-        ordering = ['user_id', '-created_at']
\ No newline at end of file
+        ordering = ['user_id', '-created_at']
+        # Listings filter by user and optionally status or game, and page through the results by id
+        indexes = [
+            models.Index(fields=['user_id', 'created_at']),
+            models.Index(fields=['user_id', 'status', 'id']),
+            models.Index(fields=['user_id', 'game', 'id']),
+        ]
\ No newline at end of file
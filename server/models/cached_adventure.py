@@ -0,0 +1,15 @@
+from django.db import models
+
+class Cached_Adventure(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    params = models.JSONField()
+    prompt_version = models.IntegerField()
+    adventure = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    last_accessed = models.DateTimeField()
+    hits = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'cached_adventure'
+        indexes = [models.Index(fields=['last_accessed']), models.Index(fields=['expires_at'])]
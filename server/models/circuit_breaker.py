@@ -0,0 +1,16 @@
+from django.db import models
+
+class Circuit_Breaker(models.Model):
+    states = [('closed', 'closed'), ('open', 'open'), ('half_open', 'half_open')]
+
+    name = models.CharField(max_length=80, unique=True)
+    state = models.CharField(max_length=9, choices=states, default='closed')
+    window_started_at = models.DateTimeField()
+    calls = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    slow_calls = models.IntegerField(default=0)
+    opened_at = models.DateTimeField(blank=True, null=True)
+    probe_expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'circuit_breaker'
@@ -0,0 +1,8 @@
+from django.db import models
+
+class Counter(models.Model):
+    name = models.CharField(max_length=80, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'counter'
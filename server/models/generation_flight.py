@@ -0,0 +1,10 @@
+from django.db import models
+
+class Generation_Flight(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    result = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'generation_flight'
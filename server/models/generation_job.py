@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+class Generation_Job(models.Model):
+    statuses = [('queued', 'queued'), ('running', 'running'), ('complete', 'complete'), ('failed', 'failed')]
+
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE)
+    params = models.JSONField()
+    fresh = models.BooleanField(default=False)
+    status = models.CharField(max_length = 10, choices = statuses, default = 'queued')
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length = 80, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'generation_job'
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
@@ -0,0 +1,19 @@
+from django.db import models
+
+class Generation_Metric(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    operation = models.CharField(max_length=20)
+    model = models.CharField(max_length=80)
+    attempt = models.IntegerField()
+    wall_time = models.FloatField()
+    time_to_first_token = models.FloatField(blank=True, null=True)
+    prompt_tokens = models.IntegerField(blank=True, null=True)
+    output_tokens = models.IntegerField(blank=True, null=True)
+    finish_reason = models.CharField(max_length=40, blank=True, null=True)
+    block_reason = models.CharField(max_length=40, blank=True, null=True)
+    validation_errors = models.JSONField(default=list)
+    error = models.CharField(max_length=80, blank=True, null=True)
+
+    class Meta:
+        db_table = 'generation_metric'
+        indexes = [models.Index(fields=['created_at', 'operation'])]
@@ -0,0 +1,12 @@
+from django.db import models
+from .generation_request_stat import Generation_Request_Stat
+
+class Generation_Request_Count(models.Model):
+    """ The number of times a combination of generation parameters was requested on one day """
+    stat_id = models.ForeignKey(Generation_Request_Stat, on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'generation_request_count'
+        unique_together = [('stat_id', 'day')]
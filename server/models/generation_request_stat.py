@@ -0,0 +1,11 @@
+from django.db import models
+
+class Generation_Request_Stat(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    params = models.JSONField()
+    count = models.IntegerField(default=0)
+    last_requested = models.DateTimeField()
+
+    class Meta:
+        db_table = 'generation_request_stat'
+        indexes = [models.Index(fields=['last_requested', 'count'])]
@@ -0,0 +1,15 @@
+from django.contrib.auth.models import User
+from django.db import models
+
+class Generation_Slot(models.Model):
+    kinds = [('run', 'run'), ('wait', 'wait')]
+
+    kind = models.CharField(max_length=4, choices=kinds)
+    number = models.IntegerField()
+    user_id = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL)
+    token = models.CharField(max_length=32, blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'generation_slot'
+        unique_together = [('kind', 'number')]
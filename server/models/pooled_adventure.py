@@ -0,0 +1,14 @@
+from django.db import models
+
+class Pooled_Adventure(models.Model):
+    key = models.CharField(max_length=64)
+    params = models.JSONField()
+    prompt_version = models.IntegerField()
+    adventure = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'pooled_adventure'
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['key', 'claimed_at'])]
@@ -0,0 +1,9 @@
+from django.db import models
+
+class Rate_Bucket(models.Model):
+    key = models.CharField(max_length=80, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'rate_bucket'
@@ -0,0 +1,16 @@
+from django.db import models
+from .adventure import Adventure
+from .scene import Scene
+from .encounter import Encounter
+from .custom_field import Custom_Field
+
+class Search_Entry(models.Model):
+    # The searchable text of an adventure, or of one of its scenes, encounters or custom fields, which is full-text indexed by server.search
+    adventure_id = models.ForeignKey(Adventure, on_delete=models.CASCADE)
+    scene_id = models.ForeignKey(Scene, blank=True, null=True, on_delete=models.CASCADE)
+    encounter_id = models.ForeignKey(Encounter, blank=True, null=True, on_delete=models.CASCADE)
+    custom_field_id = models.ForeignKey(Custom_Field, blank=True, null=True, on_delete=models.CASCADE)
+    text = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'search_entry'
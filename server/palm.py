@@ -1,10 +1,34 @@
-import google.generativeai as gemini
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-import instructor
 import json
-import os
-from pydantic import AfterValidator, BaseModel
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pydantic import AfterValidator, BaseModel, TypeAdapter, ValidationError
 from typing import Annotated, List, Optional
+from .providers import get_provider
+
+# Increment whenever the prompt or response models change so cached adventures from older prompts are not reused
+PROMPT_VERSION = 1
+
+# Every call to Gemini while generating an adventure, including repairs, counts against one budget
+MAX_ATTEMPTS = 4
+DEADLINE = 90
+BACKOFF_BASE = 1
+BACKOFF_CAP = 8
+
+# max_output_tokens is sized from the requested scenes and encounters, within these limits
+MIN_OUTPUT_TOKENS = 1024
+MAX_OUTPUT_TOKENS = 8192
+BASE_OUTPUT_TOKENS = 400
+SCENE_OUTPUT_TOKENS = 200
+ENCOUNTER_OUTPUT_TOKENS = 150
+
+# Responses cut off by the output limit are continued at most this many times
+MAX_CONTINUATIONS = 2
+STITCH_WINDOW = 200
+
+# Scenes expanded from an outline are requested concurrently, up to this many at once
+FAN_OUT_WORKERS = 8
 
 def length_limit_validator(text):
     if len(text) >= 500:
@@ -25,37 +49,134 @@ class Scene(BaseModel):
     clue: Optional[str] = None
     encounters: List[Encounter]
 
+ExpositionText = Annotated[str, AfterValidator(length_limit_validator)]
+
 class Adventure(BaseModel):
     """ A complete storyline for an RPG adventure with a full plot, including exposition, incitement, rising action, climax, and denoument """
-    Exposition: Annotated[str, AfterValidator(length_limit_validator)]
+    Exposition: ExpositionText
     Incitement: str
     Rising_Action: List[Scene]
     Climax: str
     Denoument: str
 
-def generate_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None):
-    api_key = os.environ.get('API_KEY')
-    null_plot_twists = 100 - plot_twists
-    null_clues = 100 - clues
+class AdventureOutline(BaseModel):
+    """ A compact outline of an adventure, with a one-line summary of each scene in the rising action """
+    Exposition: ExpositionText
+    Incitement: str
+    Rising_Action: List[str]
+    Climax: str
+    Denoument: str
+
+def dump_adventure(adventure):
+    """ Converts an Adventure model to the dictionary returned by the API, which names the rising action "Rising Action" """
+    return {("Rising Action" if key == "Rising_Action" else key): value for key, value in adventure.model_dump().items()}
+
+def load_adventure(data):
+    return Adventure.model_validate({("Rising_Action" if key == "Rising Action" else key): value for key, value in data.items()})
+
+# Validators for each part of an adventure, used to check parts as they arrive from a streamed response
+part_validators = {
+    "Exposition": TypeAdapter(ExpositionText),
+    "Incitement": TypeAdapter(str),
+    "Rising_Action": TypeAdapter(Scene),
+    "Climax": TypeAdapter(str),
+    "Denoument": TypeAdapter(str),
+}
+
+class AdventureStreamParser:
+    """ Incrementally parses streamed adventure JSON, returning each top-level field and each scene of the rising action as soon as it is complete """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.expecting = None
+        self.key = None
+        self.value_start = None
+        self.item_start = None
+
+    def feed(self, text):
+        parts = []
+        self.buffer += text
 
-    gemini.configure(api_key=api_key)
-    config = {
-        "temperature": 0.95,
-        "candidate_count": 1,
-        "top_k": 10000,
-        "top_p": 0.95,
-        "max_output_tokens": 1024,
-        "stop_sequences": [],
-    }
-    safety_settings={
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_ONLY_HIGH,
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE
-    }
-    model = gemini.GenerativeModel(model_name="gemini-1.5-flash", safety_settings=safety_settings, generation_config=config)
+        while self.position < len(self.buffer):
+            i = self.position
+            char = self.buffer[i]
+            self.position += 1
 
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expecting == "key":
+                        self.key = json.loads(self.buffer[self.string_start:i + 1])
+                        self.expecting = "colon"
+                    elif self.depth == 1 and self.value_start == self.string_start:
+                        parts.append((self.key, json.loads(self.buffer[self.value_start:i + 1])))
+                        self.value_start = None
+                        self.expecting = None
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+                if self.depth == 1 and self.expecting == "value":
+                    self.value_start = i
+                    self.expecting = None
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.expecting = "key"
+                elif self.depth == 2 and self.expecting == "value":
+                    self.value_start = i
+                    self.expecting = None
+                elif self.depth == 3 and self.key == "Rising_Action" and self.buffer[self.value_start] == "[":
+                    self.item_start = i
+            elif char in "}]":
+                if self.depth == 1 and self.value_start is not None:
+                    parts.append((self.key, json.loads(self.buffer[self.value_start:i])))
+                    self.value_start = None
+                self.depth -= 1
+                if self.depth == 2 and self.item_start is not None:
+                    parts.append((self.key, json.loads(self.buffer[self.item_start:i + 1])))
+                    self.item_start = None
+                elif self.depth == 1 and self.value_start is not None:
+                    if self.key != "Rising_Action":
+                        parts.append((self.key, json.loads(self.buffer[self.value_start:i + 1])))
+                    self.value_start = None
+            elif self.depth == 1:
+                if char == ":" and self.expecting == "colon":
+                    self.expecting = "value"
+                elif char == ",":
+                    if self.value_start is not None:
+                        parts.append((self.key, json.loads(self.buffer[self.value_start:i])))
+                        self.value_start = None
+                    self.expecting = "key"
+                elif not char.isspace() and self.expecting == "value":
+                    # Scalar values such as null or numbers end at the next comma or closing brace
+                    self.value_start = i
+                    self.expecting = None
+
+        return parts
+
+    def unterminated(self):
+        return self.depth > 0 or self.in_string
+
+def output_token_limit(scenes, encounters):
+    """ Estimates the output tokens needed for an adventure of the requested size """
+    estimate = BASE_OUTPUT_TOKENS + int(scenes) * (SCENE_OUTPUT_TOKENS + int(encounters) * ENCOUNTER_OUTPUT_TOKENS)
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, estimate))
+
+def get_model(**config_overrides):
+    return get_provider().model(**config_overrides)
+
+def describe_adventure(game, players, homebrew_description=None, campaign_setting=None, level=None, experience=None):
     prompt = f"""Write an adventure for the {game} roleplaying game, """
     
     if campaign_setting is not None:
@@ -76,6 +197,14 @@ def generate_adventure(game, players, scenes, encounters, plot_twists, clues, ho
         {homebrew_description}
         """
 
+    return prompt
+
+def build_prompt(game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None):
+    null_plot_twists = 100 - plot_twists
+    null_clues = 100 - clues
+
+    prompt = describe_adventure(game, players, homebrew_description, campaign_setting, level, experience)
+
     prompt += f"""The rising action should include {scenes} scenes. Each encounter is a trap, enemies, a puzzle (in which case, describe the solution), or some other obstacle. Respond in JSON using the following format:
     {{
         Exposition: "Background knowledge the players might possess, if any, or prologue. Use up to 400 characters for the exposition.",
@@ -103,24 +232,562 @@ def generate_adventure(game, players, scenes, encounters, plot_twists, clues, ho
     if context is not None:
         prompt += "\n" + context
 
-    client = instructor.from_gemini(
-        client=model,
-        mode=instructor.Mode.GEMINI_JSON
-    )
+    return prompt
+
+class GenerationError(Exception):
+    """ Raised when an adventure cannot be generated within the retry budget """
+
+class ProviderUnavailable(GenerationError):
+    """ Raised before calling Gemini while it is known to be failing, so the request fails fast instead of retrying """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RetryBudget:
+    """ A single budget of LLM calls and wall-clock time shared by every retry and repair while generating an adventure """
+
+    def __init__(self, attempts=MAX_ATTEMPTS, deadline=DEADLINE):
+        self.attempts = attempts
+        self.used = 0
+        self.deadline = time.monotonic() + deadline
+        # Concurrent calls, such as the scenes expanded from an outline, spend from one budget
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
 
-    for i in range(3):
+    def spend(self):
+        with self.lock:
+            if self.used >= self.attempts or self.remaining() <= 0:
+                raise GenerationError("Retry budget exhausted after %s attempts" % self.used)
+            self.used += 1
+
+    def backoff(self):
+        # Full jitter keeps retries from many workers from arriving at the provider together
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (self.used - 1)))
+        time.sleep(max(0, min(delay, self.remaining())))
+
+def parse_json(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json")
+    return json.loads(text)
+
+# Functions called with each ProviderCall once it is finished, such as server.metrics.record_call
+call_observers = []
+
+# Functions called with each ProviderCall before the call is made, which raise ProviderUnavailable to prevent it, such as server.circuit_breaker.allow_call
+call_guards = []
+
+# Functions called on a worker thread once it has made its calls, such as closing the database connections the call_guards and call_observers opened on it
+worker_finalizers = []
+
+def in_worker(function):
+    """ Wraps a function run on a worker thread so the worker_finalizers run after it """
+    def run(*args):
         try:
-            response = client.chat.completions.create(
-                messages=[{
-                    'role': 'user',
-                    'content': prompt
-                }],
-                response_model=Adventure,
-                max_retries=3
-            )
-            if isinstance(response, Adventure):
-                break
+            return function(*args)
+        finally:
+            for finalizer in worker_finalizers:
+                finalizer()
+    return run
+
+class ProviderCall:
+    """ Measurements of a single call to Gemini, passed to each of the call_observers once its response has been validated """
+
+    def __init__(self, operation, attempt):
+        self.operation = operation
+        self.attempt = attempt
+        self.model = get_provider().model_name
+        self.started = time.monotonic()
+        self.wall_time = None
+        self.time_to_first_token = None
+        self.prompt_tokens = None
+        self.output_tokens = None
+        self.finish_reason = None
+        self.block_reason = None
+        self.validation_errors = []
+        self.error = None
+        self.finished = False
+        # Set by a guard when this call tests whether Gemini has recovered
+        self.probe = False
+
+        for guard in call_guards:
+            guard(self)
+
+    def first_token(self):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.started
+
+    def observe(self, response):
+        self.wall_time = time.monotonic() - self.started
+
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_token_count
+            self.output_tokens = usage.candidates_token_count
+
+        feedback = getattr(response, "prompt_feedback", None)
+        if feedback is not None and feedback.block_reason:
+            self.block_reason = feedback.block_reason.name
+
+        if response.candidates:
+            self.finish_reason = response.candidates[0].finish_reason.name
+            if self.finish_reason == "SAFETY":
+                self.block_reason = "SAFETY"
+
+    def finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+
+        if self.wall_time is None:
+            self.wall_time = time.monotonic() - self.started
+        if isinstance(error, ValidationError):
+            self.validation_errors = sorted({detail["type"] for detail in error.errors()})
+        elif error is not None:
+            self.error = type(error).__name__
+
+        for observer in call_observers:
+            try:
+                observer(self)
+            except Exception as e:
+                print("Unable to record provider call because %s" % e)
+
+def is_truncated(text, finish_reason):
+    """ Whether a response stopped at the output limit or in the middle of a JSON structure """
+    if finish_reason == "MAX_TOKENS":
+        return True
+    parser = AdventureStreamParser()
+    parser.buffer = text
+    parser.feed("")
+    return parser.unterminated()
+
+def continuation_contents(prompt, partial):
+    return [
+        {"role": "user", "parts": [prompt]},
+        {"role": "model", "parts": [partial]},
+        {"role": "user", "parts": ["Your response was cut off. Continue it exactly where it stopped, without repeating anything or adding any other text."]},
+    ]
+
+def stitch(partial, continuation):
+    """ Appends a continuation to a partial response, dropping any text the continuation repeated """
+    continuation = continuation.lstrip("`").removeprefix("json").lstrip() if continuation.startswith("```") else continuation
+    # Short overlaps are usually coincidence rather than repetition
+    for overlap in range(min(len(partial), len(continuation), STITCH_WINDOW), 9, -1):
+        if partial.endswith(continuation[:overlap]):
+            return partial + continuation[overlap:]
+    return partial + continuation
+
+def continue_response(model, prompt, text, finish_reason, budget):
+    """ Requests continuations of a truncated response instead of regenerating it, returning the stitched text """
+    for i in range(MAX_CONTINUATIONS):
+        if not is_truncated(text, finish_reason):
+            break
+        # Each continuation is a call of its own, so it is counted against the budget. A truncated response left by an exhausted budget fails to parse
+        try:
+            budget.spend()
+        except GenerationError:
+            break
+        call = ProviderCall("continuation", budget.used)
+        try:
+            # A continuation is a fragment of JSON, so it is requested as plain text
+            response = model.generate_content(continuation_contents(prompt, text), generation_config={"response_mime_type": "text/plain"}, request_options={"timeout": max(1, budget.remaining())})
+            call.observe(response)
+            text = stitch(text, response.text)
+            finish_reason = call.finish_reason
+            call.finish()
+        except Exception as e:
+            call.finish(e)
+            break
+    return text
+
+def request_json(model, prompt, budget, operation):
+    """ Requests JSON from the model, returning the parsed JSON and the ProviderCall, which the caller finishes after validating the JSON """
+    call = ProviderCall(operation, budget.used)
+    try:
+        response = model.generate_content(prompt, request_options={"timeout": max(1, budget.remaining())})
+        call.observe(response)
+        text = continue_response(model, prompt, response.text, call.finish_reason, budget)
+        return parse_json(text), call
+    except Exception as e:
+        call.finish(e)
+        raise
+
+def first_invalid_part(error):
+    """ Returns the (part, index) of the first part of an adventure that failed validation, or None if the whole adventure needs regenerating """
+    for detail in error.errors():
+        loc = detail["loc"]
+        if not loc or loc[0] not in part_validators:
+            return None
+        if loc[0] != "Rising_Action":
+            return loc[0], None
+        if len(loc) > 1 and isinstance(loc[1], int):
+            return loc[0], loc[1]
+        return None
+    return None
+
+def build_repair_prompt(prompt, draft, key, index, message):
+    if index is None:
+        part = f"the {key}"
+        response_format = f"{{\"{key}\": \"...\"}}"
+    else:
+        part = f"scene {index + 1} of the Rising_Action"
+        response_format = """{"scene": {"challenge": "...", "setting": "...", "plot_twist": "...", "clue": "...", "encounters": [{"type": "...", "description": "..."}]}}"""
+
+    return f"""The following adventure was written in response to the request below, but {part} is invalid: {message}
+
+    Request:
+    {prompt}
+
+    Adventure:
+    {json.dumps(draft)}
+
+    Rewrite only {part} so that it fits the rest of the adventure and fixes the problem. Respond in JSON using the following format:
+    {response_format}"""
+
+def repair_part(model, prompt, draft, key, index, message, budget):
+    repaired, call = request_json(model, build_repair_prompt(prompt, draft, key, index, message), budget, "repair")
+    try:
+        if index is None:
+            draft[key] = repaired[key]
+        else:
+            draft[key][index] = repaired["scene"]
+    except Exception as e:
+        call.finish(e)
+        raise
+    return call
+
+def request_model(model, prompt, response_model, budget, operation):
+    """ Requests JSON for the given pydantic model, retrying within the budget until it validates """
+    while True:
+        budget.spend()
+        call = None
+        try:
+            data, call = request_json(model, prompt, budget, operation)
+            result = response_model.model_validate(data)
+            call.finish()
+            return result
+        except ValidationError as e:
+            call.finish(e)
+            print(e)
+        except ProviderUnavailable:
+            raise
         except Exception as e:
+            if call is not None:
+                call.finish(e)
             print(e)
-    
-    return response.model_dump_json().replace("Rising_Action", "Rising Action")
\ No newline at end of file
+            budget.backoff()
+
+def build_outline_prompt(game, players, scenes, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None):
+    prompt = describe_adventure(game, players, homebrew_description, campaign_setting, level, experience)
+
+    prompt += f"""Start with a compact outline. The rising action should include {scenes} scenes, each summarized in one sentence. Respond in JSON using the following format:
+    {{
+        Exposition: "Background knowledge the players might possess, if any, or prologue. Use up to 400 characters for the exposition.",
+        Incitement: "The event that directly involves the players and starts the adventure",
+        "Rising_Action": ["one sentence describing what the players must accomplish in the scene and where it takes place"],
+        Climax: "The final and most difficult scene, occurring after the last scene in the Rising_Action, that determines whether the players complete the adventure. Although this value is a String, it should include descriptions of a Setting, Challenge (objective), and a single Encounter",
+        Denoument: "Epilogue or rewards the players can expect if successful"
+    }}"""
+
+    if context is not None:
+        prompt += "\n" + context
+
+    return prompt
+
+def build_scene_prompt(description, outline, index, encounters, plot_twist, clue):
+    prompt = description + f"""The adventure has the following outline:
+    {outline.model_dump_json()}
+
+    Write scene {index + 1} of the Rising_Action in full: {outline.Rising_Action[index]}
+    The scene has {encounters} encounters. Each encounter is a trap, enemies, a puzzle (in which case, describe the solution), or some other obstacle. """
+
+    if plot_twist:
+        prompt += "The scene includes a plot twist: an event or discovery that changes something the players believed to be true. "
+    else:
+        prompt += "The plot twist is null. "
+
+    if clue:
+        prompt += "The scene includes a clue related to the scene's setting or an encounter: a hint about what the players should do next or information that brings the players closer to completing the overall adventure. "
+    else:
+        prompt += "The clue is null. "
+
+    prompt += """Respond in JSON using the following format:
+    {
+        challenge: "something the players must accomplish to get one step closer to their goal",
+        setting: "where the scene takes place, which should be more specific than the name of a city",
+        encounters: [
+            {
+                type: "type",
+                description: "something or someone that stands in their way, which could be a trap, a puzzle, an enemy or enemies, or a combination thereof"
+            }
+        ],
+        plot_twist: "plot twist or null",
+        clue: "clue or null"
+    }"""
+
+    return prompt
+
+def expand_scenes(model, description, outline, encounters, plot_twists, clues, budget):
+    """ Expands each scene of the outline with its own concurrent call to Gemini, yielding the scenes in order """
+    # Encounter counts, plot twists and clues are drawn here so the requested percentages hold across scenes
+    prompts = [
+        build_scene_prompt(description, outline, index, random.randint(1, int(encounters)), random.random() * 100 < float(plot_twists), random.random() * 100 < float(clues))
+        for index in range(len(outline.Rising_Action))
+    ]
+
+    # The scenes share one budget, with an attempt for each scene and the retries a single request gets between them
+    scene_budget = RetryBudget(attempts=len(prompts) + MAX_ATTEMPTS - 1, deadline=budget.remaining())
+
+    @in_worker
+    def expand(prompt):
+        return request_model(model, prompt, Scene, scene_budget, "scene")
+
+    with ThreadPoolExecutor(max_workers=min(len(prompts), FAN_OUT_WORKERS) or 1) as executor:
+        yield from executor.map(expand, prompts)
+
+def outline_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None, budget=None):
+    """ Generates an outline and then expands its scenes concurrently, yielding (part, value) tuples in the same order as stream_adventure """
+    model = get_model(response_mime_type="application/json")
+    budget = budget or RetryBudget()
+
+    outline = request_model(model, build_outline_prompt(game, players, scenes, homebrew_description, campaign_setting, level, experience, context), AdventureOutline, budget, "outline")
+    yield "Exposition", outline.Exposition
+    yield "Incitement", outline.Incitement
+
+    description = describe_adventure(game, players, homebrew_description, campaign_setting, level, experience)
+    rising_action = []
+    for scene in expand_scenes(model, description, outline, encounters, plot_twists, clues, budget):
+        rising_action.append(scene)
+        yield "Rising_Action", scene
+
+    yield "Climax", outline.Climax
+    yield "Denoument", outline.Denoument
+    yield "Adventure", Adventure(Exposition=outline.Exposition, Incitement=outline.Incitement, Rising_Action=rising_action, Climax=outline.Climax, Denoument=outline.Denoument)
+
+def create_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None, outline=False):
+    """ Generates an adventure and returns it as a validated Adventure model """
+    if outline:
+        for key, part in outline_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context):
+            if key == "Adventure":
+                return part
+
+    model = get_model(response_mime_type="application/json", max_output_tokens=output_token_limit(scenes, encounters))
+    prompt = build_prompt(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context)
+    return complete_adventure(model, prompt, RetryBudget())
+
+def invalid_part(draft, error):
+    """ Returns the (part, index, message) to repair when only one part of a draft is invalid, or None if the whole adventure needs regenerating """
+    part = first_invalid_part(error) if isinstance(draft, dict) else None
+    return None if part is None else (*part, error.errors()[0]["msg"])
+
+def complete_adventure(model, prompt, budget, draft=None):
+    """ Requests an adventure for the prompt, repairing or retrying within the budget until it validates.
+    A draft that was already received, such as from a stream, is repaired rather than requested again """
+    invalid = None
+    if draft is not None:
+        try:
+            return Adventure.model_validate(draft)
+        except ValidationError as e:
+            invalid = invalid_part(draft, e)
+
+    while True:
+        budget.spend()
+        call = None
+        try:
+            if invalid is None:
+                draft, call = request_json(model, prompt, budget, "adventure")
+            else:
+                key, index, message = invalid
+                call = repair_part(model, prompt, draft, key, index, message, budget)
+            adventure = Adventure.model_validate(draft)
+            call.finish()
+            return adventure
+        except ValidationError as e:
+            call.finish(e)
+            print(e)
+            # When only one part is invalid, just that part is regenerated
+            invalid = invalid_part(draft, e)
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            if call is not None:
+                call.finish(e)
+            print(e)
+            budget.backoff()
+
+class PlotPoint(BaseModel):
+    """ A single rewritten part of an adventure's plot, such as its climax or denoument """
+    text: str
+
+encounter_format = """{
+                type: "type",
+                description: "something or someone that stands in their way, which could be a trap, a puzzle, an enemy or enemies, or a combination thereof"
+            }"""
+
+def build_regeneration_prompt(game, campaign_setting, context, target, response_format, guidance=None):
+    prompt = f"""The following is an adventure for the {game} roleplaying game"""
+
+    if campaign_setting is not None:
+        prompt += f""", {campaign_setting} campaign setting"""
+
+    prompt += f""":
+    {json.dumps(context)}
+
+    Rewrite {target} so that it fits with the scenes around it and stays consistent with their clues and plot twists. Leave the rest of the adventure unchanged. """
+
+    if guidance is not None:
+        prompt += guidance + " "
+
+    prompt += f"""Respond in JSON using the following format:
+    {response_format}"""
+
+    return prompt
+
+def regenerate_part(game, campaign_setting, context, target, response_model, response_format, guidance=None):
+    model = get_model(response_mime_type="application/json")
+    prompt = build_regeneration_prompt(game, campaign_setting, context, target, response_format, guidance)
+    return request_model(model, prompt, response_model, RetryBudget(), "regenerate")
+
+def regenerate_scene(game, campaign_setting, context, sequence, encounters, guidance=None):
+    """ Rewrites one scene of a saved adventure, given the rest of the adventure as context """
+    response_format = f"""{{
+        challenge: "something the players must accomplish to get one step closer to their goal",
+        setting: "where the scene takes place, which should be more specific than the name of a city",
+        encounters: [{encounter_format}],
+        plot_twist: "An event or discovery that changes something the players believed to be true, or null",
+        clue: "a hint about what the players should do next or information that brings the players closer to completing the overall adventure, or null"
+    }}"""
+    target = f"scene {sequence} of the Rising_Action with {encounters} encounters"
+    return regenerate_part(game, campaign_setting, context, target, Scene, response_format, guidance)
+
+def regenerate_encounter(game, campaign_setting, context, sequence, index, guidance=None):
+    """ Rewrites one encounter of a scene in a saved adventure """
+    target = f"encounter {index + 1} of scene {sequence} of the Rising_Action"
+    return regenerate_part(game, campaign_setting, context, target, Encounter, encounter_format, guidance)
+
+def regenerate_plot_point(game, campaign_setting, context, part, guidance=None):
+    """ Rewrites the Climax or Denoument of a saved adventure """
+    return regenerate_part(game, campaign_setting, context, f"the {part}", PlotPoint, '{text: "..."}', guidance).text
+
+def create_adventure_variants(variants, game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None, outline=False):
+    """ Generates alternative adventures from the same parameters concurrently, yielding (index, adventure, error) tuples as each one finishes """
+    # The variants share one budget, with an attempt for each variant and the retries a single request gets between them
+    budget = RetryBudget(attempts=variants + MAX_ATTEMPTS - 1)
+
+    if outline:
+        @in_worker
+        def create():
+            for key, part in outline_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context, budget):
+                if key == "Adventure":
+                    return part
+    else:
+        # Every variant shares one model and prompt
+        model = get_model(response_mime_type="application/json", max_output_tokens=output_token_limit(scenes, encounters))
+        prompt = build_prompt(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context)
+
+        @in_worker
+        def create():
+            return complete_adventure(model, prompt, budget)
+
+    with ThreadPoolExecutor(max_workers=min(variants, FAN_OUT_WORKERS)) as executor:
+        futures = {executor.submit(create): index for index in range(variants)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+def generate_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None, outline=False):
+    adventure = create_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context, outline)
+    return adventure.model_dump_json().replace("Rising_Action", "Rising Action")
+
+def stream_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description=None, campaign_setting=None, level=None, experience=None, context=None, outline=False):
+    """ Streams an adventure from Gemini, yielding (part, value) tuples as each part is received and validated, followed by ("Adventure", adventure) once the whole adventure validates.
+    A stream that fails or has an invalid part is repaired, or retried, within the same budget as complete_adventure, and the parts that were not yet yielded follow once it validates """
+    if outline:
+        yield from outline_adventure(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context)
+        return
+
+    model = get_model(response_mime_type="application/json", max_output_tokens=output_token_limit(scenes, encounters))
+    prompt = build_prompt(game, players, scenes, encounters, plot_twists, clues, homebrew_description, campaign_setting, level, experience, context)
+    budget = RetryBudget()
+
+    parser = AdventureStreamParser()
+    streamed = {"Rising_Action": []}
+    # After an invalid part nothing more is yielded from the stream, so parts are still yielded in order once it is repaired
+    held_back = False
+
+    def feed(text):
+        nonlocal held_back
+        for key, value in parser.feed(text):
+            validator = part_validators.get(key)
+            if validator is None or held_back:
+                continue
+            try:
+                part = validator.validate_python(value)
+            except ValidationError as e:
+                print(e)
+                held_back = True
+                continue
+            if key == "Rising_Action":
+                streamed[key].append(part)
+            else:
+                streamed[key] = part
+            yield key, part
+
+    budget.spend()
+    call = ProviderCall("stream", budget.used)
+    draft = None
+    try:
+        response = model.generate_content(prompt, stream=True, request_options={"timeout": max(1, budget.remaining())})
+        for continuation in range(MAX_CONTINUATIONS + 1):
+            # The start of a continuation is held back until it can be checked for repeated text
+            pending = "" if continuation else None
+            for chunk in response:
+                call.first_token()
+                if pending is None:
+                    yield from feed(chunk.text)
+                    continue
+                pending += chunk.text
+                if len(pending) >= STITCH_WINDOW:
+                    yield from feed(stitch(parser.buffer, pending)[len(parser.buffer):])
+                    pending = None
+            if pending:
+                yield from feed(stitch(parser.buffer, pending)[len(parser.buffer):])
+
+            call.observe(response)
+            if continuation == MAX_CONTINUATIONS or not is_truncated(parser.buffer, call.finish_reason):
+                break
+            # Each continuation is a call of its own, counted against the budget and checked by the call guards
+            call.finish()
+            budget.spend()
+            call = ProviderCall("continuation", budget.used)
+            response = model.generate_content(continuation_contents(prompt, parser.buffer), stream=True, generation_config={"response_mime_type": "text/plain"}, request_options={"timeout": max(1, budget.remaining())})
+
+        draft = parse_json(parser.buffer)
+        adventure = Adventure.model_validate(draft)
+        call.finish()
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        call.finish(e)
+        print(e)
+        # A draft that parsed is repaired, and one that did not is requested again
+        adventure = complete_adventure(model, prompt, budget, draft if isinstance(draft, dict) else None)
+        # The parts already streamed stand, so the adventure that follows, and is cached, matches what the client received
+        spliced = {key: part for key, part in streamed.items() if key != "Rising_Action"}
+        spliced["Rising_Action"] = streamed["Rising_Action"] + adventure.Rising_Action[len(streamed["Rising_Action"]):]
+        adventure = adventure.model_copy(update=spliced)
+
+    for key in ["Exposition", "Incitement"]:
+        if key not in streamed:
+            yield key, getattr(adventure, key)
+    for scene in adventure.Rising_Action[len(streamed["Rising_Action"]):]:
+        yield "Rising_Action", scene
+    for key in ["Climax", "Denoument"]:
+        if key not in streamed:
+            yield key, getattr(adventure, key)
+    yield "Adventure", adventure
@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+from .models import Adventure, Scene, Encounter
+
+# An adventure's progress is the average of its scenes, its encounters and its climax, each scored out of 100
+progress_points = {'Not Started': 0, 'In Progress': 50, 'Complete': 100}
+
+def points_sum():
+    return Sum(Case(*[When(progress=progress, then=Value(points)) for progress, points in progress_points.items()], default=Value(0), output_field=IntegerField()))
+
+def climax_points(adventure):
+    return (adventure.climax_progress, 1) if adventure.climax else (0, 0)
+
+def lock_adventure(adventure_id):
+    # Every change to an adventure's progress holds a lock on its row, so concurrent changes are applied one at a time
+    return Adventure.objects.select_for_update().get(pk=adventure_id)
+
+def save_progress(adventure, points=0, items=0, update_fields=()):
+    """ Adjusts the progress of a locked adventure by the points and items added or removed """
+    adventure.progress_points += points
+    adventure.progress_items += items
+    adventure.progress = adventure.progress_points / adventure.progress_items if adventure.progress_items else 0
+    adventure.save(update_fields=['progress_points', 'progress_items', 'progress', 'last_modified', *update_fields])
+    return adventure
+
+def set_progress(adventure, scenes):
+    """ Sets the progress of a new adventure from its unsaved (scene, encounters) pairs """
+    points, items = climax_points(adventure)
+    for scene, encounters in scenes:
+        points += progress_points[scene.progress] + sum(progress_points[encounter.progress] for encounter in encounters)
+        items += 1 + len(encounters)
+    adventure.progress_points = points
+    adventure.progress_items = items
+    adventure.progress = points / items if items else 0
+
+@transaction.atomic
+def recalculate_progress(adventure_id):
+    """ Recounts an adventure's progress after scenes or encounters are added or removed """
+    adventure = lock_adventure(adventure_id)
+    scenes = Scene.objects.filter(adventure_id=adventure).aggregate(items=Count('pk'), points=points_sum())
+    encounters = Encounter.objects.filter(scene_id__adventure_id=adventure).aggregate(items=Count('pk'), points=points_sum())
+
+    points, items = climax_points(adventure)
+    adventure.progress_points = points + (scenes['points'] or 0) + (encounters['points'] or 0)
+    adventure.progress_items = items + scenes['items'] + encounters['items']
+    return save_progress(adventure)
+
+def changed_adventure(adventure):
+    return {'id': adventure.pk, 'progress': adventure.progress, 'climax_progress': adventure.climax_progress}
+
+@transaction.atomic
+def transition_scene(scene, progress, encounters=False):
+    """ Moves a scene, and optionally all of its encounters, to the given progress, returning only what changed """
+    adventure = lock_adventure(scene.adventure_id_id)
+    scene.refresh_from_db(fields=['progress'])
+    changes = {}
+    points = 0
+
+    if scene.progress != progress:
+        points += progress_points[progress] - progress_points[scene.progress]
+        Scene.objects.filter(pk=scene.pk).update(progress=progress)
+        scene.progress = progress
+        changes['scene'] = {'id': scene.pk, 'progress': progress}
+
+    if encounters:
+        changed = list(scene.encounter_set.exclude(progress=progress).values_list('pk', 'progress'))
+        if changed:
+            Encounter.objects.filter(pk__in=[pk for pk, previous in changed]).update(progress=progress)
+            points += sum(progress_points[progress] - progress_points[previous] for pk, previous in changed)
+            changes['encounters'] = [{'id': pk, 'progress': progress} for pk, previous in changed]
+
+    if changes:
+        changes['adventure'] = changed_adventure(save_progress(adventure, points))
+    return changes
+
+@transaction.atomic
+def transition_encounter(encounter, progress):
+    """ Moves an encounter to the given progress, returning only what changed """
+    adventure = lock_adventure(Scene.objects.values_list('adventure_id', flat=True).get(pk=encounter.scene_id_id))
+    encounter.refresh_from_db(fields=['progress'])
+    if encounter.progress == progress:
+        return {}
+
+    points = progress_points[progress] - progress_points[encounter.progress]
+    Encounter.objects.filter(pk=encounter.pk).update(progress=progress)
+    encounter.progress = progress
+    return {'encounter': {'id': encounter.pk, 'progress': progress}, 'adventure': changed_adventure(save_progress(adventure, points))}
+
+@transaction.atomic
+def transition_climax(adventure, climax_progress):
+    """ Moves an adventure's climax to the given progress, returning only what changed """
+    adventure = lock_adventure(adventure.pk)
+    if adventure.climax_progress == climax_progress:
+        return {}
+
+    before, items = climax_points(adventure)
+    adventure.climax_progress = climax_progress
+    after, items_after = climax_points(adventure)
+    return {'adventure': changed_adventure(save_progress(adventure, after - before, items_after - items, ['climax_progress']))}
@@ -0,0 +1,177 @@
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+class Provider(ABC):
+    """ A source of generative models. Models are reused for the life of the process, one per generation config """
+    name = None
+    model_name = None
+
+    def __init__(self):
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def model(self, **config_overrides):
+        key = json.dumps(config_overrides, sort_keys=True)
+        with self.lock:
+            if key not in self.models:
+                self.models[key] = self.create_model(**config_overrides)
+            return self.models[key]
+
+    @abstractmethod
+    def create_model(self, **config_overrides):
+        """ Returns a model configured with the generation config overrides """
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    model_name = "gemini-1.5-flash"
+
+    def __init__(self):
+        super().__init__()
+        import google.generativeai as gemini
+        gemini.configure(api_key=os.environ.get('API_KEY'))
+
+    def create_model(self, **config_overrides):
+        import google.generativeai as gemini
+        from google.generativeai.types import HarmCategory, HarmBlockThreshold
+
+        config = {
+            "temperature": 0.95,
+            "candidate_count": 1,
+            "top_k": 10000,
+            "top_p": 0.95,
+            "max_output_tokens": 1024,
+            "stop_sequences": [],
+        }
+        safety_settings={
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_LOW_AND_ABOVE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_ONLY_HIGH,
+        }
+        config.update(config_overrides)
+        return gemini.GenerativeModel(model_name=self.model_name, safety_settings=safety_settings, generation_config=config)
+
+class StubProviderError(Exception):
+    """ A failure injected by the stub provider """
+
+class StubResponse:
+    """ Mirrors the parts of a Gemini response that palm reads """
+
+    def __init__(self, prompt, text):
+        self.text = text
+        self.candidates = [SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"))]
+        self.usage_metadata = SimpleNamespace(prompt_token_count=len(prompt) // 4, candidates_token_count=len(text) // 4)
+        self.prompt_feedback = None
+
+    def __iter__(self):
+        for start in range(0, len(self.text), 80):
+            yield SimpleNamespace(text=self.text[start:start + 80])
+
+class StubModel:
+    """ Returns schema-valid JSON for each kind of prompt palm sends, chosen deterministically from the prompt and the seed """
+
+    def __init__(self, latency, failure_rate, seed):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False, generation_config=None, request_options=None):
+        prompt = contents if isinstance(contents, str) else json.dumps(contents)
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+
+        time.sleep(self.latency)
+        if random.Random("%s:%s" % (self.seed, call)).random() < self.failure_rate:
+            raise StubProviderError("Injected failure on call %s" % call)
+
+        digest = hashlib.sha256(("%s:%s" % (self.seed, prompt)).encode()).hexdigest()
+        rng = random.Random(digest)
+        # The stub never truncates, so continuations add nothing
+        text = "" if not isinstance(contents, str) else json.dumps(self.respond(contents, rng))
+        return StubResponse(prompt, text)
+
+    def respond(self, prompt, rng):
+        if "is invalid" in prompt:
+            key = re.search(r"Rewrite only the (\w+)", prompt)
+            if key is not None:
+                return {key.group(1): self.sentence(rng, key.group(1).lower())}
+            return {"scene": self.scene(rng, 1)}
+        if "Rewrite encounter" in prompt:
+            return self.encounter(rng)
+        if "Rewrite the Climax" in prompt or "Rewrite the Denoument" in prompt:
+            return {"text": self.sentence(rng, "finale")}
+        if "Rewrite scene" in prompt or "Write scene" in prompt:
+            return self.scene(rng, self.number(prompt, r"(\d+) encounters", 1))
+
+        scenes = self.number(prompt, r"include (\d+) scenes", 3)
+        encounters = self.number(prompt, r"between 1 and (\d+)", 1)
+        adventure = {
+            "Exposition": self.sentence(rng, "exposition"),
+            "Incitement": self.sentence(rng, "incitement"),
+            "Rising_Action": [self.scene(rng, rng.randint(1, encounters)) for i in range(scenes)],
+            "Climax": self.sentence(rng, "climax"),
+            "Denoument": self.sentence(rng, "denoument"),
+        }
+        if "compact outline" in prompt:
+            adventure["Rising_Action"] = [self.sentence(rng, "scene") for i in range(scenes)]
+        return adventure
+
+    def number(self, prompt, pattern, default):
+        match = re.search(pattern, prompt)
+        return int(match.group(1)) if match else default
+
+    def sentence(self, rng, part):
+        return "Stub %s %s." % (part, rng.randint(0, 9999))
+
+    def encounter(self, rng):
+        return {"type": rng.choice(["trap", "enemies", "puzzle"]), "description": self.sentence(rng, "encounter")}
+
+    def scene(self, rng, encounters):
+        return {
+            "challenge": self.sentence(rng, "challenge"),
+            "setting": self.sentence(rng, "setting"),
+            "plot_twist": self.sentence(rng, "plot twist") if rng.random() < 0.5 else None,
+            "clue": self.sentence(rng, "clue") if rng.random() < 0.5 else None,
+            "encounters": [self.encounter(rng) for i in range(encounters)],
+        }
+
+class StubProvider(Provider):
+    """ A local provider for load tests, benchmarks and CI on machines without network access """
+    name = "stub"
+    model_name = "stub"
+
+    def create_model(self, **config_overrides):
+        return StubModel(
+            latency=float(os.environ.get('GENERATION_STUB_LATENCY', 0)),
+            failure_rate=float(os.environ.get('GENERATION_STUB_FAILURE_RATE', 0)),
+            seed=os.environ.get('GENERATION_STUB_SEED', 'odyssey'),
+        )
+
+provider_classes = {}
+providers = {}
+providers_lock = threading.Lock()
+
+def register_provider(provider_class):
+    provider_classes[provider_class.name] = provider_class
+    return provider_class
+
+register_provider(GeminiProvider)
+register_provider(StubProvider)
+
+def get_provider(name=None):
+    """ Returns the named provider, or the one chosen by GENERATION_PROVIDER, creating it once per process """
+    name = name or os.environ.get('GENERATION_PROVIDER', 'gemini')
+    with providers_lock:
+        if name not in providers:
+            providers[name] = provider_classes[name]()
+        return providers[name]
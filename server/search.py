@@ -0,0 +1,104 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_save
+from .models import Adventure, Scene, Encounter, Custom_Field, Search_Entry
+from .versions import adventure_id_of
+import re
+
+# The fields of each model that are searched
+indexed_fields = {
+    Adventure: ['title', 'exposition', 'incitement', 'climax'],
+    Scene: ['challenge', 'setting', 'plot_twist', 'clue'],
+    Encounter: ['description', 'stats'],
+    Custom_Field: ['value'],
+}
+# The search entry field that refers to each part of an adventure
+part_fields = {Scene: 'scene_id', Encounter: 'encounter_id', Custom_Field: 'custom_field_id'}
+
+def entry_text(instance):
+    return '\n'.join(value for value in (getattr(instance, field) for field in indexed_fields[type(instance)]) if value)
+
+def entry_owner(instance):
+    """ Returns the lookup of the search entry for an adventure, scene, encounter or custom field """
+    if isinstance(instance, Adventure):
+        return {'adventure_id': instance, 'scene_id': None, 'encounter_id': None, 'custom_field_id': None}
+    return {part_fields[type(instance)]: instance}
+
+def entry_descendants(instance):
+    """ Returns a filter for the search entries of the encounters and custom fields under a scene or encounter """
+    if isinstance(instance, Scene):
+        return Q(encounter_id__scene_id=instance) | Q(custom_field_id__scene_id=instance) | Q(custom_field_id__encounter_id__scene_id=instance)
+    return Q(custom_field_id__encounter_id=instance)
+
+def index_instance(instance, created=False):
+    # The adventure is updated along with the text, as scenes and encounters can be moved to another adventure, taking what is under them along
+    adventure_id = instance.pk if isinstance(instance, Adventure) else adventure_id_of(instance)
+    entry = {'adventure_id_id': adventure_id, 'text': entry_text(instance)}
+    if created or not Search_Entry.objects.filter(**entry_owner(instance)).update(**entry):
+        Search_Entry.objects.create(**entry_owner(instance), **entry)
+    if not created and isinstance(instance, (Scene, Encounter)):
+        Search_Entry.objects.filter(entry_descendants(instance)).exclude(adventure_id=adventure_id).update(adventure_id_id=adventure_id)
+
+def index_parts(parts):
+    """ Adds the search entries of new scenes, encounters and custom fields, which were saved with bulk_create and so sent no signals.
+    parts is a list of (adventure_id, part) pairs """
+    Search_Entry.objects.bulk_create([Search_Entry(adventure_id_id=adventure_id, text=entry_text(part), **{part_fields[type(part)]: part}) for adventure_id, part in parts])
+
+def instance_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that only change other fields, such as progress, leave the index alone
+    if update_fields is not None and not set(update_fields) & set(indexed_fields[sender]):
+        return
+    index_instance(instance, created)
+
+def connect_signals():
+    """ Keeps the search entry of an adventure, scene, encounter or custom field up to date when it is saved.
+    Entries are deleted along with what they index by their foreign keys """
+    for model in indexed_fields:
+        post_save.connect(instance_saved, sender=model)
+
+def match_sql(query):
+    """ Returns SQL selecting the id and relevance of the search entries that match the query, with its params.
+    MySQL searches a FULLTEXT index and SQLite an FTS5 table, which are both created by migration 0025_search_entry """
+    if connection.vendor == 'mysql':
+        return 'SELECT id, MATCH(text) AGAINST (%s) AS score FROM search_entry WHERE MATCH(text) AGAINST (%s)', [query, query]
+
+    # Each word is quoted, so it is matched as a term rather than read as FTS5 query syntax. The best matches have the lowest rank
+    terms = ' OR '.join('"%s"' % term for term in re.findall(r'\w+', query))
+    return 'SELECT rowid AS id, -rank AS score FROM search_entry_fts WHERE search_entry_fts MATCH %s', [terms]
+
+def search_adventures(query, adventures, limit, offset=0):
+    """ Returns the ids and scores of the adventures in the adventures queryset that match the query, best matches first.
+    An adventure's score is the total relevance of its matching entries """
+    if not re.search(r'\w', query):
+        return []
+    matches, params = match_sql(query)
+    scope, scope_params = adventures.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT e.adventure_id_id, SUM(m.score) AS score FROM (%s) m INNER JOIN search_entry e ON e.id = m.id '
+            'WHERE e.adventure_id_id IN (%s) GROUP BY e.adventure_id_id ORDER BY score DESC, e.adventure_id_id DESC LIMIT %%s OFFSET %%s' % (matches, scope),
+            [*params, *scope_params, limit, offset])
+        return cursor.fetchall()
+
+def matching_parts(query, adventure_ids):
+    """ Returns what matches the query in each adventure, best matches first, as {'type': 'encounter', 'id': 7}.
+    The type is adventure, scene, encounter or custom_field """
+    parts = {adventure_id: [] for adventure_id in adventure_ids}
+    if not adventure_ids:
+        return parts
+    matches, params = match_sql(query)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT e.adventure_id_id, e.scene_id_id, e.encounter_id_id, e.custom_field_id_id FROM (%s) m INNER JOIN search_entry e ON e.id = m.id '
+            'WHERE e.adventure_id_id IN (%s) ORDER BY m.score DESC, e.id' % (matches, ', '.join(['%s'] * len(adventure_ids))),
+            [*params, *adventure_ids])
+        for adventure_id, scene_id, encounter_id, custom_field_id in cursor.fetchall():
+            if custom_field_id is not None:
+                parts[adventure_id].append({'type': 'custom_field', 'id': custom_field_id})
+            elif encounter_id is not None:
+                parts[adventure_id].append({'type': 'encounter', 'id': encounter_id})
+            elif scene_id is not None:
+                parts[adventure_id].append({'type': 'scene', 'id': scene_id})
+            else:
+                parts[adventure_id].append({'type': 'adventure', 'id': adventure_id})
+    return parts
@@ -1,33 +1,114 @@
 from rest_framework import serializers
-from .models import Adventure, Scene, Encounter, Custom_Field
+from .models import Adventure, Scene, Encounter, Custom_Field, Generation_Job
 from django.contrib.auth.models import User
 
-class CustomFieldSerializer(serializers.ModelSerializer):
+# The related objects nested by each serializer, for prefetch_related
+encounter_prefetch = ['custom_field_set']
+scene_prefetch = ['custom_field_set', 'encounter_set__custom_field_set']
+adventure_prefetch = ['custom_field_set', 'scene_set__custom_field_set', 'scene_set__encounter_set__custom_field_set']
+
+def query_list(request, name):
+    """ Returns the comma-separated values of a query parameter, such as ?fields=id,title """
+    value = request.query_params.get(name) if request is not None else None
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+class SparseFieldsMixin:
+    """ Limits a serializer to the fields listed in ?fields=, and adds the nested relations listed in ?expand= that it leaves out by default.
+    Only the top-level serializer of a response is affected """
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expand = query_list(request, 'expand')
+        for name in expand:
+            if name in self.expandable_fields:
+                self.fields[name] = self.expandable_fields[name]()
+
+        fields = query_list(request, 'fields')
+        if fields:
+            for name in set(self.fields) - set(fields) - set(expand):
+                self.fields.pop(name)
+
+class CustomFieldSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     
     class Meta:
         model=Custom_Field
         fields='__all__'
 
-class EncounterSerializer(serializers.ModelSerializer):
+class EncounterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     custom_field_set = CustomFieldSerializer(many=True, read_only=True)
 
     class Meta:
         model=Encounter
         fields='__all__'
 
-class SceneSerializer(serializers.ModelSerializer):
+class SceneSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     custom_field_set = CustomFieldSerializer(many=True, read_only=True)
     encounter_set = EncounterSerializer(many=True, read_only=True)
     class Meta:
         model=Scene
         fields='__all__'
 
-class AdventureSerializer(serializers.ModelSerializer):
+class AdventureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    custom_field_set = CustomFieldSerializer(many=True, read_only=True)
     scene_set = SceneSerializer(many=True, read_only=True)
 
     class Meta:
         model = Adventure
-        fields = '__all__'
+        # Progress is maintained by server.progress
+        exclude = ['progress_points', 'progress_items']
+        read_only_fields = ['progress', 'version', 'updated_at']
+
+class AdventureSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """ Describes an adventure without its content, for listing adventures. Scenes and custom fields are included only when expanded """
+    scene_count = serializers.IntegerField(read_only=True)
+    encounter_count = serializers.IntegerField(read_only=True)
+    expandable_fields = {
+        'scene_set': lambda: SceneSerializer(many=True, read_only=True),
+        'custom_field_set': lambda: CustomFieldSerializer(many=True, read_only=True),
+    }
+
+    class Meta:
+        model = Adventure
+        fields = ['id', 'title', 'game', 'campaign_setting', 'status', 'progress', 'climax_progress', 'created_at', 'last_modified', 'scene_count', 'encounter_count']
+
+
+class CustomFieldTreeSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model=Custom_Field
+        fields=['name', 'value']
+
+class EncounterTreeSerializer(serializers.ModelSerializer):
+    custom_field_set = CustomFieldTreeSerializer(many=True, required=False)
+
+    class Meta:
+        model=Encounter
+        fields=['encounter_type', 'description', 'stats', 'progress', 'custom_field_set']
+
+    def to_internal_value(self, data):
+        # Generated encounter types can run longer than the field, so they are cut to fit rather than failing the whole tree
+        if isinstance(data, dict) and isinstance(data.get('encounter_type'), str):
+            data = {**data, 'encounter_type': data['encounter_type'][:Encounter._meta.get_field('encounter_type').max_length]}
+        return super().to_internal_value(data)
+
+class SceneTreeSerializer(serializers.ModelSerializer):
+    encounter_set = EncounterTreeSerializer(many=True, required=False)
+    custom_field_set = CustomFieldTreeSerializer(many=True, required=False)
+
+    class Meta:
+        model=Scene
+        fields=['sequence', 'challenge', 'setting', 'plot_twist', 'clue', 'progress', 'encounter_set', 'custom_field_set']
+
+class AdventureTreeSerializer(serializers.ModelSerializer):
+    """ Validates a whole new adventure, with its scenes, encounters and custom fields, for server.adventure_tree.create_adventure_tree """
+    scene_set = SceneTreeSerializer(many=True, required=False)
+    custom_field_set = CustomFieldTreeSerializer(many=True, required=False)
+
+    class Meta:
+        model=Adventure
+        fields=['title', 'game', 'campaign_setting', 'exposition', 'incitement', 'climax', 'climax_progress', 'denoument', 'status', 'scene_set', 'custom_field_set']
 
 
 class AdventureCreateSerializer(serializers.ModelSerializer):
@@ -36,6 +117,12 @@ class AdventureCreateSerializer(serializers.ModelSerializer):
         model=Adventure
         fields='__all__'
 
+class GenerationJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model=Generation_Job
+        fields=['id', 'status', 'attempts', 'error', 'created_at', 'started_at', 'finished_at']
+
 class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -0,0 +1,76 @@
+from concurrent.futures import Future
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import Generation_Flight
+import threading
+import time
+
+class FlightTimeout(Exception):
+    """ Raised when a request waiting on an identical in-flight generation gives up """
+
+local_flights = {}
+local_lock = threading.Lock()
+
+def single_flight(key, generate):
+    """ Calls generate() once for identical requests with the same key, whether they arrive on other threads or in other processes, and returns its result to all of them """
+    with local_lock:
+        future = local_flights.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            local_flights[key] = future
+
+    if not leader:
+        return future.result(timeout=settings.GENERATION_FLIGHT_LEASE)
+
+    try:
+        result = shared_flight(key, generate)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with local_lock:
+            del local_flights[key]
+
+def shared_flight(key, generate):
+    deadline = time.monotonic() + settings.GENERATION_FLIGHT_LEASE
+    while time.monotonic() < deadline:
+        now = timezone.now()
+        Generation_Flight.objects.filter(key=key, expires_at__lt=now).delete()
+        try:
+            # The savepoint keeps a duplicate key from breaking a transaction the caller is in
+            with transaction.atomic():
+                Generation_Flight.objects.create(key=key, expires_at=now + timedelta(seconds=settings.GENERATION_FLIGHT_LEASE))
+        except IntegrityError:
+            result = follow_flight(key, deadline)
+            if result is not None:
+                return result
+            # The other process failed, so this request takes over
+            continue
+
+        try:
+            result = generate()
+        except Exception:
+            Generation_Flight.objects.filter(key=key).delete()
+            raise
+
+        # The result stays attached to the flight for the coalescing window, so repeated submissions get it too
+        Generation_Flight.objects.filter(key=key).update(result=result, expires_at=timezone.now() + timedelta(seconds=settings.GENERATION_COALESCE_WINDOW))
+        return result
+
+    raise FlightTimeout("Timed out waiting for generation %s" % key)
+
+def follow_flight(key, deadline):
+    """ Waits for another process's flight to finish, returning its result, or None if the flight ended without one """
+    while time.monotonic() < deadline:
+        flight = Generation_Flight.objects.filter(key=key).values('result').first()
+        if flight is None:
+            return None
+        if flight['result'] is not None:
+            return flight['result']
+        time.sleep(settings.GENERATION_FLIGHT_POLL_INTERVAL)
+    raise FlightTimeout("Timed out waiting for generation %s" % key)
@@ -1,3 +1,1174 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+import json
+import os
+import re
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from . import admission, adventure_json, palm, utils
+from .admission import claim_slot, release_slot
+from .adventure_pool import fill_pool, popular_requests, record_request
+from .adventure_tree import create_adventure_tree
+from .generation_cache import cache_key, find_adventure, generate_cached_adventure
+from .jobs import claim_job, run_job
+from .models import Adventure, Cached_Adventure, Circuit_Breaker, Counter, Encounter, Generation_Flight, Generation_Job, Generation_Metric, Generation_Request_Count, Pooled_Adventure, Rate_Bucket
+from .palm import MAX_ATTEMPTS, AdventureStreamParser, GenerationError, ProviderUnavailable, RetryBudget, continue_response, create_adventure, stream_adventure
+from .providers import Provider, StubModel, StubProviderError, StubResponse, get_provider
+from .serializers import AdventureSerializer, adventure_prefetch
+from .search import search_adventures
+from .single_flight import single_flight
+from .views import get_generation_params
 
-# Create your tests here.
+
+class QueryBudgetTests(TestCase):
+    """ Each endpoint should make the same number of queries however large the adventure is """
+    sizes = [(1, 1), (5, 3), (20, 5)]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='budget')
+        self.client.force_login(self.user)
+        # Counters are buffered rather than written, as long as the buffer is not due to be flushed
+        patcher = mock.patch.object(utils, 'counter_buffer', utils.CounterBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_adventure(self, scenes, encounters):
+        def custom_fields(owner):
+            return [{'name': '%s note' % owner, 'value': 'value'}, {'name': '%s stats' % owner, 'value': 'value'}]
+
+        return create_adventure_tree(self.user, {
+            'title': 'Adventure',
+            'game': 'Dungeons & Dragons',
+            'climax': 'Climax',
+            'custom_field_set': custom_fields('adventure'),
+            'scene_set': [
+                {
+                    'sequence': sequence,
+                    'challenge': 'Challenge',
+                    'custom_field_set': custom_fields('scene'),
+                    'encounter_set': [{'encounter_type': 'trap', 'description': 'Trap', 'custom_field_set': custom_fields('encounter')} for i in range(encounters)],
+                }
+                for sequence in range(1, scenes + 1)
+            ],
+        })
+
+    def assert_budget(self, queries, url, warm=False):
+        """ Checks the query count of url(ids) for an adventure of each size, where ids are the ids returned by create_adventure_tree.
+        A warm url is requested once before it is counted """
+        for scenes, encounters in self.sizes:
+            ids = self.create_adventure(scenes, encounters)
+            if warm:
+                self.client.get(url(ids))
+            with self.subTest(scenes=scenes, encounters=encounters), self.assertNumQueries(queries):
+                response = self.client.get(url(ids))
+                self.assertEqual(response.status_code, 200)
+
+    # Every request also loads the session and the user, and the detail view checks the adventure's version before loading its tree
+    def test_adventure_detail(self):
+        self.assert_budget(9, lambda ids: '/api/adventures/%s/?fields=id,title,scene_set,custom_field_set' % ids['id'])
+
+    # A miss also looks up the adventure cache, reads the tree in four queries and caches the document
+    def test_adventure_detail_miss(self):
+        self.assert_budget(13, lambda ids: '/api/adventures/%s/' % ids['id'])
+
+    def test_adventure_detail_hit(self):
+        self.assert_budget(4, lambda ids: '/api/adventures/%s/' % ids['id'], warm=True)
+
+    def test_adventure_list(self):
+        self.assert_budget(8, lambda ids: '/api/adventures/?user_id=%s' % self.user.pk)
+
+    def test_scene_detail(self):
+        self.assert_budget(6, lambda ids: '/api/scenes/%s/' % ids['scene_set'][0]['id'])
+
+    def test_encounter_detail(self):
+        self.assert_budget(4, lambda ids: '/api/encounters/%s/' % ids['scene_set'][0]['encounter_set'][0]['id'])
+
+    def test_adventure_summary(self):
+        self.assert_budget(3, lambda ids: '/api/adventures/?user_id=%s&view=summary' % self.user.pk)
+
+    def test_adventure_summary_expanded(self):
+        self.assert_budget(7, lambda ids: '/api/adventures/?user_id=%s&view=summary&expand=scene_set&fields=id,title' % self.user.pk)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sparse', password='sparse')
+        self.client.force_login(self.user)
+        self.ids = create_adventure_tree(self.user, {
+            'title': 'Adventure',
+            'game': 'Dungeons & Dragons',
+            'scene_set': [{'sequence': 1, 'encounter_set': [{'encounter_type': 'trap'}, {'encounter_type': 'puzzle'}]}, {'sequence': 2}],
+        })
+
+    def test_summary(self):
+        summary = self.client.get('/api/adventures/?user_id=%s&view=summary' % self.user.pk).json()['results'][0]
+        self.assertNotIn('scene_set', summary)
+        self.assertEqual((summary['title'], summary['scene_count'], summary['encounter_count']), ('Adventure', 2, 2))
+
+    def test_fields(self):
+        adventure = self.client.get('/api/adventures/%s/?fields=id,title' % self.ids['id']).json()
+        self.assertEqual(set(adventure), {'id', 'title'})
+
+    def test_expand(self):
+        summary = self.client.get('/api/adventures/?user_id=%s&view=summary&fields=id&expand=scene_set' % self.user.pk).json()['results'][0]
+        self.assertEqual(set(summary), {'id', 'scene_set'})
+        self.assertEqual(len(summary['scene_set'][0]['encounter_set']), 2)
+
+
+class AdventureListingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='listing', password='listing')
+        other = User.objects.create_user(username='other', password='other')
+        for i in range(25):
+            create_adventure_tree(self.user, {'title': 'Adventure %s' % i, 'game': 'Starfinder' if i % 5 else 'Pathfinder', 'status': 'archived' if i % 2 else 'active'})
+        create_adventure_tree(other, {'title': 'Other', 'game': 'Pathfinder'})
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        first = self.client.get('/api/adventures/?view=summary').json()
+        self.assertEqual([adventure['title'] for adventure in first['results']], ['Adventure %s' % i for i in range(24, 4, -1)])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([adventure['title'] for adventure in second['results']], ['Adventure %s' % i for i in range(4, -1, -1)])
+        self.assertIsNone(second['next'])
+
+    def test_filters(self):
+        adventures = self.client.get('/api/adventures/?view=summary&game=Pathfinder&status=active').json()['results']
+        self.assertEqual([adventure['title'] for adventure in adventures], ['Adventure 20', 'Adventure 10', 'Adventure 0'])
+
+    def test_invalid_date(self):
+        self.assertEqual(self.client.get('/api/adventures/?created_after=yesterday').status_code, 400)
+
+    def test_other_users(self):
+        other = User.objects.get(username='other')
+        self.assertEqual(self.client.get('/api/adventures/?user_id=%s' % other.pk).json()['results'], [])
+        self.assertEqual(self.client.get('/api/adventures/%s/' % other.adventure_set.get().pk).status_code, 404)
+
+
+class AdventureVersionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='version', password='version')
+        self.client.force_login(self.user)
+        self.ids = create_adventure_tree(self.user, {'title': 'Adventure', 'game': 'Pathfinder', 'scene_set': [{'sequence': 1, 'encounter_set': [{'encounter_type': 'trap'}]}]})
+        self.url = '/api/adventures/%s/' % self.ids['id']
+
+    def etag(self):
+        return self.client.get(self.url)['ETag']
+
+    def test_not_modified(self):
+        etag = self.etag()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_nested_writes_change_version(self):
+        etag = self.etag()
+        scene = self.ids['scene_set'][0]
+        self.client.patch('/api/encounters/%s/' % scene['encounter_set'][0]['id'], {'description': 'A swinging log'}, content_type='application/json')
+        self.assertNotEqual(self.etag(), etag)
+
+        etag = self.etag()
+        self.client.post('/api/custom-fields/', {'scene_id': scene['id'], 'name': 'Loot', 'value': 'Gold'}, content_type='application/json')
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_if_match(self):
+        etag = self.etag()
+        scene = self.ids['scene_set'][0]['id']
+        response = self.client.patch('/api/scenes/%s/' % scene, {'challenge': 'First'}, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch('/api/scenes/%s/' % scene, {'challenge': 'Second'}, content_type='application/json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.patch(self.url, {'title': 'Renamed'}, content_type='application/json', HTTP_IF_MATCH=self.etag())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.etag())
+
+    def test_chained_if_match(self):
+        scene = self.ids['scene_set'][0]
+        encounter = scene['encounter_set'][0]['id']
+        # Each write returns the new version, which the next write sends back without reloading the adventure
+        etag = self.etag()
+        writes = [
+            lambda etag: self.client.patch('/api/scenes/%s/' % scene['id'], {'challenge': 'First'}, content_type='application/json', HTTP_IF_MATCH=etag),
+            lambda etag: self.client.post('/api/scenes/%s/transition/' % scene['id'], {'progress': 'In Progress'}, content_type='application/json', HTTP_IF_MATCH=etag),
+            lambda etag: self.client.patch('/api/encounters/%s/' % encounter, {'description': 'A swinging log'}, content_type='application/json', HTTP_IF_MATCH=etag),
+            lambda etag: self.client.post('/api/encounters/%s/transition/' % encounter, {'progress': 'Complete'}, content_type='application/json', HTTP_IF_MATCH=etag),
+            lambda etag: self.client.post('/api/custom-fields/', {'scene_id': scene['id'], 'name': 'Loot', 'value': 'Gold'}, content_type='application/json', HTTP_IF_MATCH=etag),
+        ]
+        for write in writes:
+            response = write(etag)
+            self.assertLess(response.status_code, 300)
+            self.assertNotEqual(response['ETag'], etag)
+            etag = response['ETag']
+            self.assertEqual(etag, self.etag())
+
+
+class AdventureCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cache', password='cache', is_staff=True)
+        self.client.force_login(self.user)
+        # Counts buffered by earlier tests would be flushed into this one's totals
+        patcher = mock.patch.object(utils, 'counter_buffer', utils.CounterBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ids = create_adventure_tree(self.user, {'title': 'Adventure', 'game': 'Pathfinder', 'scene_set': [{'sequence': 1, 'encounter_set': [{'encounter_type': 'trap'}]}]})
+        self.url = '/api/adventures/%s/' % self.ids['id']
+
+    def test_hit_matches_miss(self):
+        miss = self.client.get(self.url)
+        hit = self.client.get(self.url)
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit['Content-Type'], miss['Content-Type'])
+        self.assertEqual(hit['ETag'], miss['ETag'])
+        stats = self.client.get('/api/adventure-cache/stats/').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+    def test_counts_flushed(self):
+        self.client.get(self.url)
+        self.assertFalse(Counter.objects.exists())
+        with override_settings(COUNTER_FLUSH_INTERVAL=0):
+            self.client.get(self.url)
+        self.assertEqual(dict(Counter.objects.values_list('name', 'value')), {'adventure_cache_hits': 1, 'adventure_cache_misses': 1})
+
+    def test_writes_invalidate(self):
+        self.client.get(self.url)
+        encounter = self.ids['scene_set'][0]['encounter_set'][0]['id']
+        self.client.patch('/api/encounters/%s/' % encounter, {'description': 'A swinging log'}, content_type='application/json')
+        adventure = self.client.get(self.url).json()
+        self.assertEqual(adventure['scene_set'][0]['encounter_set'][0]['description'], 'A swinging log')
+
+        self.client.delete('/api/scenes/%s/' % self.ids['scene_set'][0]['id'])
+        self.assertEqual(self.client.get(self.url).json()['scene_set'], [])
+
+    def test_sparse_fields_are_not_cached(self):
+        self.client.get(self.url)
+        self.assertEqual(set(self.client.get(self.url + '?fields=id,title').json()), {'id', 'title'})
+
+
+class AdventureJsonTests(TestCase):
+    """ The fast read path must render the same bytes as AdventureSerializer """
+    def setUp(self):
+        self.user = User.objects.create_user(username='json', password='json')
+        self.ids = create_adventure_tree(self.user, {
+            'title': 'Ünïcode \u2028 adventure',
+            'game': 'Pathfinder',
+            'climax': 'Climax',
+            'climax_progress': 33.3,
+            'custom_field_set': [{'name': 'Notes', 'value': 'Line\u2029break'}],
+            'scene_set': [
+                {'sequence': 2, 'challenge': 'Second', 'progress': 'Complete', 'encounter_set': [{'encounter_type': 'trap', 'custom_field_set': [{'name': 'DC', 'value': '15'}]}]},
+                {'sequence': 1, 'challenge': None, 'custom_field_set': [{'name': 'Loot', 'value': ''}], 'encounter_set': [{'encounter_type': 'combat'}, {'encounter_type': 'puzzle', 'progress': 'In Progress'}]},
+                {'sequence': 3},
+            ],
+        })
+
+    def serialized(self):
+        adventure = Adventure.objects.prefetch_related(*adventure_prefetch).get(pk=self.ids['id'])
+        return JSONRenderer().render(AdventureSerializer(adventure).data)
+
+    def test_matches_serializer(self):
+        self.assertEqual(adventure_json.render_adventure(self.ids['id']), self.serialized())
+
+    def test_matches_serializer_without_orjson(self):
+        with mock.patch.object(adventure_json, 'orjson', None):
+            self.assertEqual(adventure_json.render_adventure(self.ids['id']), self.serialized())
+
+    def test_matches_serializer_with_exponent_floats(self):
+        Adventure.objects.filter(pk=self.ids['id']).update(climax_progress=0.00001)
+        self.assertEqual(adventure_json.render_adventure(self.ids['id']), self.serialized())
+
+    def test_missing(self):
+        self.assertIsNone(adventure_json.render_adventure(self.ids['id'] + 1))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='search', password='search')
+        self.client.force_login(self.user)
+        self.log_trap = create_adventure_tree(self.user, {
+            'title': 'The Hollow',
+            'game': 'Pathfinder',
+            'scene_set': [{'sequence': 1, 'challenge': 'A bugbear guards the bridge', 'encounter_set': [{'encounter_type': 'trap', 'description': 'A swinging log trap'}]}],
+        })
+        self.bugbear = create_adventure_tree(self.user, {'title': 'Bugbear Caves', 'game': 'Pathfinder'})
+        self.unrelated = create_adventure_tree(self.user, {'title': 'Court Intrigue', 'game': 'Pathfinder', 'custom_field_set': [{'name': 'Notes', 'value': 'Masks and daggers'}]})
+        other = User.objects.create_user(username='other', password='other')
+        create_adventure_tree(other, {'title': 'Bugbear log trap', 'game': 'Pathfinder'})
+
+    def search(self, query):
+        return self.client.get('/api/adventures/search/', {'q': query, 'view': 'summary'}).json()
+
+    def test_ranked(self):
+        results = self.search('bugbear log trap')['results']
+        self.assertEqual([result['id'] for result in results], [self.log_trap['id'], self.bugbear['id']])
+        self.assertEqual({match['type'] for match in results[0]['matches']}, {'scene', 'encounter'})
+        self.assertGreater(results[0]['search_score'], results[1]['search_score'])
+
+    def test_custom_fields(self):
+        results = self.search('daggers')['results']
+        self.assertEqual(results[0]['matches'], [{'type': 'custom_field', 'id': self.unrelated['custom_field_set'][0]['id']}])
+
+    def test_index_follows_writes(self):
+        encounter = self.log_trap['scene_set'][0]['encounter_set'][0]['id']
+        self.client.patch('/api/encounters/%s/' % encounter, {'description': 'A pit of spikes'}, content_type='application/json')
+        self.assertEqual(self.search('spikes')['results'][0]['id'], self.log_trap['id'])
+        self.assertEqual(self.search('log')['results'], [])
+
+        self.client.delete('/api/scenes/%s/' % self.log_trap['scene_set'][0]['id'])
+        self.assertEqual([result['id'] for result in self.search('bugbear')['results']], [self.bugbear['id']])
+
+    def test_moved_scene(self):
+        scene = self.log_trap['scene_set'][0]['id']
+        self.client.patch('/api/scenes/%s/' % scene, {'adventure_id': self.unrelated['id']}, content_type='application/json')
+        results = self.search('bugbear log')['results']
+        self.assertEqual([result['id'] for result in results], [self.unrelated['id'], self.bugbear['id']])
+        self.assertEqual({match['type'] for match in results[0]['matches']}, {'scene', 'encounter'})
+
+    def test_pages(self):
+        for i in range(25):
+            create_adventure_tree(self.user, {'title': 'Dragon %s' % i, 'game': 'Pathfinder'})
+        first = self.search('dragon')
+        self.assertEqual(len(first['results']), 20)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+        self.assertEqual(len({result['id'] for result in first['results'] + second['results']}), 25)
+
+    def test_deleted_while_ranked(self):
+        ranked = search_adventures
+
+        def delete_after_ranking(*args, **kwargs):
+            results = ranked(*args, **kwargs)
+            Adventure.objects.filter(pk=self.bugbear['id']).delete()
+            return results
+
+        with mock.patch('server.views.search_adventures', delete_after_ranking):
+            response = self.client.get('/api/adventures/search/', {'q': 'bugbear', 'view': 'summary'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.json()['results']], [self.log_trap['id']])
+
+    def test_query_required(self):
+        self.assertEqual(self.client.get('/api/adventures/search/').status_code, 400)
+
+
+class AdventureNdjsonTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ndjson', password='ndjson')
+        self.client.force_login(self.user)
+        self.trees = [
+            {
+                'title': 'Adventure %s' % i,
+                'game': 'Pathfinder',
+                'status': 'archived' if i % 2 else 'active',
+                'climax': 'Climax',
+                'climax_progress': 50,
+                'custom_field_set': [{'name': 'Notes', 'value': 'Notes %s' % i}],
+                'scene_set': [{'sequence': 1, 'progress': 'Complete', 'encounter_set': [{'encounter_type': 'trap', 'custom_field_set': [{'name': 'DC', 'value': '15'}]}]}],
+            }
+            for i in range(5)
+        ]
+        for tree in self.trees:
+            create_adventure_tree(self.user, tree)
+
+    def export(self, query=''):
+        response = self.client.get('/api/adventures/export/' + query)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def import_lines(self, body):
+        return self.client.post('/api/adventures/import/', body, content_type='application/x-ndjson').json()
+
+    def test_export(self):
+        # The session, the user and the ids, then four queries for each chunk of adventures
+        with override_settings(ADVENTURE_EXPORT_CHUNK=2), self.assertNumQueries(15):
+            lines = self.export().splitlines()
+        adventures = Adventure.objects.filter(user_id=self.user).order_by('pk')
+        self.assertEqual(lines, [self.client.get('/api/adventures/%s/' % adventure.pk).content for adventure in adventures])
+        self.assertEqual(len(self.export('?status=archived').splitlines()), 2)
+
+    def test_round_trip(self):
+        exported = self.export()
+        importer = User.objects.create_user(username='importer', password='importer')
+        self.client.force_login(importer)
+        with override_settings(ADVENTURE_IMPORT_BATCH=2):
+            self.assertEqual(self.import_lines(exported), {'imported': 5, 'failed': 0, 'errors': []})
+
+        def content(line):
+            adventure = json.loads(line)
+            for key in ['id', 'user_id', 'created_at', 'last_modified', 'updated_at']:
+                del adventure[key]
+            # Ids differ between the copies, so only what they contain is compared
+            return json.loads(re.sub(r'"(id|adventure_id|scene_id|encounter_id)": \d+', r'"\1": 0', json.dumps(adventure)))
+
+        self.assertEqual([content(line) for line in self.export().splitlines()], [content(line) for line in exported.splitlines()])
+        self.assertEqual(self.client.get('/api/adventures/search/', {'q': 'Notes'}).json()['results'][0]['user_id'], importer.pk)
+
+    def test_import_errors(self):
+        body = '\n'.join([
+            json.dumps({'title': 'Good', 'game': 'Pathfinder'}),
+            '{"title": ',
+            '',
+            json.dumps({'game': 'Pathfinder'}),
+            json.dumps({'title': 'Also good', 'game': 'Pathfinder', 'scene_set': [{'sequence': 1}]}),
+        ])
+        result = self.import_lines(body)
+        self.assertEqual((result['imported'], result['failed']), (2, 2))
+        self.assertEqual([error['line'] for error in result['errors']], [2, 4])
+        self.assertIn('title', result['errors'][1]['error'])
+        self.assertEqual(Adventure.objects.filter(user_id=self.user, title__in=['Good', 'Also good']).count(), 2)
+
+
+class ProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='progress', password='progress')
+        self.client.force_login(self.user)
+        self.tree = create_adventure_tree(self.user, {
+            'title': 'The Hollow',
+            'game': 'Pathfinder',
+            'climax': 'The bugbear chief',
+            'scene_set': [{'sequence': 1, 'challenge': 'Cross the bridge', 'encounter_set': [{'encounter_type': 'trap'}, {'encounter_type': 'enemies'}]}],
+        })
+        self.scene = self.tree['scene_set'][0]
+
+    def progress(self, adventure_id):
+        return Adventure.objects.values_list('progress', flat=True).get(pk=adventure_id)
+
+    def test_created_with_climax(self):
+        adventure = self.client.post('/api/adventures/', {'title': 'Caves', 'game': 'Pathfinder', 'user_id': self.user.pk, 'climax': 'The dragon'}, content_type='application/json').json()
+        self.assertEqual(adventure['progress'], 0)
+        self.client.patch('/api/adventures/%s/' % adventure['id'], {'climax_progress': 100}, content_type='application/json')
+        self.assertEqual(self.progress(adventure['id']), 100)
+
+    def test_scene_transition(self):
+        changes = self.client.post('/api/scenes/%s/transition/' % self.scene['id'], {'progress': 'Complete', 'encounters': True}, content_type='application/json').json()
+        self.assertEqual(changes['scene'], {'id': self.scene['id'], 'progress': 'Complete'})
+        self.assertEqual(len(changes['encounters']), 2)
+        # The climax is still not started, so three of the four items are complete
+        self.assertEqual(changes['adventure']['progress'], 75)
+        self.assertEqual(self.progress(self.tree['id']), 75)
+
+    def test_encounter_transition(self):
+        encounter = self.scene['encounter_set'][0]['id']
+        changes = self.client.post('/api/encounters/%s/transition/' % encounter, {'progress': 'In Progress'}, content_type='application/json').json()
+        self.assertEqual(changes['adventure']['progress'], 12.5)
+        self.assertEqual(self.client.post('/api/encounters/%s/transition/' % encounter, {'progress': 'In Progress'}, content_type='application/json').json(), {})
+
+    def test_moved_scene(self):
+        other = create_adventure_tree(self.user, {'title': 'Caves', 'game': 'Pathfinder'})
+        self.client.post('/api/scenes/%s/transition/' % self.scene['id'], {'progress': 'Complete', 'encounters': True}, content_type='application/json')
+        self.client.patch('/api/scenes/%s/' % self.scene['id'], {'adventure_id': other['id']}, content_type='application/json')
+        self.assertEqual(self.progress(self.tree['id']), 0)
+        self.assertEqual(self.progress(other['id']), 100)
+
+    def test_other_users_progress(self):
+        self.client.force_login(User.objects.create_user(username='other', password='other'))
+        encounter = self.scene['encounter_set'][0]['id']
+        self.assertEqual(self.client.post('/api/scenes/%s/transition/' % self.scene['id'], {'progress': 'Complete', 'encounters': True}, content_type='application/json').status_code, 404)
+        self.assertEqual(self.client.post('/api/encounters/%s/transition/' % encounter, {'progress': 'Complete'}, content_type='application/json').status_code, 404)
+        self.assertEqual(self.client.patch('/api/scenes/%s/' % self.scene['id'], {'progress': 'Complete'}, content_type='application/json').status_code, 404)
+        self.assertEqual(self.progress(self.tree['id']), 0)
+
+
+class AdventureTreeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tree', password='tree')
+        self.client.force_login(self.user)
+
+    def post(self, tree):
+        return self.client.post('/api/adventures/tree/', tree, content_type='application/json')
+
+    def test_created(self):
+        response = self.post({
+            'title': 'The Hollow',
+            'game': 'Pathfinder',
+            'climax': 'The bugbear chief',
+            'custom_field_set': [{'name': 'Notes', 'value': 'Masks'}],
+            'scene_set': [
+                {'sequence': 1, 'challenge': 'Cross the bridge', 'progress': 'Complete', 'encounter_set': [{'encounter_type': 'trap', 'custom_field_set': [{'name': 'DC', 'value': '15'}]}]},
+                {'sequence': 2, 'challenge': 'Find the cave', 'custom_field_set': [{'name': 'Loot', 'value': 'Gold'}]},
+            ],
+        })
+        self.assertEqual(response.status_code, 201)
+        ids = response.json()
+        adventure = self.client.get('/api/adventures/%s/' % ids['id']).json()
+        self.assertEqual([scene['id'] for scene in adventure['scene_set']], [scene['id'] for scene in ids['scene_set']])
+        self.assertEqual(adventure['scene_set'][0]['encounter_set'][0]['custom_field_set'][0]['value'], '15')
+        self.assertEqual(adventure['scene_set'][1]['custom_field_set'][0]['id'], ids['scene_set'][1]['custom_field_set'][0]['id'])
+        self.assertEqual(adventure['custom_field_set'][0]['name'], 'Notes')
+        # One of the four items, the climax, two scenes and an encounter, is complete
+        self.assertEqual(adventure['progress'], 25)
+
+    def test_invalid_saves_nothing(self):
+        response = self.post({'title': 'The Hollow', 'game': 'Pathfinder', 'scene_set': [{'sequence': 1}, {'sequence': 2, 'challenge': 'Drop table adventure'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Adventure.objects.exists())
+
+    def test_long_encounter_type_truncated(self):
+        encounter_type = 'Social encounter with the village elders'
+        response = self.post({'title': 'The Hollow', 'game': 'Pathfinder', 'scene_set': [{'sequence': 1, 'encounter_set': [{'encounter_type': encounter_type}]}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Encounter.objects.get().encounter_type, encounter_type[:31])
+
+
+generation_params = {'game': 'Pathfinder', 'players': 4, 'scenes': 3, 'encounters': 2, 'plot_twists': 50, 'clues': 50}
+
+
+class StubProviderMixin:
+    """ Generates adventures with the stub provider, so no test calls Gemini """
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {'GENERATION_PROVIDER': 'stub', 'GENERATION_STUB_LATENCY': '0', 'GENERATION_STUB_FAILURE_RATE': '0'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Admission slots are created once per process, but each test rolls them back
+        patcher = mock.patch.object(admission, 'created_slots', set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def provider_calls(self):
+        return sum(model.calls for model in get_provider('stub').models.values())
+
+
+
+class StubProviderTestCase(StubProviderMixin, TestCase):
+    pass
+
+
+class ThreadedStubProviderTestCase(StubProviderMixin, TransactionTestCase):
+    """ For generation that calls the provider from worker threads, whose call guards and observers use the database outside a test's transaction """
+
+
+class ProviderTests(StubProviderTestCase):
+    def test_chosen_by_setting(self):
+        self.assertIs(get_provider(), get_provider('stub'))
+        self.assertIs(get_provider().model(temperature=0), get_provider().model(temperature=0))
+        with self.assertRaises(TypeError):
+            Provider()
+
+    def test_stub_deterministic(self):
+        first = StubModel(latency=0, failure_rate=0, seed='a').generate_content('include 2 scenes').text
+        self.assertEqual(StubModel(latency=0, failure_rate=0, seed='a').generate_content('include 2 scenes').text, first)
+        self.assertNotEqual(StubModel(latency=0, failure_rate=0, seed='b').generate_content('include 2 scenes').text, first)
+        self.assertEqual(len(json.loads(first)['Rising_Action']), 2)
+
+    def test_stub_failures(self):
+        with self.assertRaises(StubProviderError):
+            StubModel(latency=0, failure_rate=1, seed='a').generate_content('include 2 scenes')
+
+
+class GenerationCacheTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(utils, 'counter_buffer', utils.CounterBuffer())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        calls = self.provider_calls()
+        adventure = generate_cached_adventure(generation_params)
+        self.assertEqual(generate_cached_adventure({**generation_params, 'game': ' pathfinder '}), adventure)
+        self.assertEqual(self.provider_calls(), calls + 1)
+
+    def test_stats(self):
+        generate_cached_adventure(generation_params)
+        generate_cached_adventure(generation_params)
+        self.client.force_login(User.objects.create_user(username='stats', password='stats', is_staff=True))
+        stats = self.client.get('/api/generation-cache/stats/').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_expired(self):
+        generate_cached_adventure(generation_params)
+        Cached_Adventure.objects.update(expires_at=timezone.now())
+        # The finished flight would otherwise still be shared for the coalescing window
+        Generation_Flight.objects.all().delete()
+        calls = self.provider_calls()
+        generate_cached_adventure(generation_params)
+        self.assertEqual(self.provider_calls(), calls + 1)
+
+    @override_settings(GENERATION_CACHE_MAX_ENTRIES=1)
+    def test_evicted(self):
+        generate_cached_adventure(generation_params)
+        generate_cached_adventure({**generation_params, 'players': 5})
+        self.assertEqual(list(Cached_Adventure.objects.values_list('params__players', flat=True)), [5])
+
+    def test_fresh_skips_flight(self):
+        generate_cached_adventure(generation_params)
+        calls = self.provider_calls()
+        # The first flight's result is kept for the coalescing window, but a fresh request generates its own
+        generate_cached_adventure(generation_params, fresh=True)
+        self.assertEqual(self.provider_calls(), calls + 1)
+
+
+class SingleFlightTests(TestCase):
+    def test_coalesced(self):
+        generate = mock.Mock(return_value={'Exposition': 'Once'})
+        self.assertEqual(single_flight('key', generate), {'Exposition': 'Once'})
+        # Within the coalescing window a repeated request gets the finished flight's result
+        self.assertEqual(single_flight('key', generate), {'Exposition': 'Once'})
+        self.assertEqual(generate.call_count, 1)
+
+    def test_failed_flight_retried(self):
+        generate = mock.Mock(side_effect=[ValueError('failed'), {'Exposition': 'Twice'}])
+        with self.assertRaises(ValueError):
+            single_flight('key', generate)
+        self.assertEqual(single_flight('key', generate), {'Exposition': 'Twice'})
+
+
+class GenerationJobTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='jobs', password='jobs')
+        self.client.force_login(self.user)
+        self.job = self.client.post('/api/generation-jobs/', generation_params, content_type='application/json').json()
+
+    def make_stale(self):
+        Generation_Job.objects.filter(pk=self.job['id']).update(started_at=timezone.now() - timedelta(seconds=settings.GENERATION_JOB_LEASE + 1))
+
+    def test_submitted(self):
+        self.assertEqual(self.job['status'], 'queued')
+        self.assertEqual(self.client.get('/api/generation-jobs/%s/result/' % self.job['id']).status_code, 202)
+
+    def test_claimed_once(self):
+        job = claim_job('first')
+        self.assertEqual((job.pk, job.status, job.worker, job.attempts), (self.job['id'], 'running', 'first', 1))
+        self.assertIsNone(claim_job('second'))
+
+    def test_stale_reclaimed(self):
+        claim_job('first')
+        self.make_stale()
+        job = claim_job('second')
+        self.assertEqual((job.worker, job.attempts), ('second', 2))
+
+    def test_stale_exhausted_failed(self):
+        for worker in range(settings.GENERATION_JOB_MAX_ATTEMPTS):
+            claim_job(str(worker))
+            self.make_stale()
+        self.assertIsNone(claim_job('last'))
+        job = self.client.get('/api/generation-jobs/%s/' % self.job['id']).json()
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('did not finish', job['error'])
+
+    def test_result_polled(self):
+        run_job(claim_job('worker'))
+        self.assertEqual(self.client.get('/api/generation-jobs/%s/' % self.job['id']).json()['status'], 'complete')
+        adventure = self.client.get('/api/generation-jobs/%s/result/' % self.job['id']).json()
+        self.assertEqual(len(adventure['Rising Action']), 3)
+
+
+class AdventureStreamParserTests(TestCase):
+    def test_parts(self):
+        text = json.dumps({
+            'Exposition': 'A "quoted" {brace} and [bracket]',
+            'Incitement': 'Escaped \\ backslash',
+            'Rising_Action': [{'challenge': 'One', 'encounters': [{'type': 'trap'}]}, {'challenge': 'Two', 'encounters': []}],
+            'Climax': 'End',
+            'Denoument': 'Reward',
+        })
+        parser = AdventureStreamParser()
+        parts = []
+        # Chunks split strings, escapes and nesting at arbitrary points
+        for start in range(0, len(text), 7):
+            parts.extend(parser.feed(text[start:start + 7]))
+        self.assertEqual(parts, [
+            ('Exposition', 'A "quoted" {brace} and [bracket]'),
+            ('Incitement', 'Escaped \\ backslash'),
+            ('Rising_Action', {'challenge': 'One', 'encounters': [{'type': 'trap'}]}),
+            ('Rising_Action', {'challenge': 'Two', 'encounters': []}),
+            ('Climax', 'End'),
+            ('Denoument', 'Reward'),
+        ])
+        self.assertFalse(parser.unterminated())
+
+    def test_unterminated(self):
+        parser = AdventureStreamParser()
+        self.assertEqual(parser.feed('{"Exposition": "Once", "Rising_Action": [{"challenge": "Cut'), [('Exposition', 'Once')])
+        self.assertTrue(parser.unterminated())
+
+
+class StreamAdventureTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='stream', password='stream')
+        self.client.force_login(self.user)
+
+    def stream(self):
+        parts = list(stream_adventure(**generation_params))
+        return [key for key, part in parts], parts[-1][1]
+
+    def test_streamed(self):
+        calls = self.provider_calls()
+        keys, adventure = self.stream()
+        self.assertEqual(keys, ['Exposition', 'Incitement', 'Rising_Action', 'Rising_Action', 'Rising_Action', 'Climax', 'Denoument', 'Adventure'])
+        self.assertEqual(self.provider_calls(), calls + 1)
+
+    def test_invalid_part_repaired(self):
+        respond = StubModel.respond
+
+        def long_exposition(model, prompt, rng):
+            response = respond(model, prompt, rng)
+            if 'is invalid' not in prompt:
+                response['Exposition'] = 'Long ' * 200
+            return response
+
+        calls = self.provider_calls()
+        with mock.patch.object(StubModel, 'respond', long_exposition):
+            keys, adventure = self.stream()
+        # Nothing is yielded after the invalid exposition until it is repaired, so the parts keep their order
+        self.assertEqual(keys, ['Exposition', 'Incitement', 'Rising_Action', 'Rising_Action', 'Rising_Action', 'Climax', 'Denoument', 'Adventure'])
+        self.assertLess(len(adventure.Exposition), 500)
+        self.assertEqual(self.provider_calls(), calls + 2)
+
+    def test_failed_stream_retried(self):
+        generate_content = StubModel.generate_content
+
+        def fail_stream(model, contents, stream=False, **kwargs):
+            if stream:
+                raise ConnectionError('Stream dropped')
+            return generate_content(model, contents, stream, **kwargs)
+
+        with mock.patch.object(StubModel, 'generate_content', fail_stream), mock.patch('server.palm.RetryBudget.backoff'):
+            keys, adventure = self.stream()
+        self.assertEqual(keys[-1], 'Adventure')
+        self.assertEqual(len(adventure.Rising_Action), 3)
+
+    def test_dropped_stream_keeps_streamed_parts(self):
+        generate_content = StubModel.generate_content
+        respond = StubModel.respond
+
+        def drop_midway(model, contents, stream=False, **kwargs):
+            response = generate_content(model, contents, stream, **kwargs)
+            if not stream:
+                return response
+            chunks = list(response)
+
+            def dropped():
+                yield from chunks[:len(chunks) // 2]
+                raise ConnectionError('Stream dropped')
+            return dropped()
+
+        responses = []
+
+        def retried_differently(model, prompt, rng):
+            response = respond(model, prompt, rng)
+            responses.append(response)
+            if len(responses) > 1:
+                response = {
+                    'Exposition': 'Retried exposition',
+                    'Incitement': 'Retried incitement',
+                    'Rising_Action': [{**scene, 'challenge': 'Retried challenge'} for scene in response['Rising_Action']],
+                    'Climax': 'Retried climax',
+                    'Denoument': 'Retried denoument',
+                }
+            return response
+
+        with mock.patch.object(StubModel, 'generate_content', drop_midway), mock.patch.object(StubModel, 'respond', retried_differently), mock.patch.object(RetryBudget, 'backoff'):
+            parts = list(stream_adventure(**generation_params))
+        adventure = parts[-1][1]
+        scenes = [part for key, part in parts if key == 'Rising_Action']
+        # The parts streamed before the drop are kept, and the retry fills in only the rest
+        self.assertNotEqual(adventure.Exposition, 'Retried exposition')
+        self.assertEqual(adventure.Climax, 'Retried climax')
+        self.assertEqual(scenes, adventure.Rising_Action)
+        for key, part in parts[:-1]:
+            if key != 'Rising_Action':
+                self.assertEqual(part, getattr(adventure, key))
+
+    def events(self):
+        response = self.client.post('/api/generate-adventure/stream/', generation_params, content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode()
+        return re.findall(r'^event: (\w+)$', content, re.MULTILINE), json.loads(content.rsplit('data: ', 1)[1])
+
+    def test_events(self):
+        names, adventure = self.events()
+        self.assertEqual(names, ['exposition', 'incitement', 'scene', 'scene', 'scene', 'climax', 'denoument', 'complete'])
+        self.assertEqual(len(adventure['Rising Action']), 3)
+        # The streamed adventure is cached, and a repeated request gets the same events from the cache
+        calls = self.provider_calls()
+        self.assertEqual(self.events(), (names, adventure))
+        self.assertEqual(self.provider_calls(), calls)
+
+
+def truncating(cut):
+    """ Patches the stub so a response stops after cut characters at the output limit, and a continuation returns the rest """
+    generate_content = StubModel.generate_content
+    responses = {}
+
+    def generate(model, contents, stream=False, **kwargs):
+        if isinstance(contents, str):
+            response = generate_content(model, contents, stream, **kwargs)
+            responses['text'] = response.text
+            truncated = StubResponse(contents, response.text[:cut])
+            truncated.candidates[0].finish_reason.name = 'MAX_TOKENS'
+            return truncated
+        # The continuation repeats a little of the end of the partial response, which stitch drops
+        return StubResponse(json.dumps(contents), responses['text'][cut - 20:])
+
+    return mock.patch.object(StubModel, 'generate_content', generate)
+
+
+class ContinuationTests(StubProviderTestCase):
+    def guarded(self):
+        calls = []
+        return calls, mock.patch.object(palm, 'call_guards', [calls.append])
+
+    def test_stitch(self):
+        self.assertEqual(palm.stitch('{"Exposition": "Once upon', 'Exposition": "Once upon a time"}'), '{"Exposition": "Once upon a time"}')
+        self.assertEqual(palm.stitch('{"a": ', '```json\n1}'), '{"a": 1}')
+
+    def test_continued(self):
+        model = get_provider('stub').model(response_mime_type='application/json')
+        budget = RetryBudget()
+        budget.spend()
+        calls, guards = self.guarded()
+        with truncating(100), guards:
+            response = model.generate_content('Write an adventure')
+            text = continue_response(model, 'Write an adventure', response.text, 'MAX_TOKENS', budget)
+        json.loads(text)
+        self.assertEqual([call.operation for call in calls], ['continuation'])
+        self.assertEqual(budget.used, 2)
+
+    def test_budget_spent(self):
+        model = get_provider('stub').model(response_mime_type='application/json')
+        budget = RetryBudget(attempts=1)
+        budget.spend()
+        with truncating(100):
+            response = model.generate_content('Write an adventure')
+            # With no attempts left the response is not continued
+            self.assertEqual(continue_response(model, 'Write an adventure', response.text, 'MAX_TOKENS', budget), response.text)
+
+    def test_stream_continued(self):
+        calls, guards = self.guarded()
+        with truncating(300), guards:
+            parts = list(stream_adventure(**generation_params))
+        self.assertEqual([key for key, part in parts].count('Rising_Action'), 3)
+        self.assertEqual([(call.operation, call.attempt) for call in calls], [('stream', 1), ('continuation', 2)])
+
+
+@override_settings(GENERATION_BURST=1, GENERATION_USER_CONCURRENCY=1)
+class AdmissionTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='admission', password='admission')
+        self.client.force_login(self.user)
+
+    def generate(self, **params):
+        return self.client.post('/api/generate-adventure/', {**generation_params, **params}, content_type='application/json')
+
+    def test_cache_hits_admitted_free(self):
+        self.assertEqual(self.generate().status_code, 200)
+        self.assertEqual(self.generate().status_code, 200)
+        self.assertEqual(self.client.post('/api/generate-adventure/stream/', generation_params, content_type='application/json').status_code, 200)
+        # The one rate token was spent on the first request, which generated
+        response = self.generate(players=5)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_follower_admitted_free(self):
+        key = cache_key(get_generation_params(generation_params))
+        Generation_Flight.objects.create(key=key, result={'Exposition': 'Shared'}, expires_at=timezone.now() + timedelta(seconds=30))
+        # The user is already generating as many adventures as they may at once
+        claim_slot('run', settings.GENERATION_CONCURRENCY, self.user)
+        response = self.generate()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'Exposition': 'Shared'})
+        self.assertEqual(self.generate(players=5).status_code, 429)
+
+    def test_rejected_keeps_token(self):
+        slot = claim_slot('run', settings.GENERATION_CONCURRENCY, self.user)
+        self.assertEqual(self.generate().status_code, 429)
+        # The request turned away for concurrency did not spend the user's one rate token
+        release_slot(slot)
+        self.assertEqual(self.generate().status_code, 200)
+
+    @override_settings(GENERATION_CONCURRENCY=1, GENERATION_QUEUE_SIZE=0)
+    def test_queue_full_refunds_token(self):
+        other = User.objects.create_user(username='other', password='other')
+        slot = claim_slot('run', settings.GENERATION_CONCURRENCY, other)
+        self.assertEqual(self.generate().status_code, 429)
+        release_slot(slot)
+        self.assertEqual(self.generate().status_code, 200)
+
+
+@override_settings(ADVENTURE_POOL_COMBINATIONS=1, ADVENTURE_POOL_SIZE=1)
+class AdventurePoolTests(StubProviderTestCase):
+    def test_ranked_within_window(self):
+        record_request('old', generation_params)
+        # Requests from before the window no longer count, however many there were
+        stat = Generation_Request_Count.objects.get().stat_id
+        Generation_Request_Count.objects.create(stat_id=stat, day=timezone.now().date() - timedelta(days=30), count=100)
+        for i in range(2):
+            record_request('recent', {**generation_params, 'game': 'Starfinder'})
+        self.assertEqual([stat.key for stat in popular_requests()], ['recent'])
+
+        fill_pool()
+        self.assertEqual(Generation_Request_Count.objects.filter(stat_id__key='old').count(), 1)
+
+    def test_filled_and_claimed(self):
+        key = cache_key(generation_params)
+        record_request(key, generation_params)
+        fill_pool()
+        self.assertEqual(Pooled_Adventure.objects.filter(key=key).count(), 1)
+
+        calls = self.provider_calls()
+        self.assertIsNotNone(find_adventure(generation_params, fresh=True)[1])
+        # Each pooled adventure is handed out once
+        self.assertIsNone(find_adventure(generation_params, fresh=True)[1])
+        self.assertEqual(self.provider_calls(), calls)
+
+
+class RetryBudgetTests(StubProviderTestCase):
+    def test_invalid_scene_repaired(self):
+        respond = StubModel.respond
+
+        def missing_setting(model, prompt, rng):
+            response = respond(model, prompt, rng)
+            if 'is invalid' not in prompt:
+                del response['Rising_Action'][1]['setting']
+            return response
+
+        calls = self.provider_calls()
+        with mock.patch.object(StubModel, 'respond', missing_setting):
+            adventure = create_adventure(**generation_params)
+        # Only the invalid scene is requested again
+        self.assertTrue(adventure.Rising_Action[1].setting)
+        self.assertEqual(self.provider_calls(), calls + 2)
+
+    def test_budget_exhausted(self):
+        calls = self.provider_calls()
+        # Every response and every repair is missing most of the adventure
+        with mock.patch.object(StubModel, 'respond', return_value={'Exposition': 'Only'}), mock.patch.object(RetryBudget, 'backoff'):
+            with self.assertRaises(GenerationError):
+                create_adventure(**generation_params)
+        self.assertEqual(self.provider_calls(), calls + MAX_ATTEMPTS)
+
+    def test_failures_backed_off(self):
+        with mock.patch.object(StubModel, 'generate_content', side_effect=StubProviderError('Injected')), mock.patch.object(RetryBudget, 'backoff') as backoff:
+            with self.assertRaises(GenerationError):
+                create_adventure(**generation_params)
+        self.assertEqual(backoff.call_count, MAX_ATTEMPTS)
+
+    def test_deadline(self):
+        budget = RetryBudget(deadline=0)
+        with self.assertRaises(GenerationError):
+            budget.spend()
+
+
+class OutlineTests(ThreadedStubProviderTestCase):
+    def test_outline(self):
+        calls = self.provider_calls()
+        finalizer = mock.Mock()
+        with mock.patch.object(palm, 'worker_finalizers', palm.worker_finalizers + [finalizer]):
+            adventure = create_adventure(**generation_params, outline=True)
+        # Each scene's worker cleans up after itself, closing its database connections
+        self.assertEqual(finalizer.call_count, 3)
+        self.assertEqual(len(adventure.Rising_Action), 3)
+        self.assertTrue(all(1 <= len(scene.encounters) <= 2 for scene in adventure.Rising_Action))
+        # One call for the outline, and one for each scene, each recorded from the thread that made it
+        self.assertEqual(self.provider_calls(), calls + 4)
+        self.assertEqual(sorted(Generation_Metric.objects.values_list('operation', flat=True)), ['outline', 'scene', 'scene', 'scene'])
+
+    # The breaker would otherwise open on the failed scenes and stop the calls that are left
+    @override_settings(GENERATION_BREAKER_MIN_CALLS=100)
+    def test_scenes_share_budget(self):
+        respond = StubModel.respond
+
+        def failing_scenes(model, prompt, rng):
+            if 'Write scene' in prompt:
+                raise StubProviderError('Injected')
+            return respond(model, prompt, rng)
+
+        calls = self.provider_calls()
+        with mock.patch.object(StubModel, 'respond', failing_scenes), mock.patch.object(RetryBudget, 'backoff'):
+            with self.assertRaises(GenerationError):
+                create_adventure(**generation_params, outline=True)
+        # The outline, then one attempt for each scene and the retries a single request gets, rather than a full budget for every scene
+        self.assertEqual(self.provider_calls(), calls + 1 + 3 + MAX_ATTEMPTS - 1)
+
+    def test_streamed_in_order(self):
+        keys = [key for key, part in stream_adventure(**generation_params, outline=True)]
+        self.assertEqual(keys, ['Exposition', 'Incitement', 'Rising_Action', 'Rising_Action', 'Rising_Action', 'Climax', 'Denoument', 'Adventure'])
+
+    def test_cached_separately(self):
+        self.assertEqual(get_generation_params({**generation_params, 'outline': False}), get_generation_params(generation_params))
+        self.assertNotEqual(cache_key(get_generation_params({**generation_params, 'outline': True})), cache_key(get_generation_params(generation_params)))
+
+
+class GenerateAndSaveTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='save', password='save')
+        self.client.force_login(self.user)
+
+    def test_saved(self):
+        response = self.client.post('/api/generate-adventure/save/', {**generation_params, 'title': 'Generated'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        saved = response.json()
+        self.assertEqual((saved['title'], saved['game'], len(saved['scene_set'])), ('Generated', 'Pathfinder', 3))
+        self.assertEqual([scene['sequence'] for scene in saved['scene_set']], [1, 2, 3])
+        adventure = Adventure.objects.get(pk=saved['id'])
+        self.assertEqual(adventure.user_id, self.user)
+        # Every scene and encounter is not started, and the climax counts too
+        self.assertEqual(adventure.progress_items, 1 + 3 + sum(len(scene['encounter_set']) for scene in saved['scene_set']))
+
+    def test_title_required(self):
+        response = self.client.post('/api/generate-adventure/save/', generation_params, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Adventure.objects.exists())
+
+
+class GenerationMetricTests(StubProviderTestCase):
+    def test_calls_recorded(self):
+        respond = StubModel.respond
+
+        def missing_setting(model, prompt, rng):
+            response = respond(model, prompt, rng)
+            if 'is invalid' not in prompt:
+                del response['Rising_Action'][0]['setting']
+            return response
+
+        with mock.patch.object(StubModel, 'respond', missing_setting):
+            create_adventure(**generation_params)
+        adventure, repair = Generation_Metric.objects.order_by('pk')
+        self.assertEqual((adventure.operation, adventure.model, adventure.attempt, adventure.finish_reason), ('adventure', 'stub', 1, 'STOP'))
+        self.assertEqual(adventure.validation_errors, ['missing'])
+        self.assertGreater(adventure.output_tokens, 0)
+        self.assertEqual((repair.operation, repair.attempt, repair.validation_errors, repair.error), ('repair', 2, [], None))
+
+    def test_summary(self):
+        create_adventure(**generation_params)
+        with mock.patch.object(StubModel, 'generate_content', side_effect=StubProviderError('Injected')), mock.patch.object(RetryBudget, 'backoff'):
+            with self.assertRaises(GenerationError):
+                create_adventure(**generation_params)
+        self.client.force_login(User.objects.create_user(username='metrics', password='metrics', is_staff=True))
+        summary = self.client.get('/api/generation-metrics/').json()['adventure']
+        self.assertEqual((summary['calls'], summary['failures'], summary['retries']), (1 + MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS - 1))
+        self.assertEqual(summary['errors'], {'StubProviderError': MAX_ATTEMPTS})
+
+
+class VariantTests(ThreadedStubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='variants', password='variants')
+        self.client.force_login(self.user)
+
+    def variants(self, **data):
+        return self.client.post('/api/generate-adventure/variants/', {**generation_params, **data}, content_type='application/json')
+
+    def test_variants(self):
+        calls = self.provider_calls()
+        results = self.variants(variants=3).json()
+        self.assertEqual([result['variant'] for result in results['variants']], [0, 1, 2])
+        self.assertEqual(results['errors'], [])
+        # Variants are never cached or coalesced
+        self.assertEqual(self.provider_calls(), calls + 3)
+        self.assertEqual(Generation_Metric.objects.filter(operation='adventure').count(), 3)
+
+    def test_streamed(self):
+        content = b''.join(self.variants(variants=2, stream=True).streaming_content).decode()
+        self.assertEqual(sorted(re.findall(r'^event: (\w+)$', content, re.MULTILINE)), ['complete', 'variant', 'variant'])
+        self.assertEqual(json.loads(content.rsplit('data: ', 1)[1]), {'succeeded': 2, 'failed': 0})
+
+    # The breaker would otherwise open on the failed variants and stop the calls that are left
+    @override_settings(GENERATION_BREAKER_MIN_CALLS=100)
+    def test_failed(self):
+        calls = self.provider_calls()
+        with mock.patch.object(StubModel, 'respond', side_effect=StubProviderError('Injected')), mock.patch.object(RetryBudget, 'backoff'):
+            response = self.variants(variants=2)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(sorted(error['variant'] for error in response.json()['errors']), [0, 1])
+        # One attempt for each variant and the retries a single request gets, rather than a full budget for every variant
+        self.assertEqual(self.provider_calls(), calls + 2 + MAX_ATTEMPTS - 1)
+
+    def test_limits(self):
+        self.assertEqual(self.variants(variants=settings.GENERATION_MAX_VARIANTS + 1).status_code, 400)
+        self.assertEqual(self.variants(variants='many').status_code, 400)
+
+
+class RegenerationTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='regenerate', password='regenerate')
+        self.client.force_login(self.user)
+        self.tree = create_adventure_tree(self.user, {
+            'title': 'The Hollow',
+            'game': 'Pathfinder',
+            'climax': 'The bugbear chief',
+            'scene_set': [
+                {'sequence': 1, 'challenge': 'Cross the bridge', 'encounter_set': [{'encounter_type': 'trap', 'description': 'A swinging log'}, {'encounter_type': 'enemies', 'description': 'Bugbears'}]},
+                {'sequence': 2, 'challenge': 'Find the cave'},
+            ],
+        })
+        self.scene = self.tree['scene_set'][0]
+
+    def test_scene(self):
+        scene = self.client.post('/api/scenes/%s/regenerate/' % self.scene['id'], {}, content_type='application/json').json()
+        self.assertEqual(scene['id'], self.scene['id'])
+        self.assertTrue(scene['challenge'].startswith('Stub challenge'))
+        # The scene keeps its number of encounters
+        self.assertEqual(len(scene['encounter_set']), 2)
+        self.assertEqual(self.client.get('/api/adventures/%s/' % self.tree['id']).json()['scene_set'][1]['challenge'], 'Find the cave')
+
+    def test_encounter(self):
+        encounter = self.scene['encounter_set'][1]
+        regenerated = self.client.post('/api/encounters/%s/regenerate/' % encounter['id'], {}, content_type='application/json').json()
+        self.assertTrue(regenerated['description'].startswith('Stub encounter'))
+        self.assertEqual(self.client.get('/api/encounters/%s/' % self.scene['encounter_set'][0]['id']).json()['description'], 'A swinging log')
+
+    def test_plot_point(self):
+        response = self.client.post('/api/adventures/%s/regenerate/' % self.tree['id'], {'part': 'climax'}, content_type='application/json').json()
+        self.assertTrue(response['climax'].startswith('Stub finale'))
+        self.assertEqual(Adventure.objects.get(pk=self.tree['id']).climax, response['climax'])
+        self.assertEqual(self.client.post('/api/adventures/%s/regenerate/' % self.tree['id'], {'part': 'title'}, content_type='application/json').status_code, 400)
+
+
+@override_settings(GENERATION_BREAKER_MIN_CALLS=4, GENERATION_BREAKER_ERROR_RATE=0.5)
+class CircuitBreakerTests(StubProviderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='breaker', password='breaker')
+        self.client.force_login(self.user)
+
+    def fail(self):
+        with mock.patch.object(StubModel, 'generate_content', side_effect=StubProviderError('Injected')), mock.patch.object(RetryBudget, 'backoff'):
+            with self.assertRaises(GenerationError):
+                create_adventure(**generation_params)
+
+    def test_opened(self):
+        self.fail()
+        self.assertEqual(Circuit_Breaker.objects.get(name='stub').state, 'open')
+        # While the breaker is open calls fail fast, without reaching the provider
+        calls = self.provider_calls()
+        with self.assertRaises(ProviderUnavailable):
+            create_adventure(**generation_params)
+        self.assertEqual(self.provider_calls(), calls)
+
+        response = self.client.post('/api/generate-adventure/', generation_params, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        # The stream fails fast too, before the user is admitted
+        tokens = list(Rate_Bucket.objects.values_list('tokens', flat=True))
+        response = self.client.post('/api/generate-adventure/stream/', generation_params, content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(list(Rate_Bucket.objects.values_list('tokens', flat=True)), tokens)
+        self.assertEqual(self.client.get('/api/generation-health/').json()['status'], 'degraded')
+
+    def test_probe_closes(self):
+        self.fail()
+        Circuit_Breaker.objects.update(opened_at=timezone.now() - timedelta(seconds=settings.GENERATION_BREAKER_COOLDOWN + 1))
+        create_adventure(**generation_params)
+        self.assertEqual(Circuit_Breaker.objects.get(name='stub').state, 'closed')
+        self.assertEqual(self.client.get('/api/generation-health/').json()['status'], 'ok')
+
+    def test_failed_probe_reopens(self):
+        self.fail()
+        Circuit_Breaker.objects.update(opened_at=timezone.now() - timedelta(seconds=settings.GENERATION_BREAKER_COOLDOWN + 1))
+        # The probe fails, and the calls that follow it are not let through
+        with mock.patch.object(StubModel, 'generate_content', side_effect=StubProviderError('Injected')), mock.patch.object(RetryBudget, 'backoff'):
+            with self.assertRaises(ProviderUnavailable):
+                create_adventure(**generation_params)
+        breaker = Circuit_Breaker.objects.get(name='stub')
+        self.assertEqual(breaker.state, 'open')
+        self.assertGreater(breaker.opened_at, timezone.now() - timedelta(seconds=5))
@@ -10,11 +10,19 @@ router.register(r'adventures', views.AdventureViewSet, basename='adventures')
 router.register(r'scenes', views.SceneViewSet)
 router.register(r'encounters', views.EncounterViewSet)
 router.register(r'custom-fields', views.CustomFieldViewSet)
+router.register(r'generation-jobs', views.GenerationJobViewSet, basename='generation-jobs')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('password/reset/', views.CustomPasswordResetView.as_view(), name='reset_password'),
     path('password/reset/confirm/', views.CustomPasswordResetConfirmView.as_view(), name='set_new_password'),
     path('generate-adventure/', views.GenerateAdventureView.as_view(), name='generate_adventure'),
+    path('generate-adventure/save/', views.GenerateAndSaveAdventureView.as_view(), name='generate_and_save_adventure'),
+    path('generate-adventure/variants/', views.GenerateAdventureVariantsView.as_view(), name='generate_adventure_variants'),
+    path('generate-adventure/stream/', views.StreamAdventureView.as_view(), name='stream_adventure'),
+    path('generation-cache/stats/', views.GenerationCacheStatsView.as_view(), name='generation_cache_stats'),
+    path('adventure-cache/stats/', views.AdventureCacheStatsView.as_view(), name='adventure_cache_stats'),
+    path('generation-metrics/', views.GenerationMetricsView.as_view(), name='generation_metrics'),
+    path('generation-health/', views.GenerationHealthView.as_view(), name='generation_health'),
     path('csrf_cookie/', views.GetCSRFToken.as_view(), name='csrf_cookie')#,
 ]
\ No newline at end of file
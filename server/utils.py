@@ -2,7 +2,9 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 import os
 import random
 import string
+import threading
 import time
+from collections import defaultdict
 from django.contrib.sessions.models import Session
 from django.contrib.auth import update_session_auth_hash, get_user_model
 from django.conf import settings
@@ -13,6 +15,8 @@ from django.http import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.db.models import F
+from server.models import Counter
 
 def login_required_ajax(view_func):
     def wrapped_view(*args, **kwargs):
@@ -70,4 +74,48 @@ def update_secret_key():
     os.environ['SECRET_KEY'] = force_str(new_secret_key)
 
     # Rotate session keys and update session hashes
-    rotate_session_keys()
\ No newline at end of file
+    rotate_session_keys()
+
+class CounterBuffer:
+    """ Adds up counter increments made in this process, so they can be written to the database together """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def add(self, name, amount):
+        """ Adds to a counter, returning whether the buffer is due to be flushed """
+        with self.lock:
+            self.counts[name] += amount
+            return time.monotonic() - self.flushed_at >= settings.COUNTER_FLUSH_INTERVAL
+
+    def take(self):
+        with self.lock:
+            counts = self.counts
+            self.counts = defaultdict(int)
+            self.flushed_at = time.monotonic()
+            return counts
+
+counter_buffer = CounterBuffer()
+
+def add_counter(name, amount):
+    # Counters live in the database so every worker process adds to the same total, with one atomic update once they exist
+    if not Counter.objects.filter(name=name).update(value=F('value') + amount):
+        counter, created = Counter.objects.get_or_create(name=name, defaults={'value': amount})
+        if not created:
+            Counter.objects.filter(name=name).update(value=F('value') + amount)
+
+def flush_counters():
+    for name, amount in counter_buffer.take().items():
+        add_counter(name, amount)
+
+def increment_counter(name, amount=1):
+    # Increments are buffered, so hot read paths write each counter at most once every COUNTER_FLUSH_INTERVAL seconds rather than on every call
+    if counter_buffer.add(name, amount):
+        flush_counters()
+
+def get_counter(name):
+    """ Returns a counter's total. Increments still buffered in other processes are not included until they flush """
+    flush_counters()
+    return Counter.objects.filter(name=name).values_list('value', flat=True).first() or 0
@@ -0,0 +1,66 @@
+from calendar import timegm
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags
+from rest_framework.exceptions import APIException
+from .models import Adventure, Scene, Encounter, Custom_Field
+
+class PreconditionFailed(APIException):
+    status_code = 412
+    default_detail = 'This adventure has changed since you loaded it. Please reload it and try again.'
+    default_code = 'precondition_failed'
+
+def adventure_etag(version):
+    return '"%s"' % version
+
+def version_headers(version, updated_at):
+    return {'ETag': adventure_etag(version), 'Last-Modified': http_date(timegm(updated_at.utctimetuple()))}
+
+def adventure_version_headers(adventure_id):
+    return version_headers(*Adventure.objects.values_list('version', 'updated_at').get(pk=adventure_id))
+
+def check_if_match(request, adventure):
+    """ Raises PreconditionFailed, so the client gets a 412, when the request's If-Match header does not match the adventure's current version """
+    header = request.META.get('HTTP_IF_MATCH')
+    if header is None:
+        return
+    etags = parse_etags(header)
+    if '*' not in etags and adventure_etag(adventure.version) not in etags:
+        raise PreconditionFailed()
+
+def bump_version(adventure_id):
+    Adventure.objects.filter(pk=adventure_id).update(version=F('version') + 1, updated_at=timezone.now())
+
+def adventure_id_of(instance):
+    """ Returns the id of the adventure a scene, encounter or custom field belongs to """
+    if isinstance(instance, Scene):
+        return instance.adventure_id_id
+    if isinstance(instance, Encounter):
+        return Scene.objects.filter(pk=instance.scene_id_id).values_list('adventure_id', flat=True).first()
+    # A custom field belongs to an adventure, a scene or an encounter
+    if instance.adventure_id_id:
+        return instance.adventure_id_id
+    if instance.scene_id_id:
+        return Scene.objects.filter(pk=instance.scene_id_id).values_list('adventure_id', flat=True).first()
+    return Encounter.objects.filter(pk=instance.encounter_id_id).values_list('scene_id__adventure_id', flat=True).first()
+
+def adventure_saved(sender, instance, created, **kwargs):
+    if not created:
+        bump_version(instance.pk)
+
+def part_saved(sender, instance, **kwargs):
+    bump_version(adventure_id_of(instance))
+
+def part_deleted(sender, instance, origin=None, **kwargs):
+    # Parts deleted along with an adventure or a scene are covered by the deletion they cascade from
+    if origin is instance:
+        bump_version(adventure_id_of(instance))
+
+def connect_signals():
+    """ Bumps an adventure's version whenever it, or any of its scenes, encounters or custom fields, is saved or deleted.
+    Bulk inserts and queryset updates do not send signals, so code that uses them calls bump_version itself """
+    post_save.connect(adventure_saved, sender=Adventure)
+    for model in [Scene, Encounter, Custom_Field]:
+        post_save.connect(part_saved, sender=model)
+        post_delete.connect(part_deleted, sender=model)
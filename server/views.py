@@ -1,16 +1,20 @@
-from datetime import timedelta
+from datetime import date, timedelta
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import PasswordResetTokenGenerator, default_token_generator
 from django.core.mail import send_mail
 from django.core.serializers import serialize
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
 from django.core.signing import TimestampSigner, BadSignature
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.crypto import get_random_string
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_bytes, force_str
@@ -20,13 +24,30 @@ from django.views.generic.base import View
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect, csrf_exempt
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled, ValidationError as RequestValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.views import APIView
-from server.models import Adventure, Scene, Encounter, Custom_Field, Odyssey_Token
-from server.serializers import AdventureSerializer, UserSerializer, SceneSerializer, EncounterSerializer, CustomFieldSerializer
+from server.models import Adventure, Scene, Encounter, Custom_Field, Odyssey_Token, Generation_Job
+from server.serializers import adventure_prefetch, encounter_prefetch, query_list, scene_prefetch, AdventureSerializer, AdventureSummarySerializer, AdventureTreeSerializer, UserSerializer, SceneSerializer, EncounterSerializer, CustomFieldSerializer, GenerationJobSerializer
 from .utils import update_secret_key, login_required_ajax, LoginRequiredMixinAjax
-from .palm import generate_adventure
+from .palm import create_adventure_variants, dump_adventure, regenerate_encounter, regenerate_plot_point, regenerate_scene, stream_adventure
+from .jobs import submit_job
+from .adventure_json import render_adventure
+from .adventure_ndjson import export_ndjson, import_ndjson
+from .adventure_cache import cache_document, document_stats, get_document
+from .generation_cache import cache_adventure, cache_stats, find_adventure, generate_cached_adventure, generate_cached_adventure_model
+from .adventure_tree import adventure_context, create_adventure_tree, replace_encounter, replace_scene, save_generated_adventure
+from .metrics import summarize_calls
+from .progress import climax_points, lock_adventure, progress_points, recalculate_progress, save_progress, set_progress, transition_climax, transition_encounter, transition_scene
+from .versions import PreconditionFailed, adventure_id_of, adventure_version_headers, check_if_match, version_headers
+from .search import matching_parts, search_adventures
+from .admission import admit, admitted, check_rate, release_slot
+from .circuit_breaker import ServiceUnavailable, breaker_health, check_available
+from .palm import ProviderUnavailable
 import json
 
 # Create your views here.
@@ -147,15 +168,93 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Something went wrong when logging out'}, status=500)
 
 
+def get_adventure_tree(request, adventure_id):
+    """ Returns the requesting user's adventure with its scenes and encounters, or None if it is not theirs """
+    return Adventure.objects.filter(pk=adventure_id, user_id=request.user).prefetch_related('scene_set__encounter_set').first()
+
+
+def requested_prefetch(request, prefetch, collapsed=False):
+    """ Returns the lookups in prefetch for the relations the response will include, given its ?fields= and ?expand=. Collapsed relations are only included when expanded """
+    fields = query_list(request, 'fields')
+    expand = query_list(request, 'expand')
+
+    def requested(relation):
+        if relation in expand:
+            return True
+        return not collapsed and (not fields or relation in fields)
+
+    return [lookup for lookup in prefetch if requested(lookup.split('__')[0])]
+
+
+class AdventurePagination(CursorPagination):
+    # The primary key follows creation order and, unlike created_at, is unique, so each page is a range scan from the cursor
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def date_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise RequestValidationError({name: 'Dates must be formatted as YYYY-MM-DD'})
+
+
 class AdventureViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
     serializer_class = AdventureSerializer
+    pagination_class = AdventurePagination
+    # Filters applied to the list from the query parameters of the same name
+    filters = {
+        'status': 'status',
+        'game': 'game',
+        'campaign_setting': 'campaign_setting',
+    }
+    date_filters = {
+        'created_after': 'created_at__gte',
+        'created_before': 'created_at__lte',
+        'modified_after': 'last_modified__gte',
+        'modified_before': 'last_modified__lte',
+    }
+
+    def summary(self):
+        return self.action in ('list', 'search') and self.request.query_params.get('view') == 'summary'
+
+    def get_serializer_class(self):
+        if self.summary():
+            return AdventureSummarySerializer
+        return AdventureSerializer
+
+    def scoped_queryset(self):
+        # Users see their own adventures. Staff can see anyone's, or a single user's with ?user_id=
+        user_id = self.request.query_params.get('user_id')
+        if self.request.user.is_staff:
+            return Adventure.objects.filter(user_id=user_id) if user_id else Adventure.objects.all()
+        if user_id and user_id != str(self.request.user.pk):
+            return Adventure.objects.none()
+        return Adventure.objects.filter(user_id=self.request.user)
+
+    def filtered_queryset(self):
+        queryset = self.scoped_queryset()
+        if self.action in ('list', 'search', 'export'):
+            for param, lookup in self.filters.items():
+                value = self.request.query_params.get(param)
+                if value:
+                    queryset = queryset.filter(**{lookup: value})
+            for param, lookup in self.date_filters.items():
+                value = date_param(self.request, param)
+                if value:
+                    queryset = queryset.filter(**{lookup: value})
+        return queryset
 
     def get_queryset(self):
-        queryset = Adventure.objects.all()
-        user_id = self.request.query_params.get('user_id')
-        if user_id:
-            queryset = queryset.filter(user_id=user_id)
-        return queryset.prefetch_related('scene_set__encounter_set')
+        queryset = self.filtered_queryset()
+        if self.summary():
+            queryset = queryset.annotate(scene_count=Count('scene_set', distinct=True), encounter_count=Count('scene_set__encounter_set'))
+        return queryset.prefetch_related(*requested_prefetch(self.request, adventure_prefetch, collapsed=self.summary()))
 
     def partial_update(self, request, *args, **kwargs):
         try:
@@ -164,16 +263,195 @@ class AdventureViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
                 instance, data=request.data, partial=True)
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
-            return Response(serializer.data)
+            return Response(serializer.data, headers=self.version_headers(instance.pk))
+        except PreconditionFailed:
+            raise
         except Exception as e:
             print("Unable to update adventure because %s" % e)
             return Response({'error': 'Something went wrong when updating adventure'}, status=500)
 
+    def version_headers(self, pk):
+        return adventure_version_headers(pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        # The version is checked first, so an unchanged adventure is answered with a 304 without loading its tree
+        current = self.scoped_queryset().filter(pk=kwargs['pk']).values_list('version', 'updated_at').first()
+        if current is None:
+            raise Http404
+        version, updated_at = current
+        headers = version_headers(version, updated_at)
+        response = get_conditional_response(request, etag=headers['ETag'], last_modified=int(updated_at.timestamp()))
+        if response is None:
+            response = self.document_response(request, kwargs['pk'], version) if self.cacheable(request) else super().retrieve(request, *args, **kwargs)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def cacheable(self, request):
+        # Only the full JSON document is cached, not sparse fieldsets or the browsable API
+        return request.accepted_media_type == JSONRenderer.media_type and not query_list(request, 'fields') and not query_list(request, 'expand')
+
+    def document_response(self, request, pk, version):
+        """ Responds with the adventure's serialized JSON from the adventure cache, serializing and caching it on a miss """
+        content = get_document(pk, version)
+        if content is None:
+            content = render_adventure(pk)
+            if content is None:
+                raise Http404
+            cache_document(pk, version, content)
+        return HttpResponse(content, content_type=JSONRenderer.media_type)
+
+    def perform_create(self, serializer):
+        # A new adventure has no scenes yet, but its climax counts toward its progress from the start
+        adventure = Adventure(**serializer.validated_data)
+        set_progress(adventure, [])
+        serializer.save(progress=adventure.progress, progress_points=adventure.progress_points, progress_items=adventure.progress_items)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            locked = lock_adventure(serializer.instance.pk)
+            check_if_match(self.request, locked)
+            # Fields maintained by server.progress and server.versions are saved as they are in the locked row, so concurrent changes are not overwritten
+            for field in ['progress', 'progress_points', 'progress_items', 'version', 'updated_at']:
+                setattr(serializer.instance, field, getattr(locked, field))
+            before, items = climax_points(locked)
+            adventure = serializer.save()
+            after, items_after = climax_points(adventure)
+            if (before, items) != (after, items_after):
+                save_progress(adventure, after - before, items_after - items)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            check_if_match(self.request, lock_adventure(instance.pk))
+            instance.delete()
+
+    @action(detail=True, methods=['post'])
+    def transition(self, request, *args, **kwargs):
+        """ Moves the climax to a new climax_progress, returning only what changed """
+        adventure = self.get_object()
+        try:
+            climax_progress = float(request.data['climax_progress'])
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'climax_progress must be a number'}, status=400)
+        if not 0 <= climax_progress <= 100:
+            return Response({'error': 'climax_progress must be between 0 and 100'}, status=400)
+        with transaction.atomic():
+            check_if_match(request, lock_adventure(adventure.pk))
+            changes = transition_climax(adventure, climax_progress)
+        return Response(changes, status=200, headers=self.version_headers(adventure.pk))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """ Finds the adventures whose text matches ?q=, best matches first, a page at a time with ?page=.
+        Takes the same filters as the list, and each adventure says what matched """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=400)
+        paginator = AdventurePagination()
+        page_size = paginator.get_page_size(request)
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            return Response({'error': 'page must be a number'}, status=400)
+        if page < 1:
+            return Response({'error': 'page must be at least 1'}, status=400)
+
+        # One more than a page is fetched, to tell whether there is a next page
+        ranked = search_adventures(query, self.filtered_queryset(), page_size + 1, (page - 1) * page_size)
+        scores = dict(ranked[:page_size])
+        adventures = self.get_queryset().in_bulk(list(scores))
+        # Adventures deleted since they were ranked are left out
+        ranked_ids = [pk for pk in scores if pk in adventures]
+        parts = matching_parts(query, ranked_ids)
+
+        results = self.get_serializer([adventures[pk] for pk in ranked_ids], many=True).data
+        for result, pk in zip(results, ranked_ids):
+            result['search_score'] = scores[pk]
+            result['matches'] = parts[pk]
+
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(ranked) > page_size else None,
+            'previous': (replace_query_param(url, 'page', page - 1) if page > 2 else remove_query_param(url, 'page')) if page > 1 else None,
+            'results': results,
+        }, status=200)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """ Streams the adventures, with the same filters as the list, as NDJSON with one whole adventure per line """
+        response = StreamingHttpResponse(export_ndjson(self.filtered_queryset()), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="adventures.ndjson"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_adventures(self, request):
+        """ Saves the adventures in an NDJSON request body, in the form export writes them, as the user's.
+        The body is read a line at a time rather than parsed whole """
+        stream = request.stream
+        result = import_ndjson(request.user, stream if stream is not None else [])
+        return Response(result, status=200)
+
+    @action(detail=False, methods=['post'])
+    def tree(self, request):
+        """ Creates an adventure with all of its scenes, encounters and custom fields in one request """
+        serializer = AdventureTreeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            ids = create_adventure_tree(request.user, serializer.validated_data)
+        except ValidationError as e:
+            return Response({'error': e.message_dict}, status=400)
+        return Response(ids, status=201)
+
+    @action(detail=True, methods=['post'])
+    def regenerate(self, request, *args, **kwargs):
+        fields = {'climax': 'Climax', 'denoument': 'Denoument'}
+        part = request.data.get('part')
+        if part not in fields:
+            return Response({'error': 'part must be climax or denoument'}, status=400)
+
+        adventure = get_adventure_tree(request, kwargs['pk'])
+        if adventure is None:
+            return Response({'error': 'Adventure not found'}, status=404)
+
+        check_available()
+        with admitted(request.user):
+            try:
+                text = regenerate_plot_point(adventure.game, adventure.campaign_setting, adventure_context(adventure), fields[part], request.data.get('context'))
+                setattr(adventure, part, text)
+                adventure.clean_fields(exclude=['user_id'])
+                adventure.save(update_fields=[part, 'last_modified'])
+                if part == 'climax':
+                    recalculate_progress(adventure.pk)
+            except ValidationError as e:
+                return Response({'error': e.message_dict}, status=400)
+            except ProviderUnavailable as e:
+                raise ServiceUnavailable(wait=e.retry_after)
+            except Exception as e:
+                print("Unable to regenerate adventure because %s" % e)
+                return Response({'error': 'Something went wrong when regenerating adventure'}, status=500)
+
+        return Response({'id': adventure.id, part: text}, status=200)
+
+
+class AdventureVersionMixin:
+    """ Sets the new ETag of the adventure a write changed on its response, so the client can send it with its next If-Match write """
+    changed_adventure = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.changed_adventure is not None and response.status_code < 300:
+            for header, value in adventure_version_headers(self.changed_adventure).items():
+                response[header] = value
+        return response
 
-class SceneViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
-    queryset = Scene.objects.all().prefetch_related('encounter_set')
+
+class SceneViewSet(LoginRequiredMixinAjax, AdventureVersionMixin, viewsets.ModelViewSet):
+    queryset = Scene.objects.all()
     serializer_class = SceneSerializer
 
+    def get_queryset(self):
+        return self.queryset.filter(adventure_id__user_id=self.request.user).prefetch_related(*requested_prefetch(self.request, scene_prefetch))
+
     def partial_update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
@@ -182,15 +460,87 @@ class SceneViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
             return Response(serializer.data)
+        except (Http404, PreconditionFailed):
+            raise
         except Exception as e:
             print("Unable to update scene because %s" % e)
             return Response({'error': 'Something went wrong when updating scene'}, status=500)
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            adventure = lock_adventure(serializer.validated_data['adventure_id'].pk)
+            check_if_match(self.request, adventure)
+            scene = serializer.save()
+            save_progress(adventure, progress_points[scene.progress], 1)
+        self.changed_adventure = adventure.pk
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            adventure = lock_adventure(serializer.instance.adventure_id_id)
+            check_if_match(self.request, adventure)
+            previous = Scene.objects.values_list('progress', flat=True).get(pk=serializer.instance.pk)
+            scene = serializer.save()
+            if scene.adventure_id_id != adventure.pk:
+                recalculate_progress(adventure.pk)
+                recalculate_progress(scene.adventure_id_id)
+            elif scene.progress != previous:
+                save_progress(adventure, progress_points[scene.progress] - progress_points[previous])
+        self.changed_adventure = scene.adventure_id_id
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            adventure = lock_adventure(instance.adventure_id_id)
+            check_if_match(self.request, adventure)
+            instance.delete()
+            recalculate_progress(adventure.pk)
+        self.changed_adventure = adventure.pk
+
+    @action(detail=True, methods=['post'])
+    def transition(self, request, *args, **kwargs):
+        """ Moves the scene, and all of its encounters when encounters is true, to a new progress, returning only what changed """
+        scene = self.get_object()
+        progress = request.data.get('progress')
+        if progress not in progress_points:
+            return Response({'error': 'progress must be one of %s' % ', '.join(progress_points)}, status=400)
+        with transaction.atomic():
+            check_if_match(request, lock_adventure(scene.adventure_id_id))
+            changes = transition_scene(scene, progress, bool(request.data.get('encounters')))
+        self.changed_adventure = scene.adventure_id_id
+        return Response(changes, status=200)
+
+    @action(detail=True, methods=['post'])
+    def regenerate(self, request, *args, **kwargs):
+        scene = self.get_object()
+        adventure = get_adventure_tree(request, scene.adventure_id_id)
+        if adventure is None:
+            return Response({'error': 'Scene not found'}, status=404)
+
+        check_available()
+        with admitted(request.user):
+            try:
+                encounters = max(1, scene.encounter_set.count())
+                generated = regenerate_scene(adventure.game, adventure.campaign_setting, adventure_context(adventure, scene.sequence), scene.sequence, encounters, request.data.get('context'))
+                replace_scene(scene, generated)
+                self.changed_adventure = adventure.pk
+            except ValidationError as e:
+                return Response({'error': e.message_dict}, status=400)
+            except ProviderUnavailable as e:
+                raise ServiceUnavailable(wait=e.retry_after)
+            except Exception as e:
+                print("Unable to regenerate scene because %s" % e)
+                return Response({'error': 'Something went wrong when regenerating scene'}, status=500)
+
+        serializer = self.get_serializer(Scene.objects.prefetch_related(*scene_prefetch).get(pk=scene.pk))
+        return Response(serializer.data, status=200)
+
 
-class EncounterViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
+class EncounterViewSet(LoginRequiredMixinAjax, AdventureVersionMixin, viewsets.ModelViewSet):
     queryset = Encounter.objects.all()
     serializer_class = EncounterSerializer
 
+    def get_queryset(self):
+        return self.queryset.filter(scene_id__adventure_id__user_id=self.request.user).prefetch_related(*requested_prefetch(self.request, encounter_prefetch))
+
     def partial_update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
@@ -199,12 +549,82 @@ class EncounterViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
             return Response(serializer.data)
+        except (Http404, PreconditionFailed):
+            raise
         except Exception as e:
             print("Unable to update encounter because %s" % e)
             return Response({'error': 'Something went wrong when updating encounter'}, status=500)
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            adventure = lock_adventure(serializer.validated_data['scene_id'].adventure_id_id)
+            check_if_match(self.request, adventure)
+            encounter = serializer.save()
+            save_progress(adventure, progress_points[encounter.progress], 1)
+        self.changed_adventure = adventure.pk
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            adventure = lock_adventure(serializer.instance.scene_id.adventure_id_id)
+            check_if_match(self.request, adventure)
+            previous = Encounter.objects.values_list('progress', flat=True).get(pk=serializer.instance.pk)
+            encounter = serializer.save()
+            if encounter.scene_id.adventure_id_id != adventure.pk:
+                recalculate_progress(adventure.pk)
+                recalculate_progress(encounter.scene_id.adventure_id_id)
+            elif encounter.progress != previous:
+                save_progress(adventure, progress_points[encounter.progress] - progress_points[previous])
+        self.changed_adventure = encounter.scene_id.adventure_id_id
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            adventure = lock_adventure(instance.scene_id.adventure_id_id)
+            check_if_match(self.request, adventure)
+            instance.delete()
+            recalculate_progress(adventure.pk)
+        self.changed_adventure = adventure.pk
+
+    @action(detail=True, methods=['post'])
+    def transition(self, request, *args, **kwargs):
+        """ Moves the encounter to a new progress, returning only what changed """
+        encounter = self.get_object()
+        progress = request.data.get('progress')
+        if progress not in progress_points:
+            return Response({'error': 'progress must be one of %s' % ', '.join(progress_points)}, status=400)
+        with transaction.atomic():
+            check_if_match(request, lock_adventure(encounter.scene_id.adventure_id_id))
+            changes = transition_encounter(encounter, progress)
+        self.changed_adventure = encounter.scene_id.adventure_id_id
+        return Response(changes, status=200)
+
+    @action(detail=True, methods=['post'])
+    def regenerate(self, request, *args, **kwargs):
+        encounter = self.get_object()
+        scene = encounter.scene_id
+        adventure = get_adventure_tree(request, scene.adventure_id_id)
+        if adventure is None:
+            return Response({'error': 'Encounter not found'}, status=404)
+
+        check_available()
+        with admitted(request.user):
+            try:
+                index = [other.pk for other in scene.encounter_set.order_by('pk')].index(encounter.pk)
+                generated = regenerate_encounter(adventure.game, adventure.campaign_setting, adventure_context(adventure, scene.sequence), scene.sequence, index, request.data.get('context'))
+                replace_encounter(encounter, generated)
+                self.changed_adventure = adventure.pk
+            except ValidationError as e:
+                return Response({'error': e.message_dict}, status=400)
+            except ProviderUnavailable as e:
+                raise ServiceUnavailable(wait=e.retry_after)
+            except Exception as e:
+                print("Unable to regenerate encounter because %s" % e)
+                return Response({'error': 'Something went wrong when regenerating encounter'}, status=500)
 
-class CustomFieldViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
+        serializer = self.get_serializer(encounter)
+        return Response(serializer.data, status=200)
+
+
+class CustomFieldViewSet(LoginRequiredMixinAjax, AdventureVersionMixin, viewsets.ModelViewSet):
 
     queryset = Custom_Field.objects.all()
     serializer_class = CustomFieldSerializer
@@ -217,32 +637,297 @@ class CustomFieldViewSet(LoginRequiredMixinAjax, viewsets.ModelViewSet):
             serializer.is_valid(raise_exception=True)
             self.perform_update(serializer)
             return Response(serializer.data)
+        except PreconditionFailed:
+            raise
         except Exception as e:
             print("Unable to update custom field because %s" % e)
             return Response({'error': 'Something went wrong when updating custom field'}, status=500)
 
+    def check_adventure(self, custom_field):
+        adventure_id = adventure_id_of(custom_field)
+        if adventure_id is not None:
+            check_if_match(self.request, lock_adventure(adventure_id))
+        self.changed_adventure = adventure_id
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            self.check_adventure(Custom_Field(**{key: value for key, value in serializer.validated_data.items() if key.endswith('_id')}))
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            self.check_adventure(serializer.instance)
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            self.check_adventure(instance)
+            instance.delete()
+
+
+def get_generation_params(data):
+    params = {
+        "game": data["game"],
+        "players": data["players"],
+        "scenes": data["scenes"],
+        "encounters": data["encounters"],
+        "plot_twists": data["plot_twists"],
+        "clues": data["clues"],
+        "homebrew_description": data.get("homebrew_description"),
+        "campaign_setting": data.get("campaign_setting"),
+        "level": data.get("level"),
+        "experience": data.get("experience"),
+        "context": data.get("context"),
+    }
+    # Only set when requested so parameters without it keep their existing cache keys
+    if data.get("outline"):
+        params["outline"] = True
+    return params
+
 
 class GenerateAdventureView(APIView):
     @login_required_ajax
     def post(self, request):
         try:
-            data = request.data
-            campaign_setting = data.get("campaign_setting")
-            level = data.get("level")
-            experience = data.get("experience")
-            context = data.get("context")
-
-            adventure = generate_adventure(data["game"], data["players"], data["scenes"], data["encounters"], data["plot_twists"], data["clues"], campaign_setting, level, experience, context).strip('"```json\\n').rstrip('\\n```"')
+            params = get_generation_params(request.data)
 
-            adventure_dict = json.loads(adventure)
-            serialized_adventure = json.dumps(adventure_dict)
+            # The request is admitted only if it has to generate the adventure
+            adventure = generate_cached_adventure(params, fresh=bool(request.data.get("fresh")), user=request.user)
+            serialized_adventure = json.dumps(adventure)
 
             return HttpResponse(serialized_adventure, content_type="application/json")
+        except Throttled:
+            raise
+        except ProviderUnavailable as e:
+            raise ServiceUnavailable(wait=e.retry_after)
         except Exception as e:
             print("Unable to generate adventure because %s" % e)
             return Response({'error': 'Something went wrong when generating adventure'}, status=500)
 
 
+class GenerateAndSaveAdventureView(APIView):
+    @login_required_ajax
+    def post(self, request):
+        try:
+            params = get_generation_params(request.data)
+            title = request.data["title"]
+        except KeyError as e:
+            return Response({'error': 'Missing generation parameter %s' % e}, status=400)
+
+        try:
+            generated = generate_cached_adventure_model(params, fresh=bool(request.data.get("fresh")), user=request.user)
+            adventure = save_generated_adventure(request.user, title, params["game"], params["campaign_setting"], generated)
+        except ValidationError as e:
+            return Response({'error': e.message_dict}, status=400)
+        except Throttled:
+            raise
+        except ProviderUnavailable as e:
+            raise ServiceUnavailable(wait=e.retry_after)
+        except Exception as e:
+            print("Unable to generate and save adventure because %s" % e)
+            return Response({'error': 'Something went wrong when generating adventure'}, status=500)
+
+        adventure = Adventure.objects.prefetch_related(*adventure_prefetch).get(pk=adventure.pk)
+        serializer = AdventureSerializer(adventure)
+        return Response(serializer.data, status=201)
+
+
+def format_event(event, data):
+    return "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+
+
+def cached_adventure_events(adventure):
+    for key in ["Exposition", "Incitement"]:
+        yield format_event(key.lower(), adventure[key])
+    for sequence, scene in enumerate(adventure["Rising Action"], start=1):
+        yield format_event("scene", {"sequence": sequence, **scene})
+    for key in ["Climax", "Denoument"]:
+        yield format_event(key.lower(), adventure[key])
+    yield format_event("complete", adventure)
+
+
+def adventure_events(key, params):
+    # Event names match the keys the client reads from the generate-adventure response
+    event_names = {
+        "Exposition": "exposition",
+        "Incitement": "incitement",
+        "Rising_Action": "scene",
+        "Climax": "climax",
+        "Denoument": "denoument",
+    }
+    sequence = 0
+    try:
+        for key_name, part in stream_adventure(**params):
+            if key_name == "Adventure":
+                adventure = dump_adventure(part)
+                cache_adventure(key, params, adventure)
+                yield format_event("complete", adventure)
+            elif key_name == "Rising_Action":
+                sequence += 1
+                yield format_event("scene", {"sequence": sequence, **part.model_dump()})
+            else:
+                yield format_event(event_names[key_name], part)
+    except ProviderUnavailable as e:
+        yield format_event("error", {'error': ServiceUnavailable.default_detail, 'retry_after': e.retry_after})
+    except Exception as e:
+        print("Unable to stream adventure because %s" % e)
+        yield format_event("error", {'error': 'Something went wrong when generating adventure'})
+
+
+def release_after(events, slot):
+    # The slot is held until the stream finishes or the client disconnects
+    try:
+        yield from events
+    finally:
+        release_slot(slot)
+
+
+def variant_results(params, variants):
+    for index, adventure, error in create_adventure_variants(variants, **params):
+        if error is None:
+            yield "variant", {"variant": index, "adventure": dump_adventure(adventure)}
+        else:
+            print("Unable to generate adventure variant because %s" % error)
+            yield "variant_error", {"variant": index, "error": 'Something went wrong when generating adventure'}
+
+
+def variant_events(params, variants):
+    succeeded = 0
+    try:
+        for event, data in variant_results(params, variants):
+            if event == "variant":
+                succeeded += 1
+            yield format_event(event, data)
+        yield format_event("complete", {"succeeded": succeeded, "failed": variants - succeeded})
+    except Exception as e:
+        print("Unable to stream adventure variants because %s" % e)
+        yield format_event("error", {'error': 'Something went wrong when generating adventure'})
+
+
+class GenerateAdventureVariantsView(APIView):
+    @login_required_ajax
+    def post(self, request):
+        try:
+            params = get_generation_params(request.data)
+            variants = int(request.data.get("variants", 2))
+        except KeyError as e:
+            return Response({'error': 'Missing generation parameter %s' % e}, status=400)
+        except (TypeError, ValueError):
+            return Response({'error': 'variants must be a number'}, status=400)
+        if not 1 <= variants <= settings.GENERATION_MAX_VARIANTS:
+            return Response({'error': 'variants must be between 1 and %s' % settings.GENERATION_MAX_VARIANTS}, status=400)
+
+        # Variants are never cached, so every one of them would need the provider
+        check_available()
+        slot = admit(request.user)
+        if request.data.get("stream"):
+            events = variant_events(params, variants)
+            response = StreamingHttpResponse(release_after(events, slot), content_type="text/event-stream")
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        # Variants that fail are reported alongside the ones that succeeded
+        try:
+            results = {"variants": [], "errors": []}
+            for event, data in variant_results(params, variants):
+                results["variants" if event == "variant" else "errors"].append(data)
+        except Exception as e:
+            print("Unable to generate adventure variants because %s" % e)
+            return Response({'error': 'Something went wrong when generating adventure'}, status=500)
+        finally:
+            release_slot(slot)
+
+        results["variants"].sort(key=lambda result: result["variant"])
+        return Response(results, status=200 if results["variants"] else 500)
+
+
+class StreamAdventureView(APIView):
+    @login_required_ajax
+    def post(self, request):
+        try:
+            params = get_generation_params(request.data)
+        except KeyError as e:
+            return Response({'error': 'Missing generation parameter %s' % e}, status=400)
+
+        # Only a request that has to generate the adventure is admitted
+        key, adventure = find_adventure(params, bool(request.data.get("fresh")))
+        if adventure is not None:
+            events = cached_adventure_events(adventure)
+        else:
+            check_available()
+            events = release_after(adventure_events(key, params), admit(request.user))
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class GenerationJobViewSet(LoginRequiredMixinAjax, viewsets.GenericViewSet):
+    serializer_class = GenerationJobSerializer
+
+    def get_queryset(self):
+        return Generation_Job.objects.filter(user_id=self.request.user)
+
+    def create(self, request):
+        try:
+            params = get_generation_params(request.data)
+        except KeyError as e:
+            return Response({'error': 'Missing generation parameter %s' % e}, status=400)
+
+        check_rate(request.user)
+        job = submit_job(request.user, params, fresh=bool(request.data.get("fresh")))
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=202)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, *args, **kwargs):
+        job = self.get_object()
+        if job.status == 'complete':
+            return Response(job.result, status=200)
+        if job.status == 'failed':
+            return Response({'error': job.error}, status=500)
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=202)
+
+
+class GenerationCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats(), status=200)
+
+
+class AdventureCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(document_stats(), status=200)
+
+
+class GenerationMetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            hours = float(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be a number'}, status=400)
+        return Response(summarize_calls(hours), status=200)
+
+
+class GenerationHealthView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response(breaker_health(), status=200)
+
+
 class CustomPasswordResetView(APIView):
     authentication_classes = []  # Allow unauthenticated access
     permission_classes = [AllowAny]  # Allow unauthenticated access